@@ -11,8 +11,4 @@
 #       Shows progress & summary of a named budget
 #   - budget project [name] [unit] [aggregation:...]
 
-import logging
-# logging.basicConfig(format="[%(levelname)s] %(message)s")
-import coloredlogs
-# TODO: maybe load format from a config file?
-coloredlogs.install(fmt="%(message)s", logger=logging.getLogger())
+# Logging is set up in `abcli.main.init_logging`
@@ -0,0 +1,80 @@
+"""
+Thin client of `abcli serve`: forwards its command line to the server over a Unix socket, and streams back the
+output and exit status of the command. Only the standard library is imported, so that it starts quickly;
+when no server is listening, the command is run in this process instead.
+
+    abcli-client transaction summary -m 04/2018
+"""
+import json
+import os
+import socket
+import struct
+import sys
+from typing import *
+
+SOCKET_ENV = 'ABCLI_SOCKET'
+DEFAULT_SOCKET = '$XDG_RUNTIME_DIR/abcli.sock'
+
+# A request is a JSON line {"argv": [...], "cwd": "..."}; the response is a sequence of frames of
+# kind (1 byte), payload length (4 bytes, big-endian) and payload, ending with the exit status frame
+FRAME_HEADER = struct.Struct('>cI')
+FRAME_STDOUT = b'o'
+FRAME_STDERR = b'e'
+FRAME_EXIT = b'x'
+
+
+def socket_path() -> str:
+    """
+    :return: the path of the server's socket: `$ABCLI_SOCKET`, or abcli.sock in the user's runtime directory,
+        or else in the user cache directory (as `abcli.utils.cache.user_cache_dir`, not imported to start quickly)
+    """
+    if os.environ.get(SOCKET_ENV):
+        return os.environ[SOCKET_ENV]
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or \
+        os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'abcli')
+    return os.path.join(runtime_dir, 'abcli.sock')
+
+
+def send_frame(sock: socket.socket, kind: bytes, payload: bytes):
+    sock.sendall(FRAME_HEADER.pack(kind, len(payload)) + payload)
+
+
+def request(argv: List[str], stdout: BinaryIO, stderr: BinaryIO, path: str = None) -> int:
+    """
+    Runs the command line on the server listening on `path` (default to `socket_path()`),
+    writing its output to the binary streams as it arrives.
+    :return: the exit status of the command
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path or socket_path())
+        sock.sendall(json.dumps({'argv': argv, 'cwd': os.getcwd()}).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as reader:
+            while True:
+                header = reader.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    raise ConnectionError("abcli server closed the connection before the command finished")
+                kind, length = FRAME_HEADER.unpack(header)
+                payload = reader.read(length)
+                if kind == FRAME_EXIT:
+                    return int(payload)
+                stream = stdout if kind == FRAME_STDOUT else stderr
+                stream.write(payload)
+                stream.flush()
+
+
+def main():
+    argv = sys.argv[1:]
+    try:
+        status = request(argv, sys.stdout.buffer, sys.stderr.buffer)
+    except (FileNotFoundError, ConnectionRefusedError):
+        status = None
+    if status is not None:
+        sys.exit(status)
+
+    # No server listening; run the command here
+    from abcli.main import cli
+    cli(argv, prog_name='abcli')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,16 @@
 import logging
+from decimal import Decimal
+from typing import *
 
 import click
 from pony import orm
-from abcli.utils import error_exit_on_exception
+from abcli.utils import (
+    Date, format_date, format_monetary, month_start,
+    error_exit_on_exception, DateType
+)
+from abcli.utils.bulk import iter_rows, sql_placeholder
+from abcli.utils.output import get_output_format, write_records
+from abcli.utils.profiling import phase
 
 logger = logging.getLogger()
 
@@ -51,3 +59,115 @@ def cmd_show(db, name: str):
         return 0
     except orm.ObjectNotFound:
         raise click.BadArgumentUsage(f"Account '{name}' does not exist.")
+
+
+def register_options(fnc):
+    """Arguments and options of `account register`, also taken by `analyze register`."""
+    fnc = click.option('--date-to', '--to', '-t', type=DateType(),
+                       help="Show posts resolved to specified date (inclusive); default to the last post.")(fnc)
+    fnc = click.option('--date-from', '--from', '-f', type=DateType(),
+                       help="Show posts resolved from specified date (inclusive); default to the first post.")(fnc)
+    return click.argument('name')(fnc)
+
+
+def check_account(name: str, exists: Callable[[str], bool]):
+    """Fails if the account doesn't exist, whether `exists` looks it up in the database or in memory."""
+    if not exists(name):
+        raise click.BadArgumentUsage(f"Account '{name}' does not exist.")
+
+
+@cli.command('register')
+@register_options
+@click.pass_obj
+@orm.db_session
+@error_exit_on_exception
+def cmd_register(db, name: str, date_from: Date, date_to: Date):
+    """Show the posts of an account in order of resolved date, with the running balance."""
+    check_account(name, lambda name: db.Account.exists(name=name))
+
+    with phase('query'):
+        opening_balance = None if date_from is None else get_opening_balance(db, name, date_from)
+    # Posts are streamed, so the time of fetching them is accounted to rendering
+    with phase('render'):
+        echo_register(iter_register(db, name, date_from, date_to), date_from, opening_balance)
+    return 0
+
+
+def echo_register(posts: Iterable[Tuple[Date, Decimal, str]], date_from: Date = None,
+                  opening_balance: Decimal = None):
+    """Prints the posts of a register line by line, with the running balance."""
+    balance = opening_balance or Decimal(0)
+    if get_output_format() != 'table':
+        def _records():
+            nonlocal balance
+            if date_from is not None:
+                yield date_from, None, balance, "Opening balance"
+            for date_resolved, amount, description in posts:
+                balance += amount
+                yield date_resolved, amount, balance, description
+        write_records(('date', 'amount', 'balance', 'description'), _records())
+        return
+
+    click.echo(f"{'date':<10}  {'amount':>12}  {'balance':>12}  description")
+    if date_from is not None:
+        click.echo(f"{format_date(date_from):<10}  {'':>12}  {format_monetary(balance):>12}  Opening balance")
+    for date_resolved, amount, description in posts:
+        balance += amount
+        click.echo(f"{format_date(date_resolved):<10}  {format_monetary(amount):>12}  "
+                   f"{format_monetary(balance):>12}  {description}")
+
+
+def get_opening_balance(db, name: str, date: Date) -> Decimal:
+    """Sum of the account's posts resolved before the date, from monthly sums for the months before it."""
+    month = month_start(date)
+    whole_months = orm.sum(m.amount for m in db.MonthlySum if m.account == name and m.month_resolved < month)
+    rest = orm.sum(p.amount for p in db.Post
+                   if p.account.name == name and p.date_resolved >= month and p.date_resolved < date)
+    return Decimal(whole_months or 0) + Decimal(rest or 0)
+
+
+def iter_register(db, name: str, date_from: Date = None, date_to: Date = None) \
+        -> Iterator[Tuple[Date, Decimal, str]]:
+    """
+    Streams (date resolved, amount, transaction description) of the account's posts in order of resolved
+    date (and date occurred), without loading them as entities.
+    """
+    Post = db.Post
+    sql, args = register_query(db, name, date_from, date_to)
+    date_converter, amount_converter = Post.date_resolved.converters[0], Post.amount.converters[0]
+    # Rows come in date order, so convert each distinct date once
+    last_raw_date, last_date = None, None
+    for date_resolved, amount, description in iter_rows(db, sql, args):
+        if date_resolved != last_raw_date:
+            last_raw_date, last_date = date_resolved, date_converter.sql2py(date_resolved)
+        yield last_date, amount_converter.sql2py(amount), description or ''
+
+
+def register_query(db, name: str, date_from: Date = None, date_to: Date = None) -> Tuple[str, tuple]:
+    """
+    SQL (and its arguments) selecting the rows of `iter_register`; it reads the posts of the account in order
+    from the (account, date resolved, date occurred) index, so that rows come out without sorting the account.
+    """
+    provider = db.provider
+    placeholder = sql_placeholder(db)
+    Post, Transaction = db.Post, db.Transaction
+
+    def column(attr):
+        return f"p.{provider.quote_name(attr.columns[0])}"
+
+    conditions = [f"{column(Post.account)} = {placeholder}"]
+    args = [name]
+    if date_from is not None:
+        conditions.append(f"{column(Post.date_resolved)} >= {placeholder}")
+        args.append(Post.date_resolved.converters[0].py2sql(date_from))
+    if date_to is not None:
+        conditions.append(f"{column(Post.date_resolved)} <= {placeholder}")
+        args.append(Post.date_resolved.converters[0].py2sql(date_to))
+    sql = (f"SELECT {column(Post.date_resolved)}, {column(Post.amount)}, "
+           f"t.{provider.quote_name(Transaction.description.columns[0])} "
+           f"FROM {provider.quote_name(Post._table_)} p "
+           f"LEFT JOIN {provider.quote_name(Transaction._table_)} t "
+           f"ON t.{provider.quote_name(Transaction.uid.columns[0])} = {column(Post.transaction)} "
+           f"WHERE {' AND '.join(conditions)} "
+           f"ORDER BY {column(Post.date_resolved)}, {column(Post.date_occurred)}, {column(Post.id)}")
+    return sql, tuple(args)
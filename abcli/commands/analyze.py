@@ -0,0 +1,102 @@
+import logging
+import shlex
+from datetime import datetime as DateTime
+from pathlib import Path
+from typing import *
+
+import click
+from pony import orm
+import yaml
+
+from abcli.utils import Date, error_exit_on_exception
+from abcli.utils.cents import from_cents
+from abcli.utils.click import PathType
+from abcli.utils.columnar import PostStore
+from abcli.commands.account import echo_register, register_options, check_account
+from abcli.commands.budget import load_budget_yaml, show_progress
+from abcli.commands.transaction import show_summary_tree, summary_options, get_period
+
+logger = logging.getLogger()
+
+
+@click.group(__name__[__name__.rfind('.')+1:], invoke_without_command=True)
+@click.pass_context
+@error_exit_on_exception
+def cli(ctx):
+    """
+    Analyse posts loaded into memory once.
+
+    Runs the command given against the loaded posts, or without one, starts a prompt to run any number of them.
+    Needs numpy.
+    """
+    with orm.db_session:
+        store = PostStore.load(ctx.obj)
+    ctx.obj = store
+    if ctx.invoked_subcommand is None:
+        _prompt(ctx, store)
+
+
+def _prompt(ctx, store: PostStore):
+    click.echo(f"Loaded {len(store)} posts of {len(store.accounts)} accounts. "
+               f"Commands: {', '.join(cli.list_commands(ctx))}; 'quit' to exit.")
+    while True:
+        try:
+            line = input('abcli> ')
+        except EOFError:
+            break
+        try:
+            args = shlex.split(line)
+        except ValueError as e:
+            click.echo(f"Error: {e}")
+            continue
+        if not args:
+            continue
+        if args[0] in ('quit', 'exit'):
+            break
+
+        command = cli.get_command(ctx, args[0])
+        if command is None:
+            click.echo(f"Error: No such command '{args[0]}'.")
+            continue
+        try:
+            command.main(args[1:], prog_name=args[0], obj=store, standalone_mode=False)
+        except click.ClickException as e:
+            e.show()
+        except click.Abort:
+            pass
+
+
+@cli.command('summary')
+@summary_options
+@click.pass_obj
+@error_exit_on_exception
+def cmd_summary(store: PostStore, month: DateTime, date_from: Date, date_to: Date, depth: int, account: str,
+                include_nonresolved: bool):
+    """Same as `transaction summary`."""
+    date_from, date_to = get_period(month, date_from, date_to)
+    show_summary_tree(store.account_sums(date_from, date_to, include_nonresolved, account, depth))
+
+
+@cli.command('budget')
+@click.argument("budget-yaml", type=PathType(dir_okay=False, exists=True))
+@click.option("--include-nonresolved", '-i', is_flag=True, help="Include non-resolved transactions.")
+@click.pass_obj
+@error_exit_on_exception
+def cmd_budget(store: PostStore, budget_yaml: Path, include_nonresolved: bool):
+    """Same as `budget progress`."""
+    try:
+        budget = load_budget_yaml(budget_yaml.read_text('utf-8'))
+    except yaml.YAMLError:
+        raise KeyError(f"Failed to load budget YAML {budget_yaml}")
+    show_progress(None, budget, include_nonresolved, store=store)
+
+
+@cli.command('register')
+@register_options
+@click.pass_obj
+@error_exit_on_exception
+def cmd_register(store: PostStore, name: str, date_from: Date, date_to: Date):
+    """Same as `account register`."""
+    check_account(name, store.has_account)
+    opening_balance = None if date_from is None else from_cents(store.opening_balance(name, date_from))
+    echo_register(store.register(name, date_from, date_to), date_from, opening_balance)
@@ -1,4 +1,8 @@
 import logging
+from collections import defaultdict
+from datetime import timedelta as TimeDelta
+from decimal import Decimal
+from typing import *
 
 import click
 from pony import orm
@@ -6,7 +10,8 @@ from tabulate import tabulate
 import textwrap
 from abcli.utils import (
     Date, format_date, format_monetary,
-    error_exit_on_exception, DateType
+    error_exit_on_exception, DateType,
+    month_start, month_end
 )
 
 logger = logging.getLogger()
@@ -42,7 +47,125 @@ def cmd_set(db, account: str, balance: float, date: Date):
     except orm.ObjectNotFound:
         raise KeyError(f"Account '{account}' does not exist.")
 
-# TODO: verify balance using transactions when setting it
+
+@cli.command('verify')
+@click.argument('accounts', nargs=-1)
+@click.pass_obj
+def cmd_verify(db, accounts: Tuple[str]):
+    """
+    Verify balances against the posts of their accounts.
+
+    Checks the balance of each of ACCOUNTS (default to all accounts with a balance) against the sum of
+    the account's posts resolved up to the balance date, and exits with status 1 if any differ.
+    """
+    # Exit outside of the DB session, so the checkpoints created are committed either way
+    if not _verify(db, accounts):
+        click.get_current_context().exit(1)
+
+
+@orm.db_session
+@error_exit_on_exception
+def _verify(db, accounts: Tuple[str]) -> bool:
+    for name in accounts:
+        if db.Account.get(name=name) is None:
+            raise KeyError(f"Account '{name}' does not exist.")
+
+    results = verify_balances(db, accounts or None)
+    table = []
+    for name, date_eod, amount, computed in results:
+        drift = amount - computed
+        table.append([str(date_eod), name, format_monetary(amount), format_monetary(computed),
+                      "OK" if drift == 0 else f"drift {format_monetary(drift)}"])
+    click.echo("Balances:")
+    click.echo(textwrap.indent(tabulate(table, tablefmt="plain"), "  "))
+
+    num_drifted = sum(1 for _, _, amount, computed in results if amount != computed)
+    click.echo(f"{len(results) - num_drifted}/{len(results)} balances match posts.")
+    return num_drifted == 0
+
+
+def verify_balances(db, accounts: Iterable[str] = None) -> List[Tuple[str, Date, Decimal, Decimal]]:
+    """
+    Computes the running balances of accounts at their balance dates from their posts.
+    Each is the running balance at the last month end (a checkpoint, created if missing) plus the posts
+    resolved after it.
+    :param accounts: names of the accounts to verify; default to all accounts with a balance
+    :return: (account name, balance date, balance amount, computed balance) per balance, ordered by name
+    """
+    query = orm.select(b for b in db.Balance)
+    if accounts is not None:
+        names = tuple(accounts)
+        query = query.filter(lambda b: b.account.name in names)
+    balances = {b.account.name: (b.date_eod, b.amount) for b in query}
+    if not balances:
+        return []
+
+    checkpoint_dates = {name: _checkpoint_date(date_eod) for name, (date_eod, _) in balances.items()}
+    checkpoints = _ensure_checkpoints(db, checkpoint_dates)
+
+    # Sum the posts after the checkpoints, with one query per distinct period
+    periods = defaultdict(list)
+    for name, (date_eod, _) in balances.items():
+        if checkpoint_dates[name] < date_eod:
+            periods[checkpoint_dates[name], date_eod].append(name)
+    tail_sums = {}
+    for (date_from, date_to), names in periods.items():
+        names = tuple(names)
+        tail_sums.update(orm.select((p.account.name, orm.sum(p.amount)) for p in db.Post
+                                    if p.account.name in names
+                                    and p.date_resolved > date_from and p.date_resolved <= date_to))
+
+    return [(name, date_eod, amount, checkpoints[name] + tail_sums.get(name, 0))
+            for name, (date_eod, amount) in sorted(balances.items())]
+
+
+def _checkpoint_date(date_eod: Date) -> Date:
+    """The last month end on or before the date."""
+    return date_eod if date_eod == month_end(date_eod) else month_start(date_eod) - TimeDelta(days=1)
+
+
+def _ensure_checkpoints(db, checkpoint_dates: Dict[str, Date]) -> Dict[str, Decimal]:
+    """
+    Creates the checkpoints of accounts up to the given month ends where missing, with one for every
+    month end since the last existing checkpoint (or the first month with posts) to spread later checks.
+    :return: the running balances at the given month ends per account
+    """
+    names = tuple(checkpoint_dates)
+    existing = defaultdict(dict)
+    for c in orm.select(c for c in db.BalanceCheckpoint if c.account in names):
+        existing[c.account][c.date] = c.amount
+
+    result = {}
+    missing = {}
+    for name, date in checkpoint_dates.items():
+        if date in existing[name]:
+            result[name] = existing[name][date]
+        else:
+            earlier = [d for d in existing[name] if d < date]
+            missing[name] = max(earlier) if earlier else None
+    if not missing:
+        return result
+
+    names = tuple(missing)
+    monthly_sums = defaultdict(dict)
+    for name, month, amount in orm.select((m.account, m.month_resolved, orm.sum(m.amount))
+                                          for m in db.MonthlySum if m.account in names):
+        monthly_sums[name][month] = amount
+
+    for name, last_date in missing.items():
+        date = checkpoint_dates[name]
+        if last_date is not None:
+            running = existing[name][last_date]
+            month = last_date + TimeDelta(days=1)
+        else:
+            running = Decimal(0)
+            month = min(list(monthly_sums[name]) + [month_start(date)])
+        while month <= date:
+            running += monthly_sums[name].get(month, 0)
+            db.BalanceCheckpoint(account=name, date=month_end(month), amount=running)
+            month = month_end(month) + TimeDelta(days=1)
+        result[name] = running
+    return result
 
 
 @cli.command('show')
@@ -9,12 +9,15 @@ from pony import orm
 from tabulate import tabulate
 
 from abcli.utils import (
-    parse_date, format_monetary,
+    parse_date, format_monetary, rollup_amounts,
     error_exit_on_exception, AccountTree
 )
 from abcli.model import ACCOUNT_TYPES
-from abcli.commands.transaction import get_posts_between_period
+from abcli.commands.transaction import get_account_sums
+from abcli.utils.cents import to_cents, from_cents
 from abcli.utils.click import PathType
+from abcli.utils.output import get_output_format, write_records
+from abcli.utils.profiling import phase
 
 logger = logging.getLogger()
 
@@ -33,37 +36,82 @@ def cli():
 def cmd_progress(db, budget_yaml: Path, include_nonresolved: bool):
     try:
         budget = load_budget_yaml(budget_yaml.read_text('utf-8'))
-        format_tuples = get_format_tuples(db, budget.get('items', {}), budget['date_from'], budget['date_to'],
-                      include_nonresolved)
-        print(tabulate(format_tuples, tablefmt="simple",
-                       headers=('account_name', 'budgeted', '% of parent', 'consumed', 'progress'),
-                       colalign=("left", "right", "right", "right")))
+        show_progress(db, budget, include_nonresolved)
         return 0
     except yaml.YAMLError:
         raise KeyError(f"Failed to load budget YAML {budget_yaml}")
 
 
-def get_format_tuples(db, budget_items: Dict[str, float], date_from: date, date_to: date, include_nonresolved: bool):
-    @orm.db_session
+def show_progress(db, budget: Dict, include_nonresolved: bool, store=None):
+    """:param store: a `PostStore` of posts loaded in memory, to use instead of the database"""
+    args = (db, budget.get('items', {}), budget['date_from'], budget['date_to'], include_nonresolved, store)
+    with phase('render'):
+        if get_output_format() != 'table':
+            write_records(('account', 'budgeted', 'share_of_parent', 'consumed', 'progress'), iter_records(*args))
+            return
+
+        print(tabulate(get_format_tuples(*args), tablefmt="simple",
+                       headers=('account_name', 'budgeted', '% of parent', 'consumed', 'progress'),
+                       colalign=("left", "right", "right", "right")))
+
+
+def get_format_tuples(db, budget_items: Dict[str, float], date_from: date, date_to: date, include_nonresolved: bool,
+                      store=None):
+    """:param store: a `PostStore` of posts loaded in memory, to use instead of the database"""
+    consumed = _get_consumed(db, date_from, date_to, include_nonresolved, store)
+
     def _format_tree(tree):
-        account_name = tree.fullname
-        all_posts_in_period = get_posts_between_period(db, date_from, date_to, include_nonresolved)
-        txn_sum = orm.select(p.amount for p in all_posts_in_period if p.account.name.startswith(account_name)).sum()
+        txn_sum = consumed.get(tree.fullname, 0)
         if tree.amount:
-            return (format_monetary(tree.amount),
+            return (format_monetary(from_cents(tree.amount)),
                     f"{tree.amount / tree._parent.amount * 100.00:.2f}%" if tree._parent else "",
-                    format_monetary(txn_sum),
-                    f"{float(txn_sum) / tree.amount * 100.00:.2f}%")
+                    format_monetary(from_cents(txn_sum)),
+                    f"{txn_sum / tree.amount * 100.00:.2f}%")
         return ("", "", "", "")
 
     tuples = []
+    for tree in _get_budget_trees(budget_items):
+        tuples.extend(tree.iter_format_tuples(callback=_format_tree))
+    return tuples
+
+
+def iter_records(db, budget_items: Dict[str, float], date_from: date, date_to: date, include_nonresolved: bool,
+                 store=None) -> Iterator[Tuple]:
+    """
+    Yields (account, budgeted, share of parent's budget, consumed, progress) of the budgeted accounts,
+    for machine-readable output.
+    """
+    consumed = _get_consumed(db, date_from, date_to, include_nonresolved, store)
+
+    def _record(tree):
+        parent = tree._parent
+        txn_sum = consumed.get(tree.fullname, 0)
+        return (tree.fullname, from_cents(tree.amount),
+                tree.amount / parent.amount if parent and parent.amount else None,
+                from_cents(txn_sum), txn_sum / tree.amount if tree.amount else None)
+
+    for tree in _get_budget_trees(budget_items):
+        for row in tree.iter_format_tuples(callback=_record):
+            if row[2]:
+                yield row[1:]
+
+
+def _get_consumed(db, date_from: date, date_to: date, include_nonresolved: bool, store) -> Dict[str, int]:
+    # Amounts in cents
+    with phase('query'):
+        if store is not None:
+            return rollup_amounts(store.account_sums(date_from, date_to, include_nonresolved))
+        return rollup_amounts(get_account_sums(db, date_from, date_to, include_nonresolved))
+
+
+def _get_budget_trees(budget_items: Dict[str, float]) -> List[AccountTree]:
+    trees = []
     for acctype in ACCOUNT_TYPES:
         tree = AccountTree(acctype)
         for acc_name in filter(lambda name: name.startswith(acctype), budget_items):
-            tree.add(acc_name, budget_items[acc_name])
-
-        tuples += tree.get_format_tuples(callback=_format_tree)
-    return tuples
+            tree.add(acc_name, to_cents(budget_items[acc_name]))
+        trees.append(tree)
+    return trees
 
 
 def load_budget_yaml(yaml_text: str):
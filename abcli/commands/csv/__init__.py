@@ -1,13 +1,12 @@
 import click
 
-from abcli.commands.csv.classify import cmd_classify
-from abcli.commands.csv.prep import cmd_prep
+from abcli.utils.click import LazyGroup
 
 
-@click.group("csv")
+@click.group("csv", cls=LazyGroup)
 def cli():
     pass
 
 
-cli.add_command(cmd_classify)
-cli.add_command(cmd_prep)
+cli.add_lazy_command('classify', 'abcli.commands.csv.classify', 'cmd_classify')
+cli.add_lazy_command('prep', 'abcli.commands.csv.prep', 'cmd_prep')
@@ -0,0 +1,78 @@
+import json
+import sqlite3
+from pathlib import Path
+from typing import *
+
+from abcli.utils.cache import user_cache_dir
+
+DEFAULT_MAX_ENTRIES = 100000
+
+
+def default_cache_path() -> Path:
+    return user_cache_dir() / 'classify-cache.sqlite'
+
+
+class ClassifyCache:
+    """
+    Persistent cache of transaction descriptions to the rules they resolve to in a rulebook.
+    Entries are only valid for the rulebook they were resolved with, identified by a digest of the
+    rulebook's content: the cache is cleared when opened with a different digest.
+    The number of entries is bounded, the least recently used ones are evicted on `save`.
+    """
+
+    def __init__(self, path: Path, rulebook_digest: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path))
+        self._max_entries = max_entries
+        self._entries: Dict[str, Any] = {}
+        self._touched: Set[str] = set()
+        self.hits = 0
+        self.misses = 0
+
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS entries "
+                               "(description TEXT PRIMARY KEY, rule TEXT, last_used INTEGER)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries__last_used ON entries (last_used)")
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'rulebook_digest'").fetchone()
+            if row is None or row[0] != rulebook_digest:
+                self._conn.execute("DELETE FROM entries")
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('rulebook_digest', ?)", (rulebook_digest,))
+
+        self._clock = self._conn.execute("SELECT coalesce(max(last_used), 0) FROM entries").fetchone()[0] + 1
+        for description, rule in self._conn.execute("SELECT description, rule FROM entries"):
+            self._entries[description] = json.loads(rule)
+
+    def __contains__(self, description: str) -> bool:
+        return description in self._entries
+
+    def __getitem__(self, description: str):
+        return self._entries[description]
+
+    def lookup(self, description: str) -> Tuple[bool, Any]:
+        """Returns whether the description is cached, and its rule if so; counts hits and misses."""
+        if description in self._entries:
+            self.hits += 1
+            self._touched.add(description)
+            return True, self._entries[description]
+        self.misses += 1
+        return False, None
+
+    def update(self, items: Iterable[Tuple[str, Any]]):
+        for description, rule in items:
+            self._entries[description] = rule
+            self._touched.add(description)
+
+    def save(self):
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                                   ((description, json.dumps(self._entries[description]), self._clock)
+                                    for description in self._touched))
+            self._conn.execute("DELETE FROM entries WHERE description IN "
+                               "(SELECT description FROM entries ORDER BY last_used LIMIT "
+                               "max((SELECT count(*) FROM entries) - ?, 0))", (self._max_entries,))
+        self._touched.clear()
+        self._clock += 1
+
+    def close(self):
+        self._conn.close()
@@ -1,64 +1,179 @@
 import csv
+import hashlib
+import itertools
 import logging
-import re
+import multiprocessing
+import os
+import shutil
+from collections import deque
 from pathlib import Path
+from typing import *
 from pprint import PrettyPrinter
 
 import click
 import yaml
 
 from abcli.utils import PathType
+from abcli.commands.csv.matcher import RulebookMatcher
+from abcli.commands.csv.cache import ClassifyCache, default_cache_path
 
 pformat = PrettyPrinter().pformat
 logger = logging.getLogger()
 
 
-def classify(txns: [dict], rulebook: dict) -> ([dict], int):
+def classify(txns: [dict], rulebook: Union[dict, RulebookMatcher]) -> ([dict], int):
     restxns = []
-
-    def _lookup_rulebook(note):
-        for keyword, rule in rulebook['keyword'].items():
-            if keyword.upper() in note.upper():
-                return rule
-
-        for regex, rule in rulebook['regex'].items():
-            if re.match(regex, note):
-                return rule
+    matcher = rulebook if isinstance(rulebook, RulebookMatcher) else RulebookMatcher(rulebook)
 
     for idx, txn in enumerate(txns):
-        rule = _lookup_rulebook(txn['description'])
-        if rule is not None:
-            if isinstance(rule, str):
-                txn['that_auto'] = rule
-            if isinstance(rule, dict):
-                txn.update(rule)
-
+        _apply_rule(txn, matcher.lookup(txn['description']))
         restxns.append(txn)
 
     return restxns
 
 
+def _apply_rule(txn: dict, rule):
+    if rule is not None:
+        if isinstance(rule, str):
+            txn['that_auto'] = rule
+        if isinstance(rule, dict):
+            txn.update(rule)
+
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
 @click.command("classify")
 @click.option("-r", "--rulebook", "rulebook_path", type=PathType(exists=True, dir_okay=False),
               help='Rule book JSON file for assigning accounts/categories; default can be specified in config.json')
+@click.option("-j", "--jobs", type=click.IntRange(min=1), default=1,
+              help="Number of processes to classify with.")
+@click.option("--cache", "cache_path", type=PathType(dir_okay=False), default=None,
+              help="Path to the classification cache; default to classify-cache.sqlite in the user cache directory.")
+@click.option("--no-cache", is_flag=True, help="Don't cache classifications.")
 @click.argument("csvpath", type=PathType(exists=True, dir_okay=False))
-def cmd_classify(csvpath: Path, rulebook_path: Path):
-    rulebook = _load_rulebook(rulebook_path)
+def cmd_classify(csvpath: Path, rulebook_path: Path, jobs: int, cache_path: Path, no_cache: bool):
+    rulebook, rulebook_digest = _load_rulebook(rulebook_path)
+    cache = None
+    if not no_cache:
+        cache = ClassifyCache(cache_path or default_cache_path(), rulebook_digest)
+
+    num_classified, num_total = 0, 0
+    tmp_path = csvpath.with_name(f".{csvpath.name}.classify")
+    try:
+        with csvpath.open('r', encoding='utf-8') as in_fp, tmp_path.open('w', encoding='utf-8') as out_fp:
+            reader = csv.DictReader(in_fp)
+            writer = csv.DictWriter(out_fp, reader.fieldnames)
+            writer.writeheader()
+
+            for restxns in _classify_chunks(_iter_chunks(reader, DEFAULT_CHUNK_SIZE), rulebook, jobs, cache):
+                num_classified += len(list(filter(lambda txn: txn['that_auto'] or txn['that_overwrite'], restxns)))
+                num_total += len(restxns)
+                writer.writerows(restxns)
+
+        shutil.copymode(csvpath, tmp_path)
+        os.replace(tmp_path, csvpath)
+        if cache:
+            cache.save()
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        if cache:
+            cache.close()
+
+    click.echo(f"{num_classified}/{num_total} classified ({int(num_classified / num_total * 100)}%)")
+    if cache:
+        click.echo(f"cache: {cache.hits} hits, {cache.misses} misses "
+                   f"({int(cache.hits / max(cache.hits + cache.misses, 1) * 100)}% hit rate)")
+
+
+def _iter_chunks(rows: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _classify_chunks(chunks: Iterator[List[dict]], rulebook: dict, jobs: int,
+                     cache: ClassifyCache = None) -> Iterator[List[dict]]:
+    """
+    Classifies chunks of rows, in a pool of `jobs` processes if more than one; results are in input order.
+    Only distinct descriptions not found in the cache are matched against the rulebook.
+    With more than one job, at most `jobs` chunks are read ahead of the one being yielded, so that memory is
+    bounded by the chunk size rather than growing with the input.
+    The cache is only used from the calling thread: workers are sent the descriptions to match, nothing else.
+    """
+    cache = cache if cache is not None else _NoCache()
+
+    if jobs == 1:
+        matcher = RulebookMatcher(rulebook)
+        for chunk in chunks:
+            rules, to_match = _lookup_cached(chunk, cache)
+            yield _apply_matched(chunk, rules, to_match, [matcher.lookup(description) for description in to_match],
+                                 cache)
+        return
+
+    # Not `Pool.imap`, which would read all chunks ahead from its own thread
+    with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(rulebook,)) as pool:
+        chunks = iter(chunks)
+
+        def _submit(chunk: List[dict]):
+            rules, to_match = _lookup_cached(chunk, cache)
+            return chunk, rules, to_match, pool.apply_async(_lookup_in_worker, (to_match,))
+
+        pending = deque(_submit(chunk) for chunk in itertools.islice(chunks, jobs))
+        while pending:
+            chunk, rules, to_match, result = pending.popleft()
+            matched_rules = result.get()
+            # Read the next chunk while this one is being written
+            for next_chunk in itertools.islice(chunks, 1):
+                pending.append(_submit(next_chunk))
+            yield _apply_matched(chunk, rules, to_match, matched_rules, cache)
+
+
+def _lookup_cached(chunk: List[dict], cache: ClassifyCache) -> Tuple[Dict[str, Any], List[str]]:
+    """:return: the rules of the cached descriptions of the chunk, and its other distinct descriptions"""
+    rules, to_match = {}, set()
+    for txn in chunk:
+        description = txn['description']
+        found, rule = cache.lookup(description)
+        if found:
+            rules[description] = rule
+        else:
+            to_match.add(description)
+    return rules, list(to_match)
+
+
+def _apply_matched(chunk: List[dict], rules: Dict[str, Any], to_match: List[str], matched_rules: List,
+                   cache: ClassifyCache) -> List[dict]:
+    rules.update(zip(to_match, matched_rules))
+    cache.update(zip(to_match, matched_rules))
+    for txn in chunk:
+        _apply_rule(txn, rules[txn['description']])
+    return chunk
+
+
+class _NoCache:
+    def lookup(self, description: str) -> Tuple[bool, Any]:
+        return False, None
+
+    def update(self, items: Iterable[Tuple[str, Any]]):
+        pass
+
+
+_worker_matcher: RulebookMatcher = None
 
-    with csvpath.open('r', encoding='utf-8') as fp:
-        reader = csv.DictReader(fp)
-        fieldnames = reader.fieldnames
-        rows = list(reader)
 
-    restxns = classify(rows, rulebook)
-    num_classified = len(list(filter(lambda txn: txn['that_auto'] or txn['that_overwrite'], restxns)))
+def _init_worker(rulebook: dict):
+    # The rulebook is compiled once per worker process, rather than shipped with each chunk
+    global _worker_matcher
+    _worker_matcher = RulebookMatcher(rulebook)
 
-    click.echo(f"{num_classified}/{len(restxns)} classified ({int(num_classified / len(restxns) * 100)}%)")
 
-    with csvpath.open('w', encoding='utf-8') as fp:
-        writer = csv.DictWriter(fp, fieldnames)
-        writer.writeheader()
-        writer.writerows(restxns)
+def _lookup_in_worker(descriptions: List[str]) -> List:
+    return [_worker_matcher.lookup(description) for description in descriptions]
 
 
 CONFIG_RULEBOOK_KEY = "csv.classify.rulebook"
@@ -73,5 +188,5 @@ def _load_rulebook(rb_path: Path):
             raise click.UsageError(f"Rulebook path not specified on command line, nor defined in config JSON.",
                                    click.get_current_context())
 
-    with rb_path.open('r', encoding='utf-8') as fp:
-        return yaml.full_load(fp)
+    content = rb_path.read_bytes()
+    return yaml.full_load(content.decode('utf-8')), hashlib.sha256(content).hexdigest()
@@ -1,8 +1,10 @@
 from pathlib import Path
 from pprint import PrettyPrinter
 import json, csv
-from collections import defaultdict
+from collections import defaultdict, Counter
+import itertools
 import math
+from typing import *
 
 import click
 
@@ -67,6 +69,67 @@ def merge_txns(txns: [dict]) -> [dict]:
     return sorted_txns
 
 
+def count_refs(rows: Iterable[dict]) -> Dict[str, int]:
+    """
+    Counts the number of rows in each ref group, so that `merge_txns_iter` knows when a group is complete.
+    Only the `ref` column is kept, so this is cheap to run as a separate pass over the CSV.
+    """
+    return Counter(row['ref'] for row in rows if row['ref'])
+
+
+def merge_txns_iter(txns: Iterable[dict], ref_counts: Dict[str, int] = None) -> Iterator[dict]:
+    """
+    Streaming version of `merge_txns`: transactions without a ref are yielded as they come,
+    and transactions sharing a ref are buffered only until their group is complete.
+    :param txns: transactions as returned by `row2txn`
+    :param ref_counts: number of transactions in each ref group (see `count_refs`);
+                       if not given, ref groups are buffered until the end of input
+    """
+    pending = defaultdict(list)
+    for txn in txns:
+        ref = txn['ref']
+        if not ref:
+            yield txn
+            continue
+
+        pending[ref].append(txn)
+        if ref_counts is not None and len(pending[ref]) >= ref_counts.get(ref, 0):
+            yield _merge_same_refs(pending.pop(ref))
+
+    for group in pending.values():
+        yield _merge_same_refs(group)
+
+
+class NoRowsError(ValueError):
+    """Raised for a CSV with a header but no rows."""
+
+
+def process_iter(rows: Iterable[dict], ref_counts: Dict[str, int] = None, sort=False) -> dict:
+    """
+    Streaming version of `process`; the returned 'transactions' is an iterator
+    that converts and merges rows lazily as it is consumed.
+    :param rows: CSV rows, e.g. a `csv.DictReader`
+    :param ref_counts: see `merge_txns_iter`
+    :param sort: sort transactions on max_date_resolved (materialises all transactions)
+    :raises NoRowsError: if there are no rows, as the account and its balance are read from the first row
+    """
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        raise NoRowsError("CSV has no rows")
+    txns = merge_txns_iter(map(row2txn, itertools.chain([first], rows)), ref_counts)
+    if sort:
+        txns = iter(sorted(txns, key=lambda _txn: parse_date(_txn['max_date_resolved'])))
+    return {
+        'account': first['this'],
+        'balance': {
+            'date': first['date_resolved'],
+            'balance': float(first['balance'])
+        },
+        'transactions': txns
+    }
+
+
 def process(rows: [dict]) -> dict:
     txns = list(map(row2txn, rows))
     txns = merge_txns(txns)
@@ -0,0 +1,122 @@
+import re
+from collections import deque
+from typing import *
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton finding which of the keywords occur in a text in a single pass over the text.
+    Returns the index of the first matching keyword (in the order given), like checking
+    `keyword in text` for each keyword in turn would.
+    """
+
+    def __init__(self, keywords: Sequence[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._best: List[Optional[int]] = [None]  # lowest keyword index ending at (or via fail links of) a state
+
+        for idx, keyword in enumerate(keywords):
+            state = 0
+            for char in keyword:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._best.append(None)
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            if self._best[state] is None:
+                self._best[state] = idx
+
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._best[child] = _min(self._best[child], self._best[self._fail[child]])
+                queue.append(child)
+
+    def match(self, text: str) -> Optional[int]:
+        goto, fail, best = self._goto, self._fail, self._best
+        result = best[0]  # empty keyword
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            result = _min(result, best[state])
+            if result == 0:
+                break
+        return result
+
+
+class RegexMatcher:
+    """
+    Matches a text against a list of regexes with `re.match` semantics, returning the index of the first
+    regex (in the order given) that matches. The regexes are combined into one alternation, which the
+    regex engine tries in order at the start of the text.
+    """
+
+    def __init__(self, patterns: Sequence[str]):
+        self._patterns = [re.compile(pattern) for pattern in patterns]
+        self._combined = None
+        # Backreferences would refer to the wrong groups, and inline flags would apply to all patterns,
+        # once the patterns are combined
+        if self._patterns and not any(re.search(r'\\\d|\(\?P=', pattern.pattern) or pattern.flags != re.UNICODE
+                                      for pattern in self._patterns):
+            group_to_idx = {}
+            group = 1
+            for idx, pattern in enumerate(self._patterns):
+                group_to_idx[group] = idx
+                group += 1 + pattern.groups
+            try:
+                self._combined = re.compile('|'.join(f"({pattern.pattern})" for pattern in self._patterns))
+                self._group_to_idx = group_to_idx
+            except re.error:
+                self._combined = None
+
+    def match(self, text: str) -> Optional[int]:
+        if self._combined is not None:
+            m = self._combined.match(text)
+            # The wrapping group of the matched alternative is the last one to close
+            return self._group_to_idx[m.lastindex] if m else None
+
+        for idx, pattern in enumerate(self._patterns):
+            if pattern.match(text):
+                return idx
+        return None
+
+
+class RulebookMatcher:
+    """
+    A rulebook compiled for looking up rules of transaction descriptions.
+    Keywords are matched case-insensitively anywhere in the description, and take priority over regexes;
+    within each, the first rule in the rulebook wins.
+    """
+
+    def __init__(self, rulebook: dict):
+        keyword_rules = rulebook.get('keyword') or {}
+        regex_rules = rulebook.get('regex') or {}
+        self._keyword_rules = list(keyword_rules.values())
+        self._keywords = KeywordMatcher([keyword.upper() for keyword in keyword_rules])
+        self._regex_rules = list(regex_rules.values())
+        self._regexes = RegexMatcher(list(regex_rules))
+
+    def lookup(self, note: str):
+        idx = self._keywords.match(note.upper())
+        if idx is not None:
+            return self._keyword_rules[idx]
+
+        idx = self._regexes.match(note)
+        if idx is not None:
+            return self._regex_rules[idx]
+        return None
+
+
+def _min(a: Optional[int], b: Optional[int]) -> Optional[int]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
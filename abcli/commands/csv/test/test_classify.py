@@ -0,0 +1,188 @@
+import csv
+import random
+import re
+import threading
+
+from click.testing import CliRunner
+
+from abcli.commands.csv.cache import ClassifyCache
+from abcli.commands.csv.classify import classify, _classify_chunks
+from abcli.commands.csv.matcher import KeywordMatcher, RegexMatcher, RulebookMatcher
+from abcli.main import cli
+
+
+def _naive_lookup(rulebook, note):
+    for keyword, rule in rulebook['keyword'].items():
+        if keyword.upper() in note.upper():
+            return rule
+
+    for regex, rule in rulebook['regex'].items():
+        if re.match(regex, note):
+            return rule
+
+
+def test_keyword_matcher_first_keyword_wins():
+    matcher = KeywordMatcher(['SHE', 'HERS', 'HE', 'HIS'])
+    assert matcher.match('USHERS') == 0
+    assert matcher.match('XHISX') == 3
+    assert matcher.match('AHERB') == 2
+    assert matcher.match('NOTHING') is None
+    assert KeywordMatcher(['ABC', '']).match('XYZ') == 1
+
+
+def test_regex_matcher_first_regex_wins():
+    matcher = RegexMatcher([r'(a)(b)c', r'a(b)?', r'.*z$'])
+    assert matcher.match('abc') == 0
+    assert matcher.match('abd') == 1
+    assert matcher.match('xyz') == 2
+    assert matcher.match('xy') is None
+    # Backreferences can't be combined, but still match the same
+    assert RegexMatcher([r'x', r'(a)\1']).match('aa') == 1
+    assert RegexMatcher([]).match('abc') is None
+
+
+def test_rulebook_matcher_matches_naive_lookup():
+    rand = random.Random(42)
+    alphabet = 'abcAB '
+
+    def _word(min_len, max_len):
+        return ''.join(rand.choice(alphabet) for _ in range(rand.randint(min_len, max_len)))
+
+    for _ in range(20):
+        rulebook = {
+            'keyword': {_word(1, 4): f'Keyword:{i}' for i in range(30)},
+            'regex': {f'{_word(0, 2)}.*{_word(1, 2)}': f'Regex:{i}' for i in range(10)},
+        }
+        matcher = RulebookMatcher(rulebook)
+        for _ in range(100):
+            note = _word(0, 12)
+            assert matcher.lookup(note) == _naive_lookup(rulebook, note), (rulebook, note)
+
+
+def test_classify():
+    rulebook = {
+        'keyword': {
+            'dinner': 'Expenses:Food:Restaurant',
+            'food reimb': {'this': 'Income:Reimbursements', 'that_auto': 'Expenses:Misc:Lent'},
+        },
+        'regex': {r'.*(Comm|Net)Bank.*': 'Assets:Bank:Savings'},
+    }
+    txns = [{'description': desc, 'this': 'Assets:Checking', 'that_auto': '', 'that_overwrite': ''}
+            for desc in ('DINNER AT X', 'Food Reimb from Y', 'Transfer to NetBank', 'Unknown')]
+    assert [(txn['this'], txn['that_auto']) for txn in classify(txns, rulebook)] == [
+        ('Assets:Checking', 'Expenses:Food:Restaurant'),
+        ('Income:Reimbursements', 'Expenses:Misc:Lent'),
+        ('Assets:Checking', 'Assets:Bank:Savings'),
+        ('Assets:Checking', ''),
+    ]
+
+
+def test_cmd_classify_jobs(tmp_path):
+    rulebook_path = tmp_path / 'rulebook.yaml'
+    rulebook_path.write_text("keyword:\n"
+                             "    dinner: 'Expenses:Food'\n"
+                             "regex:\n"
+                             "    '.*Rent.*': 'Expenses:Rent'\n", encoding='utf-8')
+    descriptions = ['Dinner', 'Monthly Rent', 'Unknown'] * 5000
+    csvpath = tmp_path / 'txns.csv'
+    csvpath.write_text('date_occurred,date_resolved,amount,description,balance,this,that_auto,that_overwrite,ref\n' +
+                       ''.join(f'01/01/2019,01/01/2019,-{idx},{desc},0,Assets:Checking,,,\n'
+                               for idx, desc in enumerate(descriptions)), encoding='utf-8')
+
+    res = CliRunner().invoke(cli, ['csv', 'classify', '-r', str(rulebook_path), '--jobs', '2', '--no-cache',
+                                   str(csvpath)])
+    assert res.exit_code == 0, res.output
+    assert "10000/15000 classified (66%)" in res.output
+
+    with csvpath.open('r', encoding='utf-8') as fp:
+        rows = list(csv.DictReader(fp))
+    assert [row['amount'] for row in rows] == [f'-{idx}' for idx in range(len(descriptions))]
+    assert [row['that_auto'] for row in rows[:3]] == ['Expenses:Food', 'Expenses:Rent', '']
+    assert set(tmp_path.iterdir()) == {rulebook_path, csvpath}
+
+
+def test_classify_chunks_bounds_chunks_in_flight():
+    rulebook = {'keyword': {'dinner': 'Expenses:Food'}, 'regex': {}}
+    num_read = 0
+
+    def _chunks():
+        nonlocal num_read
+        for idx in range(50):
+            num_read += 1
+            yield [{'description': f'Dinner {idx}'}, {'description': 'Unknown'}]
+
+    num_classified = 0
+    for chunk in _classify_chunks(_chunks(), rulebook, jobs=2):
+        num_classified += 1
+        assert num_read - num_classified <= 2
+        assert [txn.get('that_auto') for txn in chunk] == ['Expenses:Food', None]
+    assert num_classified == 50
+
+
+def test_classify_chunks_uses_cache_from_calling_thread(tmp_path):
+    threads = set()
+
+    class _RecordingCache(ClassifyCache):
+        def lookup(self, description):
+            threads.add(threading.get_ident())
+            return super().lookup(description)
+
+        def update(self, items):
+            threads.add(threading.get_ident())
+            super().update(items)
+
+    rulebook = {'keyword': {'dinner': 'Expenses:Food'}, 'regex': {}}
+    chunks = [[{'description': 'Dinner'}, {'description': f'Unknown {idx % 3}'}] for idx in range(20)]
+    cache = _RecordingCache(tmp_path / 'cache.sqlite', 'digest')
+    assert sum(len(chunk) for chunk in _classify_chunks(iter(chunks), rulebook, jobs=2, cache=cache)) == 40
+    assert threads == {threading.get_ident()}
+    assert cache.hits + cache.misses == 40
+    assert cache['Dinner'] == 'Expenses:Food' and cache['Unknown 2'] is None
+    cache.close()
+
+
+def test_cmd_classify_cache(tmp_path):
+    rulebook_path = tmp_path / 'rulebook.yaml'
+    rulebook_path.write_text("keyword:\n"
+                             "    dinner: 'Expenses:Food'\n", encoding='utf-8')
+    cache_path = tmp_path / 'cache' / 'classify.sqlite'
+    csvpath = tmp_path / 'txns.csv'
+
+    def _classify():
+        csvpath.write_text('date_occurred,date_resolved,amount,description,balance,this,that_auto,that_overwrite,ref\n'
+                           '01/01/2019,01/01/2019,-1,Dinner,0,Assets:Checking,,,\n'
+                           '02/01/2019,02/01/2019,-2,Dinner,0,Assets:Checking,,,\n'
+                           '03/01/2019,03/01/2019,-3,Rent,0,Assets:Checking,,,\n', encoding='utf-8')
+        res = CliRunner().invoke(cli, ['csv', 'classify', '-r', str(rulebook_path), '--cache', str(cache_path),
+                                       str(csvpath)])
+        assert res.exit_code == 0, res.output
+        with csvpath.open('r', encoding='utf-8') as fp:
+            return res.output, [row['that_auto'] for row in csv.DictReader(fp)]
+
+    assert _classify() == ("2/3 classified (66%)\ncache: 0 hits, 3 misses (0% hit rate)\n",
+                           ['Expenses:Food', 'Expenses:Food', ''])
+    assert _classify() == ("2/3 classified (66%)\ncache: 3 hits, 0 misses (100% hit rate)\n",
+                           ['Expenses:Food', 'Expenses:Food', ''])
+
+    # Editing the rulebook invalidates the cache
+    rulebook_path.write_text("keyword:\n"
+                             "    dinner: 'Expenses:Food'\n"
+                             "    rent: 'Expenses:Rent'\n", encoding='utf-8')
+    assert _classify() == ("3/3 classified (100%)\ncache: 0 hits, 3 misses (0% hit rate)\n",
+                           ['Expenses:Food', 'Expenses:Food', 'Expenses:Rent'])
+
+
+def test_classify_cache_evicts_least_recently_used(tmp_path):
+    cache = ClassifyCache(tmp_path / 'cache.sqlite', 'digest', max_entries=2)
+    cache.update([('a', 'A'), ('b', None)])
+    cache.save()
+    assert cache.lookup('a') == (True, 'A')
+    cache.update([('c', {'that_auto': 'C'})])
+    cache.save()
+    cache.close()
+
+    cache = ClassifyCache(tmp_path / 'cache.sqlite', 'digest', max_entries=2)
+    assert 'b' not in cache
+    assert cache.lookup('a') == (True, 'A')
+    assert cache.lookup('c') == (True, {'that_auto': 'C'})
+    cache.close()
@@ -0,0 +1,52 @@
+import csv
+import io
+
+import pytest
+
+from abcli.commands.csv.csv2json import count_refs, merge_txns_iter, merge_txns, process_iter
+
+
+def _txn(date, ref=''):
+    return {
+        'min_date_occurred': date,
+        'max_date_resolved': date,
+        'description': f'txn {date}',
+        'ref': ref,
+        'posts': [{'account': 'A', 'amount': 1.0, 'date_occurred': date, 'date_resolved': date},
+                  {'account': 'B', 'amount': -1.0, 'date_occurred': date, 'date_resolved': date}],
+    }
+
+
+def test_merge_txns_iter_yields_complete_groups_early():
+    txns = [_txn('01/01/2019', '@a'), _txn('02/01/2019'), _txn('03/01/2019', '@a'), _txn('04/01/2019', '@b')]
+    ref_counts = count_refs(txns)
+    assert ref_counts == {'@a': 2, '@b': 1}
+
+    consumed = []
+
+    def _source():
+        for txn in txns:
+            consumed.append(txn)
+            yield txn
+
+    merged = merge_txns_iter(_source(), ref_counts)
+    assert next(merged)['description'] == 'txn 02/01/2019'
+    group_a = next(merged)
+    assert len(consumed) == 3
+    assert group_a['ref'] == '@a'
+    assert (group_a['min_date_occurred'], group_a['max_date_resolved']) == ('01/01/2019', '03/01/2019')
+    assert len(group_a['posts']) == 4
+    assert next(merged)['ref'] == '@b'
+    assert next(merged, None) is None
+
+
+def test_merge_txns_iter_matches_merge_txns():
+    txns = [_txn('05/01/2019', '@a'), _txn('02/01/2019'), _txn('03/01/2019', '@a'), _txn('04/01/2019')]
+    streamed = merge_txns_iter(txns)
+    assert sorted(streamed, key=lambda t: t['max_date_resolved']) == merge_txns(txns)
+
+
+def test_process_iter_no_rows():
+    header = "date_occurred,date_resolved,amount,description,balance,this,that_auto,that_overwrite,ref\n"
+    with pytest.raises(ValueError, match="no rows"):
+        process_iter(csv.DictReader(io.StringIO(header)))
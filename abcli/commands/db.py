@@ -0,0 +1,28 @@
+import logging
+
+import click
+
+from abcli.model import migrate
+from abcli.utils import error_exit_on_exception
+
+logger = logging.getLogger()
+
+
+@click.group(__name__[__name__.rfind('.') + 1:])
+def cli():
+    pass
+
+
+@cli.command('migrate')
+@click.pass_obj
+@error_exit_on_exception
+def cmd_migrate(db):
+    created = migrate(db)
+    if not created:
+        click.echo("Database schema is up to date.")
+        return 0
+
+    click.echo("Created:")
+    for name in created:
+        click.echo(f"  {name}")
+    return 0
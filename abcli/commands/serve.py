@@ -0,0 +1,180 @@
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import traceback
+from pathlib import Path
+from typing import *
+
+import click
+from pony import orm
+from pony.orm import Database
+
+from abcli.client import SOCKET_ENV, DEFAULT_SOCKET, FRAME_STDOUT, FRAME_STDERR, FRAME_EXIT, send_frame, socket_path
+from abcli.utils import PathType
+
+logger = logging.getLogger()
+
+_server: Optional['Server'] = None
+
+
+@click.command(__name__[__name__.rfind('.') + 1:])
+@click.option('--socket', 'path', type=PathType(dir_okay=False), default=None,
+              help=f"Path of the Unix socket to listen on; default to ${SOCKET_ENV}, or {DEFAULT_SOCKET} "
+                   f"(in the user cache directory without $XDG_RUNTIME_DIR).")
+@click.pass_context
+def cli(ctx: click.Context, path: Path):
+    """
+    Serve commands over a Unix socket, keeping the database connected and mapped between them.
+
+    Run commands on the server with `abcli-client`, e.g. `abcli-client transaction summary -m 04/2018`;
+    they use the database of the server. Commands are run one at a time, and can't read from stdin.
+    """
+    global _server
+    if _server is not None:
+        raise click.UsageError("Already serving.")
+
+    path = str(path or socket_path())
+    # Served commands get the config of the server, e.g. the default rulebook of `csv classify`
+    _server = make_server(ctx.obj, path, dict(ctx.meta))
+    # Stop cleanly (and remove the socket) when terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logger.info(f"Serving on {path}; stop with Ctrl-C.")
+    try:
+        _server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        _server.server_close()
+        _server = None
+        os.unlink(path)
+    return 0
+
+
+class Server(socketserver.UnixStreamServer):
+    """Serves commands one at a time; commands redirect the process-wide `sys.stdout` and share module state."""
+
+    def __init__(self, db: Database, path: str, meta: Dict[str, Any]):
+        self.db = db
+        self.meta = meta
+        super().__init__(path, _RequestHandler)
+
+
+def make_server(db: Database, path: str, meta: Dict[str, Any] = None) -> Server:
+    """
+    Binds a server to the Unix socket at `path`, replacing the socket left by a server that is gone.
+    :param meta: context meta (i.e. config) of the commands served
+    """
+    if os.path.exists(path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(path)
+            except ConnectionRefusedError:
+                os.unlink(path)
+            else:
+                raise click.UsageError(f"An abcli server is already listening on {path}.")
+
+    # Only the user may connect: served commands can read and write anything the server can
+    os.makedirs(os.path.dirname(os.path.abspath(path)), mode=0o700, exist_ok=True)
+    umask = os.umask(0o177)
+    try:
+        return Server(db, path, meta or {})
+    finally:
+        os.umask(umask)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:  # e.g. `make_server` checking if the server is alive
+            return
+        request = json.loads(line)
+        try:
+            status = run_command(self.server.db, request['argv'], request['cwd'], self.request, self.server.meta)
+            send_frame(self.request, FRAME_EXIT, str(status).encode('ascii'))
+        except (BrokenPipeError, ConnectionResetError):
+            logger.warning(f"Client disconnected while running: abcli {' '.join(request['argv'])}")
+
+
+def run_command(db: Database, argv: List[str], cwd: str, sock: socket.socket, meta: Dict[str, Any] = None) -> int:
+    """
+    Runs the command line on `db` as if run by the client in `cwd`, sending its stdout, stderr and log
+    as frames to the client.
+    :param meta: context meta (i.e. config) of the command
+    :return: the exit status of the command
+    """
+    from abcli.main import cli as main_cli
+
+    stdout, stderr = _frame_stream(sock, FRAME_STDOUT), _frame_stream(sock, FRAME_STDERR)
+    root_logger = logging.getLogger()
+    saved = sys.stdin, sys.stdout, sys.stderr, os.getcwd(), root_logger.level, orm.core.local.debug
+
+    log_streams = _redirect_log_handlers(root_logger, sys.stderr, stderr)
+    sys.stdin, sys.stdout, sys.stderr = io.StringIO(), stdout, stderr
+    try:
+        os.chdir(cwd)
+        # As `main_cli.main(standalone_mode=False)`, which can't be given the context meta
+        with main_cli.make_context('abcli', list(argv), obj=db) as ctx:
+            ctx.meta.update(meta or {})
+            status = main_cli.invoke(ctx)
+        status = status if isinstance(status, int) else 0
+    except click.exceptions.Exit as e:
+        status = e.exit_code
+    except click.ClickException as e:
+        e.show()
+        status = e.exit_code
+    except click.Abort:
+        click.echo("Aborted!", err=True)
+        status = 1
+    except (BrokenPipeError, ConnectionResetError):
+        raise
+    except Exception:
+        traceback.print_exc()
+        status = 1
+    finally:
+        for handler, stream in log_streams:
+            handler.setStream(stream)
+        sys.stdin, sys.stdout, sys.stderr, cwd, level, sql_debug = saved
+        root_logger.setLevel(level)
+        orm.set_sql_debug(sql_debug)
+        os.chdir(cwd)
+    stdout.flush()
+    stderr.flush()
+    return status
+
+
+def _redirect_log_handlers(logger: logging.Logger, old_stream, new_stream) -> List[Tuple[logging.StreamHandler, Any]]:
+    """
+    Points the handlers of `logger` writing to `old_stream` at `new_stream`; handlers that look up `sys.stderr`
+    on each record (e.g. those of coloredlogs) already follow `sys.stderr` and are left as they are.
+    :return: the handlers redirected, with their streams to restore
+    """
+    redirected = []
+    for handler in logger.handlers:
+        if isinstance(handler, logging.StreamHandler) and 'stream' in vars(handler) and handler.stream is old_stream:
+            redirected.append((handler, handler.setStream(new_stream)))
+    return redirected
+
+
+class _FrameWriter(io.RawIOBase):
+    def __init__(self, sock: socket.socket, kind: bytes):
+        super().__init__()
+        self._sock = sock
+        self._kind = kind
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        send_frame(self._sock, self._kind, bytes(data))
+        return len(data)
+
+
+def _frame_stream(sock: socket.socket, kind: bytes) -> io.TextIOWrapper:
+    # Output is buffered into large frames; errors and log messages are sent line by line
+    return io.TextIOWrapper(io.BufferedWriter(_FrameWriter(sock, kind), buffer_size=64 * 1024), encoding='utf-8',
+                            line_buffering=kind == FRAME_STDERR)
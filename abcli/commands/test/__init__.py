@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 from pathlib import Path
 import json
 from typing import *
@@ -7,6 +8,7 @@ from pony.orm import Database
 
 from abcli.main import cli
 from abcli.model import init_orm
+from abcli.utils.profiling import record_sql
 
 
 def setup_db(tmp_path: Path):
@@ -17,7 +19,11 @@ def setup_db(tmp_path: Path):
     return db, tmpfile
 
 
-def invoke_cmd(db_file: Path, args: List[str]) -> Result:
+def invoke_cmd(db_file: Path, args: List[str], input: str = None, db: Database = None) -> Result:
+    """
+    Runs the command line on the database file, as configured in a config.json next to it.
+    :param db: run on this database instead, as `abcli serve` does, e.g. to count its statements with `query_budget`
+    """
     config_file = db_file.parent / 'config.json'
     with config_file.open('w', encoding='utf-8') as fp:
         json.dump({
@@ -27,4 +33,20 @@ def invoke_cmd(db_file: Path, args: List[str]) -> Result:
             }
         }, fp, indent=2)
 
-    return CliRunner().invoke(cli, ['--config', str(config_file)] + args)
+    return CliRunner().invoke(cli, ['--config', str(config_file)] + args, input=input, obj=db)
+
+
+@contextmanager
+def query_budget(max_statements: int, db: Database) -> Iterator[List[str]]:
+    """
+    Fails if more than `max_statements` SQL statements are executed on `db` in the block, e.g. by a command run
+    on it with `invoke_cmd(..., db=db)`, to catch N+1 queries.
+    Statements are those recorded by `abcli.utils.profiling.record_sql`, as counted for `--profile`.
+    :return: the statements executed so far in the block
+    """
+    with record_sql(db) as statements:
+        yield statements
+
+    assert len(statements) <= max_statements, \
+        f"{len(statements)} SQL statements executed, over the budget of {max_statements}:\n" + \
+        "\n".join(statements)
@@ -1,5 +1,9 @@
+from datetime import date
+
+import pytest
 from pony.orm import *
 
+from abcli.commands.account import register_query
 from abcli.commands.test import setup_db, invoke_cmd
 
 
@@ -27,4 +31,55 @@ def test_add_account_fail_already_exists(tmp_path_factory):
     res = invoke_cmd(db_file, ['account', 'add', 'TestAccount'])
     assert res.exit_code == 1, str(res)
 
-    assert "Account 'TestAccount' already exists" in res.output
\ No newline at end of file
+    assert "Account 'TestAccount' already exists" in res.output
+
+
+def test_register(tmp_path):
+    set_sql_debug(False)
+    db, db_file = setup_db(tmp_path)
+
+    with db_session:
+        checking, food = db.Account(name='Assets:Checking'), db.Account(name='Expenses:Food')
+        for amount, day in [(100, date(2019, 1, 5)), (-20, date(2019, 2, 3)), (-7.5, date(2019, 2, 20)),
+                            (50, date(2019, 3, 1))]:
+            db.Transaction.from_posts([(checking, amount, day, day), (food, -amount, day, day)])
+        db.Post.get(amount=-20).transaction.description = 'Dinner'
+
+    res = invoke_cmd(db_file, ['account', 'register', 'Assets:Checking'])
+    assert res.exit_code == 0, res.output
+    assert res.output.splitlines() == [
+        "date              amount       balance  description",
+        "05/01/2019       $100.00       $100.00  ",
+        "03/02/2019       -$20.00        $80.00  Dinner",
+        "20/02/2019        -$7.50        $72.50  ",
+        "01/03/2019        $50.00       $122.50  ",
+    ]
+
+    res = invoke_cmd(db_file, ['account', 'register', 'Assets:Checking', '--from', '10/02/2019', '--to', '28/02/2019'])
+    assert res.exit_code == 0, res.output
+    assert res.output.splitlines()[1:] == [
+        "10/02/2019                      $80.00  Opening balance",
+        "20/02/2019        -$7.50        $72.50  ",
+    ]
+
+    res = invoke_cmd(db_file, ['--format', 'jsonl', 'account', 'register', 'Assets:Checking', '--from', '10/02/2019',
+                               '--to', '28/02/2019'])
+    assert res.exit_code == 0, res.output
+    assert res.output.splitlines() == [
+        '{"date": "2019-02-10", "amount": null, "balance": 80.0, "description": "Opening balance"}',
+        '{"date": "2019-02-20", "amount": -7.5, "balance": 72.5, "description": ""}',
+    ]
+
+    res = invoke_cmd(db_file, ['account', 'register', 'Assets:Nope'])
+    assert res.exit_code == 1
+
+
+@pytest.mark.parametrize('date_from,date_to', [(None, None), (date(2019, 2, 1), date(2019, 2, 28))])
+def test_register_query_reads_index_in_order(tmp_path, date_from, date_to):
+    db, _ = setup_db(tmp_path)
+    sql, args = register_query(db, 'Assets:Checking', date_from, date_to)
+    with db_session:
+        cursor = db.get_connection().cursor()
+        plan = ' | '.join(row[-1] for row in cursor.execute(f"EXPLAIN QUERY PLAN {sql}", args).fetchall())
+    assert 'idx_post__account_date_resolved_date_occurred' in plan, plan
+    assert 'TEMP B-TREE' not in plan, plan
@@ -0,0 +1,93 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+from pony import orm
+
+from abcli.commands.account import iter_register, get_opening_balance
+from abcli.commands.test import setup_db, invoke_cmd
+from abcli.commands.transaction import get_account_sums
+from abcli.utils.cents import to_cents
+
+pytest.importorskip('numpy')
+from abcli.utils.columnar import PostStore
+
+
+def _setup_posts(tmp_path):
+    orm.set_sql_debug(False)
+    db, db_file = setup_db(tmp_path)
+    rand = random.Random(17)
+    names = ['Assets:Checking', 'Expenses:Food', 'Expenses:Food:Grocery', 'Expenses:Rent', 'Income']
+
+    with orm.db_session:
+        accounts = [db.Account(name=name) for name in names]
+        for idx in range(200):
+            date_occurred = date(2019, 1, 1) + timedelta(days=rand.randrange(365))
+            date_resolved = date_occurred + timedelta(days=rand.randrange(5))
+            amount = rand.randrange(-50000, 50000) / 100
+            txn = db.Transaction.from_posts([(rand.choice(accounts[1:]), amount, date_occurred, date_resolved),
+                                             (accounts[0], -amount, date_occurred, date_resolved)])
+            txn.description = f"txn {idx % 7}"
+    return db, db_file
+
+
+def test_post_store_matches_db(tmp_path):
+    db, _ = _setup_posts(tmp_path)
+    rand = random.Random(3)
+
+    with orm.db_session:
+        store = PostStore.load(db)
+        assert len(store) == 400
+
+        for _ in range(20):
+            date_from, date_to = sorted([date(2019, 1, 1) + timedelta(days=rand.randrange(400)) for _ in range(2)])
+            for include_nonresolved in (False, True):
+                for account, depth in ((None, None), ('Expenses', None), (None, 1), ('Expenses:Food', 2)):
+                    expected = get_account_sums(db, date_from, date_to, include_nonresolved, account, depth)
+                    actual = store.account_sums(date_from, date_to, include_nonresolved, account, depth)
+                    assert {k: v for k, v in actual.items() if v} == {k: v for k, v in expected.items() if v}
+
+            assert store.opening_balance('Assets:Checking', date_from) == \
+                to_cents(get_opening_balance(db, 'Assets:Checking', date_from))
+            assert list(store.register('Assets:Checking', date_from, date_to)) == \
+                list(iter_register(db, 'Assets:Checking', date_from, date_to))
+
+
+def test_analyze(tmp_path):
+    db, db_file = _setup_posts(tmp_path)
+    budget_path = tmp_path / 'budget.yaml'
+    budget_path.write_text("date_from: 01/01/2019\n"
+                           "date_to:   31/03/2019\n"
+                           "items:\n"
+                           "    'Expenses': 3000\n"
+                           "    'Expenses:Food': 1000\n", encoding='utf-8')
+
+    summary_args = ['-m', '03/2019', '-d', '2']
+    register_args = ['Assets:Checking', '--from', '01/06/2019', '--to', '30/06/2019']
+    expected_summary = invoke_cmd(db_file, ['transaction', 'summary'] + summary_args).output
+    expected_register = invoke_cmd(db_file, ['account', 'register'] + register_args).output
+    expected_budget = invoke_cmd(db_file, ['budget', 'progress', str(budget_path)]).output
+
+    res = invoke_cmd(db_file, ['analyze', 'summary'] + summary_args)
+    assert res.exit_code == 0, res.output
+    assert res.output == expected_summary
+
+    commands = [f"register {' '.join(register_args)}", f"budget '{budget_path}'", "nope", "quit"]
+    res = invoke_cmd(db_file, ['analyze'], input='\n'.join(commands) + '\n')
+    assert res.exit_code == 0, res.output
+    assert "Loaded 400 posts of 5 accounts." in res.output
+    assert expected_register in res.output
+    assert expected_budget in res.output
+    assert "No such command 'nope'." in res.output
+
+
+def test_analyze_register_checks_account(tmp_path):
+    db, db_file = _setup_posts(tmp_path)
+    with orm.db_session:
+        db.Account(name='Assets:Savings')  # no posts
+
+    for name, exit_code in (('Assets:Savings', 0), ('Assets:Nope', 1)):
+        expected = invoke_cmd(db_file, ['account', 'register', name])
+        res = invoke_cmd(db_file, ['analyze', 'register', name])
+        assert (res.exit_code, expected.exit_code) == (exit_code, exit_code), res.output
+        assert res.output.splitlines()[-1] == expected.output.splitlines()[-1]
@@ -0,0 +1,97 @@
+from datetime import date
+from decimal import Decimal
+
+from pony import orm
+
+from abcli.commands.balance import verify_balances
+from abcli.commands.test import setup_db, invoke_cmd, query_budget
+from abcli.utils.bulk import BulkWriter
+
+
+def _post(db, account, amount, date_resolved):
+    db.Transaction.from_posts([(db.Account[account], amount, date_resolved, date_resolved)])
+
+
+def test_verify(tmp_path):
+    orm.set_sql_debug(False)
+    db, db_file = setup_db(tmp_path)
+
+    with orm.db_session:
+        db.Account(name='Assets:Checking')
+        db.Account(name='Assets:Savings')
+        _post(db, 'Assets:Checking', 100, date(2019, 1, 5))
+        _post(db, 'Assets:Checking', -30, date(2019, 3, 10))
+        _post(db, 'Assets:Checking', -20, date(2019, 4, 20))
+        _post(db, 'Assets:Savings', 50, date(2019, 2, 1))
+        db.Balance(account='Assets:Checking', amount=70, date_eod=date(2019, 4, 15))
+        db.Balance(account='Assets:Savings', amount=40, date_eod=date(2019, 2, 28))
+
+    res = invoke_cmd(db_file, ['balance', 'verify'])
+    assert res.exit_code == 1, res.output
+    assert "Assets:Checking  $70.00  $70.00  OK" in res.output
+    assert "Assets:Savings   $40.00  $50.00  drift -$10.00" in res.output
+    assert "1/2 balances match posts." in res.output
+
+    res = invoke_cmd(db_file, ['balance', 'verify', 'Assets:Checking'])
+    assert res.exit_code == 0, res.output
+
+    with orm.db_session:
+        assert orm.select((c.date, c.amount) for c in db.BalanceCheckpoint
+                          if c.account == 'Assets:Checking').order_by(1)[:] == [
+            (date(2019, 1, 31), 100), (date(2019, 2, 28), 100), (date(2019, 3, 31), 70)]
+
+    # Checkpoints are kept up to date with posts written through the ORM and in bulk
+    with orm.db_session:
+        _post(db, 'Assets:Checking', 5, date(2019, 2, 1))
+        db.Post.get(amount=-30).delete()
+        writer = BulkWriter(db)
+        writer.add({'min_date_occurred': '12/01/2019', 'max_date_resolved': '12/01/2019',
+                    'description': '', 'ref': '',
+                    'posts': [{'account': 'Assets:Checking', 'amount': '7.00',
+                               'date_occurred': '12/01/2019', 'date_resolved': '12/01/2019'}]})
+        writer.flush()
+
+    with orm.db_session:
+        assert orm.select((c.date, c.amount) for c in db.BalanceCheckpoint
+                          if c.account == 'Assets:Checking').order_by(1)[:] == [
+            (date(2019, 1, 31), 107), (date(2019, 2, 28), 112), (date(2019, 3, 31), 112)]
+        assert verify_balances(db, ['Assets:Checking']) == [
+            ('Assets:Checking', date(2019, 4, 15), Decimal('70.00'), Decimal('112.00'))]
+
+        # Extends existing checkpoints for later balance dates
+        db.Balance['Assets:Checking'].date_eod = date(2019, 6, 1)
+        assert verify_balances(db, ['Assets:Checking'])[0][3] == Decimal('92.00')
+        assert orm.max(c.date for c in db.BalanceCheckpoint if c.account == 'Assets:Checking') == date(2019, 5, 31)
+
+
+def test_posts_written_through_orm_update_sums_once_per_flush(tmp_path):
+    orm.set_sql_debug(False)
+    db, db_file = setup_db(tmp_path)
+    with orm.db_session:
+        db.Account(name='Assets:Checking')
+        _post(db, 'Assets:Checking', 100, date(2019, 1, 5))
+        db.Balance(account='Assets:Checking', amount=100, date_eod=date(2019, 2, 15))
+    assert invoke_cmd(db_file, ['balance', 'verify']).exit_code == 0
+
+    with query_budget(100, db) as statements:
+        with orm.db_session:
+            for day in range(1, 21):
+                _post(db, 'Assets:Checking', 1, date(2019, 1, day))
+    lookups = [sql for sql in statements if sql.lstrip().startswith('SELECT')
+               and ('"MonthlySum"' in sql or '"BalanceCheckpoint"' in sql)]
+    assert len(lookups) == 2, lookups
+
+    with orm.db_session:
+        assert orm.select((m.month_resolved, m.amount) for m in db.MonthlySum
+                          if m.account == 'Assets:Checking')[:] == [(date(2019, 1, 1), 120)]
+        assert orm.select((c.date, c.amount) for c in db.BalanceCheckpoint
+                          if c.account == 'Assets:Checking').order_by(1)[:] == [
+            (date(2019, 1, 31), 120)]
+
+
+def test_verify_unknown_account(tmp_path):
+    orm.set_sql_debug(False)
+    db, db_file = setup_db(tmp_path)
+    res = invoke_cmd(db_file, ['balance', 'verify', 'Assets:Nope'])
+    assert res.exit_code == 1
+    assert "Account 'Assets:Nope' does not exist." in res.output
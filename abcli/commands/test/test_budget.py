@@ -1,8 +1,9 @@
+import pytest
 from pony import orm
 from datetime import date
 
 from abcli.commands.budget import load_budget_yaml, get_format_tuples
-from abcli.commands.test import setup_db
+from abcli.commands.test import setup_db, invoke_cmd, query_budget
 from abcli.utils import Date
 
 
@@ -39,3 +40,74 @@ def test_budget_progress(tmp_path):
                              Date(2019, 1, 3), Date(2019, 1, 8), False) == \
            [('Income', "-$100.00", "", "-$30.00", "30.00%"), ('Expenses', "$200.00", "", "$30.00", "15.00%"),
             ('Assets', "", "", "", ""), ("Liabilities", "", "", "", "")]
+
+
+def test_budget_progress_rolls_up_sub_accounts(tmp_path):
+    db, db_file = setup_db(tmp_path)
+
+    with orm.db_session:
+        checking = db.Account(name='Assets:Checking')
+        food = db.Account(name='Expenses:Food')
+        restaurant = db.Account(name='Expenses:Food:Restaurant')
+        rent = db.Account(name='Expenses:Rent')
+        for account, amount in ((food, 10), (restaurant, 20), (rent, 300)):
+            db.Transaction.from_posts([
+                (checking, -amount, Date(2019, 1, 3), Date(2019, 1, 4)),
+                (account, amount, Date(2019, 1, 3), Date(2019, 1, 4)),
+            ])
+
+    assert get_format_tuples(db, {'Expenses': 400, 'Expenses:Food': 100},
+                             Date(2019, 1, 1), Date(2019, 1, 31), False) == \
+           [('Income', "", "", "", ""),
+            ('Expenses', "$500.00", "", "$330.00", "66.00%"),
+            ('└── Food', "$100.00", "20.00%", "$30.00", "30.00%"),
+            ('Assets', "", "", "", ""), ("Liabilities", "", "", "", "")]
+
+
+def test_budget_progress_csv(tmp_path):
+    orm.set_sql_debug(False)
+    db, db_file = setup_db(tmp_path)
+    budget_path = tmp_path / 'budget.yaml'
+    budget_path.write_text("date_from: 01/01/2019\n"
+                           "date_to:   31/01/2019\n"
+                           "items:\n"
+                           "    'Expenses:Food': 100\n", encoding='utf-8')
+
+    with orm.db_session:
+        db.Transaction.from_posts([
+            (db.Account(name='Assets:Checking'), -25, Date(2019, 1, 3), Date(2019, 1, 4)),
+            (db.Account(name='Expenses:Food'), 25, Date(2019, 1, 3), Date(2019, 1, 4)),
+        ])
+
+    with query_budget(2, db):
+        res = invoke_cmd(db_file, ['--format', 'csv', 'budget', 'progress', str(budget_path)], db=db)
+    assert res.exit_code == 0, res.output
+    assert res.output.splitlines() == [
+        "account,budgeted,share_of_parent,consumed,progress",
+        "Expenses,100.00,,25.00,0.25",
+        "Expenses:Food,100.00,1.0,25.00,0.25",
+    ]
+
+
+@pytest.mark.parametrize('num_transactions', [1, 50])
+def test_budget_progress_query_count(tmp_path, num_transactions):
+    orm.set_sql_debug(False)
+    db, db_file = setup_db(tmp_path)
+    budget_path = tmp_path / 'budget.yaml'
+    budget_path.write_text("date_from: 01/01/2019\n"
+                           "date_to:   20/02/2019\n"
+                           "items:\n"
+                           "    'Expenses:Category1': 100\n"
+                           "    'Expenses:Category2': 200\n", encoding='utf-8')
+
+    with orm.db_session:
+        checking = db.Account(name='Assets:Checking')
+        categories = [db.Account(name=f'Expenses:Category{idx}') for idx in range(5)]
+        for idx in range(num_transactions):
+            day = Date(2019, 1 + idx % 2, 1 + idx % 28)
+            db.Transaction.from_posts([(checking, -idx - 1, day, day), (categories[idx % 5], idx + 1, day, day)])
+
+    # Monthly sums of whole months, and posts of the rest of the period
+    with query_budget(2, db):
+        res = invoke_cmd(db_file, ['budget', 'progress', str(budget_path)], db=db)
+    assert res.exit_code == 0, res.output
@@ -0,0 +1,39 @@
+from datetime import date
+
+from pony import orm
+
+from abcli.commands.test import setup_db, invoke_cmd
+
+
+def test_migrate(tmp_path):
+    orm.set_sql_debug(False)
+    db, db_file = setup_db(tmp_path)
+
+    # Simulate a database created before the post indexes and account closure table existed
+    with orm.db_session(ddl=True):
+        account = db.Account(name='A:B')
+        db.Post(account=account, amount=5, date_occurred=date(2019, 1, 31), date_resolved=date(2019, 2, 1))
+        db.Post(account=account, amount=7, date_occurred=date(2019, 1, 2), date_resolved=date(2019, 2, 3))
+        orm.flush()
+        db.execute('DROP INDEX "idx_post__date_resolved_date_occurred_account"')
+        db.execute('DROP INDEX "idx_post__account_date_resolved_date_occurred"')
+        db.execute('DROP TABLE "AccountPath"')
+        db.execute('DROP TABLE "MonthlySum"')
+
+    res = invoke_cmd(db_file, ['db', 'migrate'])
+    assert res.exit_code == 0, res.output
+    assert "Index idx_post__date_resolved_date_occurred_account" in res.output
+    assert "Index idx_post__account_date_resolved_date_occurred" in res.output
+    assert "Table AccountPath" in res.output
+
+    with orm.db_session:
+        indexes = db.select("name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'Post'")
+        assert {'idx_post__date_resolved_date_occurred_account', 'idx_post__account_date_resolved_date_occurred'} \
+            <= set(indexes)
+        assert set(db.select('ancestor FROM "AccountPath"')) == {'A', 'A:B'}
+        assert orm.select((m.account, m.month_occurred, m.month_resolved, m.amount) for m in db.MonthlySum)[:] == \
+            [('A:B', date(2019, 1, 1), date(2019, 2, 1), 12)]
+
+    res = invoke_cmd(db_file, ['db', 'migrate'])
+    assert res.exit_code == 0, res.output
+    assert "Database schema is up to date." in res.output
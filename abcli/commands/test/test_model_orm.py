@@ -1,6 +1,9 @@
+import pytest
 from pony import orm
 
-from abcli.model import init_orm
+from abcli.model import init_orm, get_schema_version, migrate_missing_tables, SCHEMA_VERSION, \
+    _populate_account_paths
+from abcli.utils.cache import SchemaVersionCache
 
 
 def test_todictrepr():
@@ -22,3 +25,92 @@ def test_todictrepr():
             'balance': None,
             'posts': {}
         }
+
+
+def test_account_paths():
+    db = orm.Database(provider='sqlite', filename=':memory:', create_db=True)
+    init_orm(db)
+
+    def _paths():
+        return set(orm.select((ap.ancestor, ap.descendant, ap.depth) for ap in db.AccountPath))
+
+    with orm.db_session:
+        db.Account(name='A:B')
+        db.Account(name='A:BC')
+    with orm.db_session:
+        assert _paths() == {('A', 'A:B', 1), ('A:B', 'A:B', 2), ('A', 'A:BC', 1), ('A:BC', 'A:BC', 2)}
+
+        db.Account['A:B'].delete()
+    with orm.db_session:
+        assert _paths() == {('A', 'A:BC', 1), ('A:BC', 'A:BC', 2)}
+
+    with orm.db_session:
+        db.AccountPath.select().delete(bulk=True)
+    _populate_account_paths(db)
+    with orm.db_session:
+        assert _paths() == {('A', 'A:BC', 1), ('A:BC', 'A:BC', 2)}
+
+
+def test_init_orm_migrates_on_schema_version_mismatch(tmp_path):
+    db_file = str(tmp_path / 'tmp.db')
+    db = orm.Database(provider='sqlite', filename=db_file, create_db=True)
+    init_orm(db)
+    assert get_schema_version(db) == SCHEMA_VERSION
+
+    with orm.db_session:
+        db.execute('DROP INDEX "idx_post__date_resolved_date_occurred_account"')
+
+    def _has_index():
+        with orm.db_session:
+            return 'idx_post__date_resolved_date_occurred_account' in \
+                   db.select("name FROM sqlite_master WHERE type = 'index'")
+
+    # Schema is current: no DDL checks
+    db = orm.Database(provider='sqlite', filename=db_file)
+    init_orm(db)
+    assert not _has_index()
+
+    with orm.db_session:
+        db.SchemaVersion.select().delete(bulk=True)
+    db = orm.Database(provider='sqlite', filename=db_file)
+    init_orm(db)
+    assert _has_index()
+    assert get_schema_version(db) == SCHEMA_VERSION
+
+
+def test_init_orm_schema_cache(tmp_path):
+    db_file = str(tmp_path / 'tmp.db')
+    schema_cache = SchemaVersionCache({'filename': db_file}, tmp_path / 'schema-versions.json')
+    assert schema_cache.get() is None
+
+    db = orm.Database(provider='sqlite', filename=db_file, create_db=True)
+    init_orm(db, schema_cache=schema_cache)
+    assert schema_cache.get() == SCHEMA_VERSION
+    assert db_file not in (tmp_path / 'schema-versions.json').read_text()
+
+    # The database isn't consulted when the cache says the schema is current
+    with orm.db_session:
+        db.SchemaVersion.select().delete(bulk=True)
+    db = orm.Database(provider='sqlite', filename=db_file)
+    init_orm(db, schema_cache=schema_cache)
+    assert get_schema_version(db) == 0
+
+
+def test_migrate_missing_tables(tmp_path):
+    db_file = str(tmp_path / 'tmp.db')
+    schema_cache = SchemaVersionCache({'filename': db_file}, tmp_path / 'schema-versions.json')
+    schema_cache.set(SCHEMA_VERSION)
+
+    # Recreated since its schema was cached
+    db = orm.Database(provider='sqlite', filename=db_file, create_db=True)
+    assert init_orm(db, schema_cache=schema_cache)
+    with pytest.raises(orm.DatabaseError) as excinfo:
+        with orm.db_session:
+            db.Account.select()[:]
+
+    assert not migrate_missing_tables(db, schema_cache, ValueError("no such table: Account"))
+    assert migrate_missing_tables(db, schema_cache, excinfo.value)
+    with orm.db_session:
+        assert db.Account.select()[:] == []
+    assert get_schema_version(db) == SCHEMA_VERSION
+    assert schema_cache.get() == SCHEMA_VERSION
@@ -0,0 +1,114 @@
+import io
+import re
+import threading
+
+import click
+import pytest
+from pony import orm
+
+from abcli.client import request, socket_path
+from abcli.commands.csv.classify import CONFIG_RULEBOOK_KEY
+from abcli.commands.serve import make_server
+from abcli.commands.test import setup_db, invoke_cmd
+from abcli.utils import Date
+from abcli.utils.cache import user_cache_dir
+
+
+@pytest.fixture
+def served(tmp_path):
+    orm.set_sql_debug(False)
+    db, db_file = setup_db(tmp_path)
+    with orm.db_session:
+        checking, food = db.Account(name='Assets:Checking'), db.Account(name='Expenses:Food')
+        db.Transaction.from_posts([(checking, -10, Date(2019, 1, 1), Date(2019, 1, 2)),
+                                   (food, 10, Date(2019, 1, 1), Date(2019, 1, 2))])
+
+    path = str(tmp_path / 'abcli.sock')
+    server = make_server(db, path, {CONFIG_RULEBOOK_KEY: str(tmp_path / 'rulebook.yaml')})
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    def run(*argv):
+        stdout, stderr = io.BytesIO(), io.BytesIO()
+        status = request(list(argv), stdout, stderr, path=path)
+        return status, stdout.getvalue().decode('utf-8'), stderr.getvalue().decode('utf-8')
+
+    yield db_file, run, path
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_serve(served, tmp_path, monkeypatch):
+    db_file, run, _ = served
+    (tmp_path / 'budget.yaml').write_text("date_from: 01/01/2019\n"
+                                          "date_to:   31/01/2019\n"
+                                          "items:\n"
+                                          "    'Expenses:Food': 20\n")
+    monkeypatch.chdir(tmp_path)  # the budget path is relative to the client's directory
+
+    for argv in (['transaction', 'summary', '-m', '01/2019'], ['--format', 'csv', 'transaction', 'show'],
+                 ['budget', 'progress', 'budget.yaml']):
+        status, stdout, stderr = run(*argv)
+        res = invoke_cmd(db_file, argv)
+        assert (status, stdout, stderr) == (res.exit_code, res.output, ''), argv
+
+    # Errors are logged once, as when run directly
+    argv = ['account', 'register', 'Expenses:Nothing']
+    status, stdout, stderr = run(*argv)
+    res = invoke_cmd(db_file, argv)
+    assert res.exit_code == 1
+    assert (status, stdout, stderr) == (res.exit_code, '', res.output)
+
+    status, _, stderr = run('transaction', 'summary', '--no-such-option')
+    assert status == 2
+    assert "no such option" in stderr
+
+    # The server keeps serving after failed commands
+    assert run('transaction', 'summary', '-m', '01/2019')[0] == 0
+
+    status, stdout, _ = run('transaction', '--help')
+    assert status == 0 and "summary" in stdout
+
+
+def test_serve_config(served, tmp_path):
+    _, run, _ = served
+    (tmp_path / 'rulebook.yaml').write_text("keyword:\n"
+                                            "    dinner: 'Expenses:Food'\n", encoding='utf-8')
+    csvpath = tmp_path / 'txns.csv'
+    csvpath.write_text('date_occurred,date_resolved,amount,description,balance,this,that_auto,that_overwrite,ref\n'
+                       '01/01/2019,01/01/2019,-1,Dinner,0,Assets:Checking,,,\n', encoding='utf-8')
+
+    # The rulebook is the one in the server's config
+    status, stdout, stderr = run('csv', 'classify', '--no-cache', str(csvpath))
+    assert status == 0, stderr
+    assert "1/1 classified (100%)" in stdout
+
+
+def test_socket_path(tmp_path, monkeypatch):
+    monkeypatch.delenv('ABCLI_SOCKET', raising=False)
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path / 'run'))
+    assert socket_path() == str(tmp_path / 'run' / 'abcli.sock')
+
+    monkeypatch.delenv('XDG_RUNTIME_DIR')
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    assert socket_path() == str(user_cache_dir() / 'abcli.sock')
+
+    monkeypatch.setenv('ABCLI_SOCKET', str(tmp_path / 'abcli.sock'))
+    assert socket_path() == str(tmp_path / 'abcli.sock')
+
+
+def test_serve_socket_in_use(served):
+    _, _, path = served
+    with pytest.raises(click.UsageError, match="already listening"):
+        make_server(None, path)
+
+
+def test_serve_profile(served):
+    _, run, _ = served
+    for _ in range(2):
+        status, stdout, stderr = run('--profile', 'transaction', 'summary', '-m', '01/2019')
+        assert status == 0
+        assert "Profile:" in stderr and "Profile:" not in stdout
+        # Only the statements of this command are counted
+        assert re.search(r"^SQL: [1-9]\d? statements", stderr, re.MULTILINE), stderr
@@ -1,9 +1,19 @@
-from datetime import date
+import json
+import random
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
 
+import pytest
 from pony import orm
 
-from abcli.commands.transaction import get_posts_between_period
+from abcli.commands import transaction
+from abcli.commands.transaction import get_posts_between_period, get_account_sums
+from abcli.commands.test import setup_db, invoke_cmd, query_budget
 from abcli.model import init_orm
+from abcli.utils import format_date, month_start, month_end
+from abcli.utils.bulk import BulkWriter
+from abcli.utils.cents import to_cents
 
 
 def test_get_posts_between_period():
@@ -34,3 +44,412 @@ def test_get_posts_between_period():
         assert not captured_post(date(2019, 1, 3), date(2019, 1, 3), False)
         assert captured_post(date(2019, 1, 3), date(2019, 1, 3), True)
 
+
+def test_import(tmp_path):
+    db, db_file = setup_db(tmp_path)
+    csvpath = tmp_path / 'txns.csv'
+    csvpath.write_text(
+        "date_occurred,date_resolved,amount,description,balance,this,that_auto,that_overwrite,ref\n"
+        "05/01/2019,06/01/2019,-20.00,Dinner,80.00,Assets:Checking,Expenses:Food,,\n"
+        "02/01/2019,03/01/2019,-52.50,Group Dine Out,100.00,Assets:Checking,,"
+        "\"{'Expenses:Food': 15.00, 'Assets:Lent': 37.50}\",@dinout\n"
+        "04/01/2019,04/01/2019,37.50,Payback,152.50,Assets:Checking,Assets:Lent,,@dinout\n", encoding='utf-8')
+
+    res = invoke_cmd(db_file, ['transaction', 'import', str(csvpath)])
+    assert res.exit_code == 0, res.output
+    assert "Imported 2 transactions (7 posts)" in res.output
+
+    with orm.db_session:
+        assert set(orm.select(a.name for a in db.Account)) == {'Assets:Checking', 'Assets:Lent', 'Expenses:Food'}
+        assert db.Balance['Assets:Checking'].amount == Decimal('80.00')
+        dinout = db.Transaction.get(ref='@dinout')
+        assert dinout.min_date_occurred == date(2019, 1, 2)
+        assert dinout.max_date_resolved == date(2019, 1, 4)
+        assert len(dinout.posts) == 5
+        assert orm.sum(p.amount for p in db.Post if p.account.name == 'Expenses:Food') == Decimal('35.00')
+        assert orm.sum(p.amount for p in db.Post) == 0
+
+
+def test_import_skips_imported(tmp_path):
+    orm.set_sql_debug(False)
+    db, db_file = setup_db(tmp_path)
+    header = "date_occurred,date_resolved,amount,description,balance,this,that_auto,that_overwrite,ref\n"
+    rows = ["02/01/2019,03/01/2019,-4.00,Coffee,96.00,Assets:Checking,Expenses:Food,,\n",
+            "02/01/2019,03/01/2019,-4.00,Coffee,92.00,Assets:Checking,Expenses:Food,,\n",
+            "05/01/2019,06/01/2019,-20.00,Dinner,72.00,Assets:Checking,Expenses:Food,,\n",
+            "07/01/2019,07/01/2019,-4.00,Coffee,68.00,Assets:Checking,Expenses:Food,,\n",
+            "02/01/2019,03/01/2019,-4.00,Coffee,64.00,Assets:Checking,Expenses:Food,,\n"]
+    first, second = tmp_path / 'first.csv', tmp_path / 'second.csv'
+    first.write_text(header + ''.join(rows[:3]), encoding='utf-8')
+    second.write_text(header + ''.join(rows), encoding='utf-8')
+
+    res = invoke_cmd(db_file, ['transaction', 'import', str(first)])
+    assert res.exit_code == 0, res.output
+    assert "Imported 3 transactions" in res.output
+
+    # The overlapping rows are skipped; a third identical coffee is new
+    res = invoke_cmd(db_file, ['transaction', 'import', str(second)])
+    assert res.exit_code == 0, res.output
+    assert "Imported 2 transactions" in res.output
+    assert "Skipped 3 transactions imported before." in res.output
+
+    res = invoke_cmd(db_file, ['transaction', 'import', str(second)])
+    assert "Imported 0 transactions" in res.output
+    assert "Skipped 5 transactions imported before." in res.output
+
+    with orm.db_session:
+        assert db.Transaction.select().count() == 5
+        assert orm.sum(p.amount for p in db.Post if p.account.name == 'Expenses:Food') == Decimal('36.00')
+
+    # Databases from before fingerprints were recorded have them back-filled
+    with orm.db_session(ddl=True):
+        db.execute('DROP TABLE "ImportFingerprint"')
+    res = invoke_cmd(db_file, ['db', 'migrate'])
+    assert "Table ImportFingerprint" in res.output
+    res = invoke_cmd(db_file, ['transaction', 'import', str(second)])
+    assert "Skipped 5 transactions imported before." in res.output
+
+
+def test_import_after_deleting_transaction(tmp_path):
+    orm.set_sql_debug(False)
+    db, db_file = setup_db(tmp_path)
+    csvpath = tmp_path / 'txns.csv'
+    csvpath.write_text(
+        "date_occurred,date_resolved,amount,description,balance,this,that_auto,that_overwrite,ref\n"
+        "05/01/2019,06/01/2019,-20.00,Dinner,76.00,Assets:Checking,Expenses:Food,,\n"
+        "02/01/2019,03/01/2019,-4.00,Coffee,96.00,Assets:Checking,Expenses:Food,,\n", encoding='utf-8')
+    res = invoke_cmd(db_file, ['transaction', 'import', str(csvpath)])
+    assert "Imported 2 transactions" in res.output
+
+    # Its fingerprint is deleted along with it, so it is imported again
+    with orm.db_session:
+        db.Transaction.get(description='Dinner').delete()
+    res = invoke_cmd(db_file, ['transaction', 'import', str(csvpath)])
+    assert res.exit_code == 0, res.output
+    assert "Imported 1 transactions" in res.output
+    assert "Skipped 1 transactions imported before." in res.output
+    with orm.db_session:
+        assert db.ImportFingerprint.select().count() == 2
+
+
+def test_bulk_writer_counts_identical_transactions_across_batches(tmp_path):
+    db, _ = setup_db(tmp_path)
+    coffee = {'min_date_occurred': '02/01/2019', 'max_date_resolved': '03/01/2019', 'description': 'Coffee',
+              'ref': '', 'posts': [{'account': 'Assets:Checking', 'amount': -4.0, 'date_occurred': '02/01/2019',
+                                    'date_resolved': '03/01/2019'},
+                                   {'account': 'Expenses:Food', 'amount': 4.0, 'date_occurred': '02/01/2019',
+                                    'date_resolved': '03/01/2019'}]}
+
+    def _import(num_coffees):
+        with orm.db_session:
+            # Counts are carried between batches in the database, rather than in memory
+            writer = BulkWriter(db, batch_size=2, skip_imported=True)
+            writer.extend([coffee] * num_coffees)
+            writer.flush()
+            return writer.num_transactions, writer.num_skipped
+
+    assert _import(5) == (5, 0)
+    with orm.db_session:
+        assert sorted(f.fingerprint.split(':')[1] for f in db.ImportFingerprint.select()) == ['1', '2', '3', '4', '5']
+    assert _import(5) == (0, 5)
+    assert _import(6) == (1, 5)
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_import_many(tmp_path, jobs):
+    orm.set_sql_debug(False)
+    db, db_file = setup_db(tmp_path)
+    header = "date_occurred,date_resolved,amount,description,balance,this,that_auto,that_overwrite,ref\n"
+    checking_rows = ["07/01/2019,07/01/2019,-4.00,Coffee,76.00,Assets:Checking,Expenses:Food,,\n",
+                     "05/01/2019,06/01/2019,-20.00,Dinner,80.00,Assets:Checking,Expenses:Food,,\n",
+                     "02/01/2019,03/01/2019,-4.00,Coffee,100.00,Assets:Checking,Expenses:Food,,\n"]
+    statements = tmp_path / 'statements'
+    statements.mkdir()
+    # Exports of the checking account overlapping on the dinner
+    (statements / 'checking-1.csv').write_text(header + ''.join(checking_rows[1:]), encoding='utf-8')
+    (statements / 'checking-2.csv').write_text(header + ''.join(checking_rows[:2]), encoding='utf-8')
+    (statements / 'checking-3.csv').write_text(header, encoding='utf-8')  # e.g. a month without transactions
+    (statements / 'notes.txt').write_text("not a CSV", encoding='utf-8')
+    card = tmp_path / 'card.csv'
+    card.write_text(header +
+                    "03/01/2019,04/01/2019,-52.50,Group Dine Out,-52.50,Liabilities:Card,,"
+                    "\"{'Expenses:Food': 15.00, 'Assets:Lent': 37.50}\",@dinout\n"
+                    "04/01/2019,04/01/2019,37.50,Payback,-15.00,Liabilities:Card,Assets:Lent,,@dinout\n",
+                    encoding='utf-8')
+
+    res = invoke_cmd(db_file, ['transaction', 'import', '--jobs', str(jobs), str(statements), str(card)])
+    assert res.exit_code == 0, res.output
+    assert [line for line in res.output.splitlines() if line.endswith('.csv:')] == \
+           [f"{statements / 'checking-1.csv'}:", f"{statements / 'checking-2.csv'}:", f"{card}:"]
+    assert f"{statements / 'checking-3.csv'}: skipped, as it has no rows." in res.output
+    assert "Imported 4 transactions (11 posts)" in res.output
+    assert "Skipped 1 transactions imported before." in res.output
+
+    with orm.db_session:
+        # Balances are set from each CSV in turn
+        assert db.Balance['Assets:Checking'].amount == Decimal('76.00')
+        assert db.Balance['Assets:Checking'].date_eod == date(2019, 1, 7)
+        assert db.Balance['Liabilities:Card'].amount == Decimal('-52.50')
+        assert orm.sum(p.amount for p in db.Post if p.account.name == 'Expenses:Food') == Decimal('43.00')
+        assert orm.sum(p.amount for p in db.Post) == 0
+
+
+def test_parse_csvs_bounds_csvs_in_flight(tmp_path, monkeypatch):
+    submitted = []
+
+    class _Result:
+        def __init__(self, value):
+            self._value = value
+
+        def get(self):
+            return self._value
+
+    class _Pool:
+        def __init__(self, processes):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            pass
+
+        def apply_async(self, func, args):
+            submitted.append(args[0])
+            return _Result(func(*args))
+
+    monkeypatch.setattr(transaction.multiprocessing, 'Pool', _Pool)
+    csvpaths = []
+    for i in range(6):
+        csvpaths.append(tmp_path / f'{i}.csv')
+        csvpaths[-1].write_text("date_occurred,date_resolved,amount,description,balance,this,that_auto,"
+                                "that_overwrite,ref\n"
+                                f"0{i + 1}/01/2019,0{i + 1}/01/2019,-1.00,Coffee,{i},Assets:Checking,Expenses:Food,,\n",
+                                encoding='utf-8')
+
+    parsed = transaction._parse_csvs(csvpaths, sort=False, jobs=2)
+    for num_consumed, (csvpath, txn_json) in enumerate(parsed, start=1):
+        assert csvpath == csvpaths[num_consumed - 1]
+        assert len(txn_json['transactions']) == 1
+        # The CSV being written, and at most `jobs` parsed ahead of it
+        assert len(submitted) <= num_consumed + 2
+    assert submitted == csvpaths
+
+
+def test_import_no_create_missing(tmp_path):
+    db, db_file = setup_db(tmp_path)
+    csvpath = tmp_path / 'txns.csv'
+    csvpath.write_text(
+        "date_occurred,date_resolved,amount,description,balance,this,that_auto,that_overwrite,ref\n"
+        "05/01/2019,06/01/2019,-20.00,Dinner,80.00,Assets:Checking,Expenses:Food,,\n", encoding='utf-8')
+
+    res = invoke_cmd(db_file, ['transaction', 'import', '--no-create-missing', str(csvpath)])
+    assert res.exit_code == 1
+
+    with orm.db_session:
+        assert db.Transaction.select().count() == 0
+
+
+def test_summary(tmp_path):
+    orm.set_sql_debug(False)
+    db, db_file = setup_db(tmp_path)
+
+    with orm.db_session:
+        checking = db.Account(name='Assets:Checking')
+        for name, amount in (('Expenses:Food:Restaurant', 20), ('Expenses:Food:Grocery', 30), ('Expenses:Rent', 50)):
+            db.Transaction.from_posts([
+                (checking, -amount, date(2019, 1, 3), date(2019, 1, 4)),
+                (db.Account(name=name), amount, date(2019, 1, 3), date(2019, 1, 4)),
+            ])
+
+    # Monthly sums of the whole month, and posts of the rest of the period
+    with query_budget(2, db):
+        res = invoke_cmd(db_file, ['transaction', 'summary', '-m', '01/2019', '-d', '2', '-a', 'Expenses'], db=db)
+    assert res.exit_code == 0, res.output
+    assert res.output.splitlines()[2:] == [
+        "Income          $0.00",
+        "Expenses      $100.00",
+        "├── Food       $50.00         50.00%",
+        "└── Rent       $50.00         50.00%",
+        "Assets          $0.00",
+        "Liabilities     $0.00",
+    ]
+
+
+def test_summary_parent_summing_to_zero(tmp_path):
+    orm.set_sql_debug(False)
+    db, db_file = setup_db(tmp_path)
+
+    with orm.db_session:
+        food = db.Account(name='Expenses:Food')
+        db.Transaction.from_posts([(db.Account(name='Expenses:Refunds'), -20, date(2019, 1, 3), date(2019, 1, 4)),
+                                   (food, 20, date(2019, 1, 3), date(2019, 1, 4))])
+
+    res = invoke_cmd(db_file, ['transaction', 'summary', '-m', '01/2019', '-a', 'Expenses'])
+    assert res.exit_code == 0, res.output
+    assert res.output.splitlines()[3:6] == [
+        "Expenses        $0.00",
+        "├── Food       $20.00",
+        "└── Refunds   -$20.00",
+    ]
+
+
+def test_show(tmp_path):
+    orm.set_sql_debug(False)
+    db, db_file = setup_db(tmp_path)
+
+    with orm.db_session:
+        checking = db.Account(name='Assets:Checking')
+        food = db.Account(name='Expenses:Food')
+        rent = db.Account(name='Expenses:Rent')
+        db.Transaction.from_posts([(checking, -20, date(2019, 1, 5), date(2019, 1, 6)),
+                                   (food, 20, date(2019, 1, 5), date(2019, 1, 6))]).description = 'Dinner'
+        db.Transaction.from_posts([(checking, -50, date(2019, 1, 3), date(2019, 1, 4)),
+                                   (rent, 50, date(2019, 1, 3), date(2019, 1, 4))]).description = 'Rent'
+        db.Transaction.from_posts([(checking, -7, date(2019, 2, 3), date(2019, 2, 4)),
+                                   (food, 7, date(2019, 2, 3), date(2019, 2, 4))]).description = 'Lunch'
+
+    # Transactions with their posts in one query (in a transaction, as it is raw SQL)
+    with query_budget(2, db):
+        res = invoke_cmd(db_file, ['transaction', 'show', '-m', '01/2019', '-a', 'Expenses'], db=db)
+    assert res.exit_code == 0, res.output
+    descriptions = [line for line in res.output.splitlines() if 'description' in line]
+    assert descriptions == ["  description: Rent", "  description: Dinner"]
+    assert "    Expenses:Food    $20.00" in res.output
+
+
+def test_show_and_summary_formats(tmp_path):
+    orm.set_sql_debug(False)
+    db, db_file = setup_db(tmp_path)
+
+    with orm.db_session:
+        checking = db.Account(name='Assets:Checking')
+        food = db.Account(name='Expenses:Food')
+        txn = db.Transaction.from_posts([(checking, -20.5, date(2019, 1, 5), date(2019, 1, 6)),
+                                         (food, 20.5, date(2019, 1, 5), date(2019, 1, 6))])
+        txn.description = 'Dinner, again'
+        uid = txn.uid
+
+    with query_budget(2, db):
+        res = invoke_cmd(db_file, ['--format', 'csv', 'transaction', 'show', '-m', '01/2019'], db=db)
+    assert res.exit_code == 0, res.output
+    assert res.output.splitlines() == [
+        "uid,ref,description,min_date_occurred,max_date_resolved,account,amount,date_occurred,date_resolved",
+        f'{uid},,"Dinner, again",2019-01-05,2019-01-06,Assets:Checking,-20.50,2019-01-05,2019-01-06',
+        f'{uid},,"Dinner, again",2019-01-05,2019-01-06,Expenses:Food,20.50,2019-01-05,2019-01-06',
+    ]
+
+    with query_budget(2, db):
+        res = invoke_cmd(db_file, ['--format', 'jsonl', 'transaction', 'summary', '-m', '01/2019'], db=db)
+    assert res.exit_code == 0, res.output
+    records = [json.loads(line) for line in res.output.splitlines()]
+    assert {'account': 'Expenses:Food', 'amount': 20.5, 'share_of_parent': 1.0} in records
+    assert {'account': 'Income', 'amount': 0, 'share_of_parent': None} in records
+
+
+def test_query_budget(tmp_path):
+    db, _ = setup_db(tmp_path)
+    with query_budget(1, db) as statements:
+        with orm.db_session:
+            orm.select(a for a in db.Account)[:]
+    assert len(statements) == 1
+
+    with pytest.raises(AssertionError, match="SQL statements executed, over the budget of 1"):
+        with query_budget(1, db):
+            with orm.db_session:
+                db.Account(name='Assets:Checking')
+                orm.commit()
+                orm.select(a for a in db.Account)[:]
+
+
+@pytest.mark.parametrize('num_transactions', [1, 50])
+def test_show_and_summary_query_counts(tmp_path, num_transactions):
+    orm.set_sql_debug(False)
+    db, db_file = setup_db(tmp_path)
+
+    with orm.db_session:
+        checking = db.Account(name='Assets:Checking')
+        categories = [db.Account(name=f'Expenses:Category{idx}') for idx in range(5)]
+        for idx in range(num_transactions):
+            day = date(2019, 1, 1 + idx % 28)
+            db.Transaction.from_posts([(checking, -idx - 1, day, day), (categories[idx % 5], idx + 1, day, day)])
+
+    # As many statements however many transactions, posts and accounts there are
+    for args, max_statements in ((['transaction', 'show', '-m', '01/2019', '-v'], 2),
+                                 (['transaction', 'show', '-m', '01/2019', '-a', 'Expenses'], 2),
+                                 (['transaction', 'summary', '-m', '01/2019'], 2),
+                                 (['transaction', 'summary', '--from', '02/01/2019', '--to', '20/01/2019'], 1)):
+        with query_budget(max_statements, db):
+            res = invoke_cmd(db_file, args, db=db)
+        assert res.exit_code == 0, res.output
+
+
+def test_get_account_sums_subtree():
+    db = orm.Database(provider='sqlite', filename=':memory:', create_db=True)
+    init_orm(db)
+
+    with orm.db_session:
+        for name, amount in (('Expenses', 1), ('Expenses:Food', 2), ('Expenses:Food:Grocery', 4),
+                             ('Expenses:FoodTruck', 8)):
+            db.Post(date_occurred=date(2019, 1, 2), date_resolved=date(2019, 1, 4),
+                    account=db.Account(name=name), amount=amount)
+
+        date_from, date_to = date(2019, 1, 1), date(2019, 1, 31)
+        assert get_account_sums(db, date_from, date_to, account='Expenses:Food') == {
+            'Expenses:Food': 200, 'Expenses:Food:Grocery': 400
+        }
+        assert get_account_sums(db, date_from, date_to, depth=2) == {
+            'Expenses': 100, 'Expenses:Food': 600, 'Expenses:FoodTruck': 800
+        }
+
+
+def test_get_account_sums_matches_posts():
+    db = orm.Database(provider='sqlite', filename=':memory:', create_db=True)
+    init_orm(db)
+    rand = random.Random(42)
+    names = ['Expenses:Food', 'Expenses:Food:Grocery', 'Expenses:Rent', 'Income']
+
+    def _rand_dates():
+        date_occurred = date(2019, 1, 1) + timedelta(days=rand.randrange(365))
+        return date_occurred, date_occurred + timedelta(days=rand.randrange(5))
+
+    with orm.db_session:
+        for name in names:
+            db.Account(name=name)
+        for _ in range(100):
+            date_occurred, date_resolved = _rand_dates()
+            db.Post(account=db.Account[rand.choice(names)], amount=rand.randrange(-500, 500),
+                    date_occurred=date_occurred, date_resolved=date_resolved)
+        writer = BulkWriter(db)
+        for _ in range(100):
+            date_occurred, date_resolved = _rand_dates()
+            amount = rand.randrange(-500, 500) / 4
+            writer.add({'min_date_occurred': format_date(date_occurred),
+                        'max_date_resolved': format_date(date_resolved), 'description': '', 'ref': '',
+                        'posts': [{'account': rand.choice(names), 'amount': amount,
+                                   'date_occurred': format_date(date_occurred),
+                                   'date_resolved': format_date(date_resolved)},
+                                  {'account': 'Income', 'amount': -amount,
+                                   'date_occurred': format_date(date_occurred),
+                                   'date_resolved': format_date(date_resolved)}]})
+        writer.flush()
+
+    with orm.db_session:
+        posts = db.Post.select()[:]
+        for post in posts[:10]:
+            post.date_resolved += timedelta(days=40)
+            post.amount += 1
+        for post in posts[10:20]:
+            post.delete()
+
+    with orm.db_session:
+        for _ in range(20):
+            date_from, date_to = sorted([date(2019, 1, 1) + timedelta(days=rand.randrange(400)) for _ in range(2)])
+            if rand.random() < 0.5:
+                date_from, date_to = month_start(date_from), month_end(date_to)
+            for include_nonresolved in (False, True):
+                expected = defaultdict(Decimal)
+                for post in get_posts_between_period(db, date_from, date_to, include_nonresolved):
+                    expected[post.account.name] += post.amount
+                sums = get_account_sums(db, date_from, date_to, include_nonresolved)
+                assert {k: v for k, v in sums.items() if v} == {k: to_cents(v) for k, v in expected.items() if v}
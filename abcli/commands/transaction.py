@@ -1,11 +1,13 @@
 import logging
+import collections
 import csv
+import itertools
+import multiprocessing
 from typing import *
-import uuid
+import time
 from pathlib import Path
-from collections import defaultdict
-from datetime import datetime as DateTime
-import calendar
+from datetime import datetime as DateTime, timedelta as TimeDelta
+from decimal import Decimal
 
 import click
 from pony import orm
@@ -14,11 +16,15 @@ import tabulate as tabulate_mod
 from tabulate import tabulate
 
 from abcli.utils import (
-    Date, format_date, parse_date, format_monetary,
+    Date, format_date, parse_date, format_monetary, month_start, month_end,
     error_exit_on_exception, DateType
 )
 from abcli.model import ACCOUNT_TYPES
 from abcli.utils import AccountTree
+from abcli.utils.bulk import BulkWriter, iter_rows, sql_placeholder
+from abcli.utils.cents import CentsSums, from_cents
+from abcli.utils.output import get_output_format, write_records
+from abcli.utils.profiling import phase
 from abcli.commands import balance as mod_balance
 from abcli.commands.csv import csv2json
 from abcli.utils.click import PathType
@@ -31,12 +37,34 @@ def cli():
     pass
 
 
+def period_options(fnc):
+    """Options of the period of a report: --date-from and --date-to, or --month (see `get_period`)."""
+    fnc = click.option('--month', '-m', type=click.DateTime(("%m/%Y",)))(fnc)
+    fnc = click.option('--date-to', '--to', '-t', type=DateType(), default=format_date(Date.today()),
+                       help="Summarise transactions to specified date (inclusive); default to today.")(fnc)
+    fnc = click.option('--date-from', '--from', '-f', type=DateType(), default=format_date(Date.fromtimestamp(0)),
+                       help="Summarise transactions from specified date (inclusive); default to Epoch.")(fnc)
+    return fnc
+
+
+def get_period(month: Optional[DateTime], date_from: Date, date_to: Date) -> Tuple[Date, Date]:
+    """The period given by `period_options`: the month if given, or else from and to the dates."""
+    if month:
+        return month_start(month.date()), month_end(month.date())
+    return date_from, date_to
+
+
+def summary_options(fnc):
+    """Options of `transaction summary`, also taken by `analyze summary`."""
+    fnc = click.option('--depth', '-d', type=click.IntRange(min=1, max=10), default=10,
+                       help="Aggregation level on account name")(fnc)
+    fnc = click.option("--include-nonresolved", '-i', is_flag=True, help="Include non-resolved transactions.")(fnc)
+    fnc = click.option('--account', '-a', help="Only include transactions that involve a specific account.")(fnc)
+    return period_options(fnc)
+
+
 @cli.command('show')
-@click.option('--date-from', '--from', '-f', type=DateType(), default=format_date(Date.fromtimestamp(0)),
-              help="Summarise transactions from specified date (inclusive); default to Epoch.")
-@click.option('--date-to', '--to', '-t', type=DateType(), default=format_date(Date.today()),
-              help="Summarise transactions to specified date (inclusive); default to today.")
-@click.option('--month', '-m', type=click.DateTime(("%m/%Y",)))
+@period_options
 @click.option('--account', '-a', help="Show transactions that involve a specific account.")
 @click.option("--include-nonresolved", '-i', is_flag=True, help="Include non-resolved transactions.")
 @click.option('--verbose', '-v', is_flag=True, help="Verbose output; include posts.")
@@ -46,47 +74,59 @@ def cli():
 @error_exit_on_exception
 def cmd_show(db, month: DateTime, date_from: Date, date_to: Date,
              account: str, include_nonresolved: bool, verbose: bool, uid: str):
-    if month:
-        date_from = Date(month.year, month.month, 1)
-        date_to = Date(month.year, month.month, calendar.monthrange(month.year, month.month)[1])
+    date_from, date_to = get_period(month, date_from, date_to)
 
     if uid:
         try:
             txn = db.Transaction[uid]
-            txn_show(txn, verbose)
-            return 0
         except orm.ObjectNotFound:
             raise KeyError(f"Transaction '{uid}' not found.")
-
-    txn_uids_shown = set()
-    query = get_posts_between_period(db, date_from, date_to, include_nonresolved)
-    if account:
-        query = query.filter(lambda post: post.account.name.startswith(account))
-
-    for post in query:
-        txn = post.transaction
-        if txn.uid not in txn_uids_shown:
-            txn_show(txn, verbose)
-            txn_uids_shown.add(txn.uid)
-            click.echo("")
+        txns = [_txn_fields(txn)]
+    else:
+        txns = iter_transactions_between_period(db, date_from, date_to, include_nonresolved, account)
+
+    # Transactions are streamed, so the time of fetching them is accounted to rendering
+    with phase('render'):
+        if get_output_format() == 'table':
+            for txn in txns:
+                _echo_txn(txn, verbose)
+                if not uid:
+                    click.echo("")
+        else:
+            write_records(('uid', 'ref', 'description', 'min_date_occurred', 'max_date_resolved',
+                           'account', 'amount', 'date_occurred', 'date_resolved'),
+                          (txn[:5] + post for txn in txns for post in txn[5]))
+    return 0
 
 
 @orm.db_session
 def txn_show(txn, verbose=True):
-    ref = f"({txn.ref})" if txn.ref else ""
-    click.echo(f"Transaction '{txn.uid}' {ref}:")
-    click.echo(f"  description: {txn.description}")
-    click.echo(f"  min date occurred: {txn.min_date_occurred}")
-    click.echo(f"  max date resolved: {txn.max_date_resolved}")
+    _echo_txn(_txn_fields(txn), verbose)
+
+
+def _txn_fields(txn) -> Tuple:
+    """The fields of a transaction entity as yielded by `iter_transactions_between_period`."""
+    posts = [(post.account.name, post.amount, post.date_occurred, post.date_resolved)
+             for post in txn.posts.order_by(lambda p: p.id)]
+    return txn.uid, txn.ref or '', txn.description or '', txn.min_date_occurred, txn.max_date_resolved, posts
+
+
+def _echo_txn(txn: Tuple, verbose: bool):
+    uid, ref, description, min_date_occurred, max_date_resolved, posts = txn
+    ref = f"({ref})" if ref else ""
+    click.echo(f"Transaction '{uid}' {ref}:")
+    click.echo(f"  description: {description}")
+    click.echo(f"  min date occurred: {min_date_occurred}")
+    click.echo(f"  max date resolved: {max_date_resolved}")
     click.echo(f"  summary:")
-    sum_dic = defaultdict(float)
-    for post in txn.posts:
-        sum_dic[post.account.name] += float(post.amount)
-    click.echo(textwrap.indent(tabulate([[name, format_monetary(amount)] for name, amount in sum_dic.items() if amount != 0.0],
+    sums = CentsSums((account, amount) for account, amount, _, _ in posts)
+    click.echo(textwrap.indent(tabulate([[name, format_monetary(from_cents(cents))] for name, cents in sums.cents().items()
+                                         if cents != 0],
                                          tablefmt="plain"), '    '))
     if verbose:
         click.echo(f"  posts:")
-        table = [[post.account.name, format_monetary(post.amount), post.date_occurred, post.date_resolved] for post in txn.posts]
+        table = [[account, format_monetary(amount), date_occurred, date_resolved]
+                 for account, amount, date_occurred, date_resolved in posts]
         click.echo(textwrap.indent(tabulate(table, headers=('account', 'amount', 'date occurred', 'date resolved'),
                                              tablefmt="simple"), '    '))
 
@@ -94,112 +134,150 @@ def txn_show(txn, verbose=True):
 @cli.command('import')
 @click.option("--create-missing/--no-create-missing", default=True,
               help="Create missing accounts.")
-@click.argument('csvpath', type=PathType(exists=True, dir_okay=False))
+@click.option("--sort/--no-sort", default=False,
+              help="Import transactions of each CSV in order of resolved date; needs to hold all transactions "
+                   "of a CSV in memory.")
+@click.option("-j", "--jobs", type=click.IntRange(min=1), default=1,
+              help="Number of processes to parse CSVs with.")
+@click.argument('csvpaths', nargs=-1, required=True, type=PathType(exists=True))
 @click.pass_obj
 @orm.db_session
 @error_exit_on_exception
-def cmd_import(db, csvpath: Path, create_missing: bool):
-    with csvpath.open('r', encoding='utf-8') as fp:
-        reader = csv.DictReader(fp)
-        rows = list(reader)
-    txn_json = csv2json.process(rows)
-
-    account_names = _collect_account_names(txn_json)
-    _ensure_accounts(db, account_names, create_missing)
-
-    # Update operating account balance
+def cmd_import(db, csvpaths: Tuple[Path], create_missing: bool, sort: bool, jobs: int):
+    """
+    Import classified CSVs, or the CSVs in directories (in order of name).
+
+    Each CSV sets the balance of its operating account, and is committed once imported.
+    """
+    csvpaths = _expand_csv_paths(csvpaths)
+    # Transactions imported before (e.g. from an overlapping export or an interrupted import) are skipped
+    writer = BulkWriter(db, create_missing=create_missing, skip_imported=True)
     ctx: click.Context = click.get_current_context()
-    ctx.invoke(mod_balance.cmd_set, account=txn_json['account'],
-               balance=txn_json['balance']['balance'],
-               date=parse_date(txn_json['balance']['date']))
-
-    for txn in txn_json['transactions']:
-        db.Transaction(
-            uid=str(uuid.uuid4()),
-            min_date_occurred=parse_date(txn['min_date_occurred']),
-            max_date_resolved=parse_date(txn['max_date_resolved']),
-            description=txn['description'],
-            ref=txn['ref'],
-            posts=[db.Post(account=db.Account[post['account']],
-                           amount=float(post['amount']),
-                           date_occurred=parse_date(post['date_occurred']),
-                           date_resolved=parse_date(post['date_resolved']))
-                   for post in txn['posts']]
-        )
-    click.echo(f"Imported {len(txn_json['transactions'])} transactions")
-
-    return 0
-
 
-def _collect_account_names(txn_json: Dict) -> Set[str]:
-    account_names = set()
-    account_names.add(txn_json['account'])
+    start = time.perf_counter()
+    for csvpath, txn_json in _parse_csvs(csvpaths, sort, jobs):
+        if txn_json is None:
+            click.echo(f"{csvpath}: skipped, as it has no rows.")
+            continue
+        if len(csvpaths) > 1:
+            click.echo(f"{csvpath}:")
+        writer.resolve_accounts([txn_json['account']])
+
+        # Update operating account balance
+        ctx.invoke(mod_balance.cmd_set, account=txn_json['account'],
+                   balance=txn_json['balance']['balance'],
+                   date=parse_date(txn_json['balance']['date']))
+
+        writer.start_import()
+        writer.extend(txn_json['transactions'])
+        writer.flush()
+        orm.commit()
+    elapsed = time.perf_counter() - start
+
+    click.echo(f"Imported {writer.num_transactions} transactions ({writer.num_posts} posts) "
+               f"in {elapsed:.2f}s ({writer.num_posts / elapsed if elapsed else 0:.0f} rows/sec)")
+    if writer.num_skipped:
+        click.echo(f"Skipped {writer.num_skipped} transactions imported before.")
 
-    for txn in txn_json['transactions']:
-        for post in txn['posts']:
-            account_names.add(post['account'])
-
-    return account_names
+    return 0
 
 
-@orm.db_session
-def _ensure_accounts(db, account_names, create_missing: bool):
-    for name in account_names:
-        if db.Account.get(name=name) is None:
-            if not create_missing:
-                raise KeyError(f"Account '{name}' not found, and no --create-missing specified.")
-            else:
-                db.Account(name=name)
+def _expand_csv_paths(paths: Iterable[Path]) -> List[Path]:
+    csvpaths = []
+    for path in paths:
+        if path.is_dir():
+            csvpaths.extend(sorted(child for child in path.iterdir() if child.suffix.lower() == '.csv'))
+        else:
+            csvpaths.append(path)
+    return csvpaths
+
+
+def _parse_csvs(csvpaths: List[Path], sort: bool, jobs: int) -> Iterator[Tuple[Path, Optional[dict]]]:
+    """
+    Parses CSVs into transactions (see `csv2json.process_iter`), in input order; CSVs without rows
+    are given as None.
+    In a single process, each CSV's transactions are streamed as they are consumed; with more than one job,
+    CSVs are parsed in a pool of processes while earlier ones are being written, at most `jobs` ahead of the
+    writer, so that memory is bounded by the largest CSVs rather than growing with the input.
+    """
+    if jobs == 1 or len(csvpaths) == 1:
+        for csvpath in csvpaths:
+            # First pass only counts ref groups, so that the second pass can stream rows through
+            with csvpath.open('r', encoding='utf-8') as fp:
+                ref_counts = csv2json.count_refs(csv.DictReader(fp))
+            with csvpath.open('r', encoding='utf-8') as fp:
+                try:
+                    txn_json = csv2json.process_iter(csv.DictReader(fp), ref_counts, sort=sort)
+                except csv2json.NoRowsError:
+                    txn_json = None
+                yield csvpath, txn_json
+        return
+
+    with multiprocessing.Pool(min(jobs, len(csvpaths))) as pool:
+        remaining = iter(csvpaths)
+        pending = collections.deque((csvpath, pool.apply_async(_parse_csv, (csvpath, sort)))
+                                    for csvpath in itertools.islice(remaining, jobs))
+        while pending:
+            csvpath, result = pending.popleft()
+            txn_json = result.get()
+            # Start parsing the next CSV while this one is being written
+            for next_path in itertools.islice(remaining, 1):
+                pending.append((next_path, pool.apply_async(_parse_csv, (next_path, sort))))
+            yield csvpath, txn_json
+
+
+def _parse_csv(csvpath: Path, sort: bool) -> Optional[dict]:
+    # Run in pool processes: the transactions are sent back as a whole, in the same order as streamed
+    with csvpath.open('r', encoding='utf-8') as fp:
+        ref_counts = csv2json.count_refs(csv.DictReader(fp))
+    with csvpath.open('r', encoding='utf-8') as fp:
+        try:
+            txn_json = csv2json.process_iter(csv.DictReader(fp), ref_counts, sort=sort)
+        except csv2json.NoRowsError:
+            return None
+        txn_json['transactions'] = list(txn_json['transactions'])
+    return txn_json
 
 
 @cli.command('summary')
-@click.option('--date-from', '--from', '-f', type=DateType(), default=format_date(Date.fromtimestamp(0)),
-              help="Summarise transactions from specified date (inclusive); default to Epoch.")
-@click.option('--date-to', '--to', '-t', type=DateType(), default=format_date(Date.today()),
-              help="Summarise transactions to specified date (inclusive); default to today.")
-@click.option('--month', '-m', type=click.DateTime(("%m/%Y",)))
-@click.option('--account', '-a', help="Only include transactions that involve a specific account.")
-@click.option("--include-nonresolved", '-i', is_flag=True, help="Include non-resolved transactions.")
-@click.option('--depth', '-d', type=click.IntRange(min=1, max=10), default=10,
-              help="Aggregation level on account name")
+@summary_options
 @click.pass_obj
 @orm.db_session
 @error_exit_on_exception
 def cmd_summary(db, month: DateTime, date_from: Date, date_to: Date, depth: int, account: str, include_nonresolved: bool):
-    if month:
-        date_from = Date(month.year, month.month, 1)
-        date_to = Date(month.year, month.month, calendar.monthrange(month.year, month.month)[1])
-
-    sum_dict = {}
-    query = get_posts_between_period(db, date_from, date_to, include_nonresolved)
-    if account:
-        query = query.filter(lambda post: post.account.name.startswith(account))
-
-    for post in query:
-        name = _account_name_at_depth(post.account.name, depth)
-        sum_dict[name] = sum_dict.get(name, 0.0) + float(post.amount)
+    date_from, date_to = get_period(month, date_from, date_to)
 
-    _show_summary_tree(sum_dict)
+    with phase('query'):
+        sum_dict = get_account_sums(db, date_from, date_to, include_nonresolved, account, depth)
 
+    with phase('render'):
+        show_summary_tree(sum_dict)
 
-def _account_name_at_depth(name: str, depth: int):
-    assert depth >= 1
-    return ':'.join(name.split(':')[:depth])
 
-
-def _show_summary_tree(sum_dict: Dict[str, float], indent=""):
-    def _format_tree(tree):
-        return (format_monetary(tree.amount),
-                f"{tree.amount / tree._parent.amount * 100.00:.2f}%" if tree._parent else "")
-    tuples = []
+def show_summary_tree(sum_dict: Dict[str, int], indent=""):
+    """:param sum_dict: amounts in cents per account"""
+    trees = []
     for acctype in ACCOUNT_TYPES:
         tree = AccountTree(acctype)
-        for acc_name in filter(lambda name: name.startswith(acctype), sum_dict):
+        for acc_name in filter(lambda name: name.startswith(acctype), sorted(sum_dict)):
             tree.add(acc_name, sum_dict[acc_name])
-        # if tree.has_children():
-        #     tuples += tree.get_format_tuples(indent)
+        trees.append(tree)
 
-        tuples += tree.get_format_tuples(callback=_format_tree, indent=indent)
+    if get_output_format() != 'table':
+        def _record(tree):
+            parent = tree._parent
+            return (tree.fullname, from_cents(tree.amount),
+                    tree.amount / parent.amount if parent and parent.amount else None)
+        write_records(('account', 'amount', 'share_of_parent'),
+                      (row[1:] for tree in trees for row in tree.iter_format_tuples(callback=_record)))
+        return
+
+    def _format_tree(tree):
+        return (format_monetary(from_cents(tree.amount)),
+                f"{tree.amount / tree._parent.amount * 100.00:.2f}%" if tree._parent and tree._parent.amount else "")
+    tuples = []
+    for tree in trees:
+        tuples.extend(tree.iter_format_tuples(callback=_format_tree, indent=indent))
 
     print(tabulate(tuples, tablefmt="simple", headers=("account", "amount", "% of parent"),
                    colalign=("left", "right", "right")))
@@ -211,3 +289,124 @@ def get_posts_between_period(db, date_from: Date, date_to: Date, include_nonreso
         return db.Post.select(lambda p: p.date_resolved >= date_from and p.date_occurred <= date_to)
     else:
         return db.Post.select(lambda p: p.date_occurred >= date_from and p.date_resolved <= date_to)
+
+
+def iter_transactions_between_period(db, date_from: Date, date_to: Date, include_nonresolved=False,
+                                     account: str = None) -> Iterator[Tuple]:
+    """
+    Streams transactions having posts in the period, ordered by date, without loading them as entities.
+    Yields (uid, ref, description, min date occurred, max date resolved, posts) per transaction, where posts
+    are (account name, amount, date occurred, date resolved).
+    :param account: only include transactions having posts of this account or its sub-accounts
+    """
+    provider = db.provider
+    placeholder = sql_placeholder(db)
+    Post, Transaction, AccountPath = db.Post, db.Transaction, db.AccountPath
+
+    def column(alias, attr):
+        return f"{alias}.{provider.quote_name(attr.columns[0])}"
+
+    def date_arg(date):
+        return Post.date_occurred.converters[0].py2sql(date)
+
+    # Same conditions as `get_posts_between_period`, on the posts selecting the transactions
+    if include_nonresolved:
+        period = f"{column('q', Post.date_resolved)} >= {placeholder} AND {column('q', Post.date_occurred)} <= {placeholder}"
+    else:
+        period = f"{column('q', Post.date_occurred)} >= {placeholder} AND {column('q', Post.date_resolved)} <= {placeholder}"
+    args = [date_arg(date_from), date_arg(date_to)]
+    subtree = ""
+    if account:
+        subtree = (f"JOIN {provider.quote_name(AccountPath._table_)} ap "
+                   f"ON {column('ap', AccountPath.descendant)} = {column('q', Post.account)} "
+                   f"AND {column('ap', AccountPath.ancestor)} = {placeholder} ")
+        args.insert(0, account)
+
+    txn_columns = [column('t', attr) for attr in (Transaction.uid, Transaction.ref, Transaction.description,
+                                                   Transaction.min_date_occurred, Transaction.max_date_resolved)]
+    post_columns = [column('p', attr) for attr in (Post.account, Post.amount, Post.date_occurred, Post.date_resolved)]
+    sql = (f"SELECT {', '.join(txn_columns + post_columns)} "
+           f"FROM {provider.quote_name(Transaction._table_)} t "
+           f"JOIN {provider.quote_name(Post._table_)} p ON {column('p', Post.transaction)} = {column('t', Transaction.uid)} "
+           f"WHERE {column('t', Transaction.uid)} IN ("
+           f"SELECT {column('q', Post.transaction)} FROM {provider.quote_name(Post._table_)} q {subtree}"
+           f"WHERE {period}) "
+           f"ORDER BY {column('t', Transaction.min_date_occurred)}, {column('t', Transaction.uid)}, {column('p', Post.id)}")
+
+    dates: Dict[Any, Date] = {}
+
+    def to_date(raw_date) -> Date:
+        # Few distinct dates, so convert each once
+        if raw_date not in dates:
+            dates[raw_date] = Post.date_occurred.converters[0].sql2py(raw_date)
+        return dates[raw_date]
+
+    amount_converter = Post.amount.converters[0]
+    rows = iter_rows(db, sql, tuple(args))
+    for uid, txn_rows in itertools.groupby(rows, key=lambda row: row[0]):
+        posts = []
+        for _, ref, description, min_date_occurred, max_date_resolved, acc, amount, date_o, date_r in txn_rows:
+            posts.append((acc, amount_converter.sql2py(amount), to_date(date_o), to_date(date_r)))
+        yield uid, ref or '', description or '', to_date(min_date_occurred), to_date(max_date_resolved), posts
+
+
+@orm.db_session
+def get_account_sums(db, date_from: Date, date_to: Date, include_nonresolved=False,
+                     account: str = None, depth: int = None) -> Dict[str, int]:
+    """
+    Sums amounts of posts in the period per account, exactly in cents.
+    Whole months in the period are summed from the monthly sums; only posts in the partial months
+    at either end are read.
+    :param account: only include posts of this account and its sub-accounts
+    :param depth: sum up to accounts truncated to this many levels instead
+    """
+    full_month_from = month_start(date_from if date_from.day == 1 else month_end(date_from) + TimeDelta(days=1))
+    full_month_to = month_start(date_to if date_to == month_end(date_to) else month_start(date_to) - TimeDelta(days=1))
+    if full_month_from > full_month_to:
+        return CentsSums(_sum_posts(db, get_posts_between_period(db, date_from, date_to, include_nonresolved),
+                                    account, depth)).cents()
+
+    # Posts in whole months of the period are those with both dates in between these
+    inner_from, inner_to = full_month_from, month_end(full_month_to)
+    if include_nonresolved:
+        edge_posts = db.Post.select(lambda p: p.date_resolved >= date_from and p.date_occurred <= date_to
+                                    and (p.date_resolved < inner_from or p.date_occurred > inner_to))
+        monthly_sums = db.MonthlySum.select(lambda m: m.month_resolved >= full_month_from
+                                            and m.month_occurred <= full_month_to)
+    else:
+        edge_posts = db.Post.select(lambda p: p.date_occurred >= date_from and p.date_resolved <= date_to
+                                    and (p.date_occurred < inner_from or p.date_resolved > inner_to))
+        monthly_sums = db.MonthlySum.select(lambda m: m.month_occurred >= full_month_from
+                                            and m.month_resolved <= full_month_to)
+
+    sums = CentsSums(_sum_monthly_sums(db, monthly_sums, account, depth))
+    sums.extend(_sum_posts(db, edge_posts, account, depth))
+    return sums.cents()
+
+
+def _sum_posts(db, query: orm.core.Query, account: str, depth: int) -> List[Tuple[str, Decimal]]:
+    if account:
+        query = filter_account_subtree(db, query, account)
+    if depth is None:
+        return orm.select((p.account.name, orm.sum(p.amount)) for p in query)[:]
+    # Group on the ancestor at `depth`, or the account itself if it is not as deep
+    return orm.select((ap.ancestor, orm.sum(p.amount)) for p in query for ap in db.AccountPath
+                      if ap.descendant == p.account.name and
+                      (ap.depth == depth or (ap.depth < depth and ap.ancestor == ap.descendant)))[:]
+
+
+def _sum_monthly_sums(db, query: orm.core.Query, account: str, depth: int) -> List[Tuple[str, Decimal]]:
+    if account:
+        query = orm.select(m for m in query for ap in db.AccountPath
+                           if ap.descendant == m.account and ap.ancestor == account)
+    if depth is None:
+        return orm.select((m.account, orm.sum(m.amount)) for m in query)[:]
+    return orm.select((ap.ancestor, orm.sum(m.amount)) for m in query for ap in db.AccountPath
+                      if ap.descendant == m.account and
+                      (ap.depth == depth or (ap.depth < depth and ap.ancestor == ap.descendant)))[:]
+
+
+def filter_account_subtree(db, query: orm.core.Query, account: str) -> orm.core.Query:
+    """Filters a query of posts down to posts of the account and its sub-accounts."""
+    return orm.select(p for p in query for ap in db.AccountPath
+                      if ap.descendant == p.account.name and ap.ancestor == account)
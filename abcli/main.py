@@ -1,14 +1,28 @@
+import functools
 import os
 import logging
 from pathlib import Path
 import json
 
 import click
-from pony.orm import Database, set_sql_debug
 
-from abcli.model import init_orm
 from abcli.commands import init_command_groups
-from abcli.utils import PathType, error_exit_on_exception
+from abcli.utils import PathType, LazyGroup, error_exit_on_exception, ON_ERROR_META_KEY
+from abcli.utils.output import OUTPUT_FORMATS, set_output_format
+from abcli.utils.profiling import Profiler, set_profiler, phase
+
+logger = logging.getLogger()
+
+_log_handler_installed = False
+
+
+def init_logging():
+    global _log_handler_installed
+    if not _log_handler_installed:
+        import coloredlogs
+        # TODO: maybe load format from a config file?
+        coloredlogs.install(fmt="%(message)s", logger=logging.getLogger())
+        _log_handler_installed = True
 
 
 def set_root_logger_level(cli_level):
@@ -19,27 +33,70 @@ def set_root_logger_level(cli_level):
         root_logger.setLevel(cli_level)
 
     if root_logger.getEffectiveLevel() == logging.DEBUG:
+        from pony.orm import set_sql_debug
         set_sql_debug(True)
 
 
-@click.group()
+# Heavy dependencies (pony, and those of each command group) are imported only when needed,
+# so that short commands start up quickly
+@click.group(cls=LazyGroup)
 @click.option("--log-level", type=click.Choice([str(k) for k in logging._nameToLevel.keys()]), default=None,
         help="Set the root logger level")
 @click.option("--config", "-c", "config_path", type=PathType(), default=Path("./config.json"),
         help="Path to config JSON file")
+@click.option("--format", "output_format", type=click.Choice(OUTPUT_FORMATS), default='table',
+        help="Output format of reports; csv and jsonl are streamed row by row.")
+@click.option("--profile", is_flag=True,
+        help="Report time spent per phase, and SQL statements run and time spent in the database, to stderr.")
+@click.option("--profile-output", "profile_path", type=PathType(dir_okay=False), default=None,
+        help="Also save cProfile stats of the command to this file (implies --profile).")
 @click.pass_context
 @error_exit_on_exception
-def cli(ctx: click.Context, log_level, config_path: Path):
+def cli(ctx: click.Context, log_level, config_path: Path, output_format: str, profile: bool, profile_path: Path):
+    init_logging()
     set_root_logger_level(log_level)
+    set_output_format(output_format)
+
+    profiler = Profiler(profile_path) if profile or profile_path else None
+    set_profiler(profiler)
+    if profiler:
+        ctx.call_on_close(profiler.report)
 
-    if ctx.invoked_subcommand != 'csv':  # Doesn't need to initialise the db
-        with config_path.open('r') as fp:
-            config = json.load(fp)
-            ctx.meta.update(config)
+    # `csv` doesn't need the db; `abcli serve` passes in its db, initialised once for all commands it serves
+    if ctx.invoked_subcommand != 'csv' and ctx.obj is None:
+        from pony.orm import Database
+        from abcli.model import init_orm
+        from abcli.utils.cache import SchemaVersionCache
 
-        db = Database(**config['db'])
-        init_orm(db)
+        with phase('config load'):
+            with config_path.open('r') as fp:
+                config = json.load(fp)
+                ctx.meta.update(config)
+
+        with phase('ORM mapping'):
+            db = Database(**config['db'])
+            if profiler:
+                profiler.track_sql(db)
+            # Checking the schema version of a local SQLite DB is as cheap as checking the local cache
+            schema_cache = SchemaVersionCache(config['db']) if config['db'].get('provider') != 'sqlite' else None
+            # `db` commands manage the schema themselves
+            if init_orm(db, create_tables=ctx.invoked_subcommand != 'db', schema_cache=schema_cache):
+                ctx.meta[ON_ERROR_META_KEY] = functools.partial(_migrate_missing_tables, db, schema_cache)
         ctx.obj = db
+    elif profiler and ctx.obj is not None:
+        profiler.track_sql(ctx.obj)
+
+    if profiler:
+        profiler.start_command()
+
+
+def _migrate_missing_tables(db, schema_cache, error: Exception):
+    # The schema check was skipped as the local cache has the schema as current, but the database has changed
+    from abcli.model import migrate_missing_tables
+
+    if migrate_missing_tables(db, schema_cache, error):
+        logger.warning("Tables were missing from the database, e.g. as it was recreated; it has been migrated, "
+                       "run the command again.")
 
 
 init_command_groups(cli)
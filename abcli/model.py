@@ -1,16 +1,24 @@
+from collections import defaultdict
 from datetime import date as Date, timedelta as TimeDelta
 from decimal import Decimal
 from typing import *
+import itertools
+import re
 import uuid
+import weakref
 
 from pony import orm
-from treelib import Tree
 
-from abcli.utils import format_date
+from abcli.utils import format_date, account_ancestors, month_start
+from abcli.utils.cache import SchemaVersionCache
+from abcli.utils.bulk import FingerprintCounter, DEFAULT_BATCH_SIZE, apply_monthly_sums
 
 
 ACCOUNT_TYPES = ('Income', 'Expenses', 'Assets', 'Liabilities')
 
+# Bump whenever entities change in a way that needs `migrate`
+SCHEMA_VERSION = 5
+
 
 class DictConversionMixin:
     def to_dictrepr(self, simple=True, visited=set()):
@@ -37,7 +45,15 @@ class DictConversionMixin:
         return dic
 
 
-def init_orm(db: orm.Database):
+def init_orm(db: orm.Database, create_tables=True, schema_cache: SchemaVersionCache = None) -> bool:
+    """
+    Defines entities on the database and maps them to tables.
+    Tables are not checked against the entities; instead the database records its schema version.
+    :param create_tables: migrate the database if its schema version is not current (see `migrate`)
+    :param schema_cache: local record of the schema version, consulted before the database
+    :return: whether the database wasn't consulted, as `schema_cache` records its schema as current
+        (see `migrate_missing_tables`)
+    """
 
     class Account(db.Entity, DictConversionMixin):
         # __slot__ = ('name', 'balance', 'posts', 'budget_items')
@@ -45,6 +61,25 @@ def init_orm(db: orm.Database):
         balance = orm.Optional(lambda: Balance, cascade_delete=True)
         posts = orm.Set(lambda: Post, cascade_delete=True)
 
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            for depth, ancestor in enumerate(account_ancestors(self.name), start=1):
+                AccountPath(ancestor=ancestor, descendant=self.name, depth=depth)
+
+        def before_delete(self):
+            AccountPath.select(lambda ap: ap.descendant == self.name).delete(bulk=True)
+
+    class AccountPath(db.Entity):
+        """
+        Closure table of the account hierarchy: one row for the account itself and each of its ancestors,
+        which need not exist as accounts; e.g. 'A:B' has rows ('A', 'A:B', 1) and ('A:B', 'A:B', 2).
+        Lets sub-tree filters and roll-ups be indexed joins rather than string prefix scans.
+        """
+        ancestor = orm.Required(str)
+        descendant = orm.Required(str, index=True)
+        depth = orm.Required(int)
+        orm.PrimaryKey(ancestor, descendant)
+
     class Balance(db.Entity, DictConversionMixin):
         account = orm.PrimaryKey(Account)
         amount = orm.Required(Decimal, precision=16, scale=2)
@@ -56,6 +91,74 @@ def init_orm(db: orm.Database):
         date_occurred = orm.Required(Date)
         date_resolved = orm.Required(Date)
         transaction = orm.Optional(lambda: Transaction)
+        # For period queries on resolved / non-resolved posts (see `get_posts_between_period`)
+        orm.composite_index(date_resolved, date_occurred, account)
+        orm.composite_index(date_occurred, date_resolved, account)
+        # For account registers, read in date order (see `abcli.commands.account.register_query`)
+        orm.composite_index(account, date_resolved, date_occurred)
+
+        # Keep monthly sums and balance checkpoints up to date with posts written through the ORM;
+        # the amounts are collected as posts are saved, and applied once per flush (see `_apply_pending_sums`)
+        def before_insert(self):
+            _collect(self, self.account.name, self.date_occurred, self.date_resolved, self.amount)
+
+        def before_update(self):
+            old = self._dbvals_
+            _collect(self, old[Post.account].name, old[Post.date_occurred], old[Post.date_resolved],
+                     -old[Post.amount])
+            _collect(self, self.account.name, self.date_occurred, self.date_resolved, self.amount)
+
+        def before_delete(self):
+            old = self._dbvals_
+            if old:
+                _collect(self, old[Post.account].name, old[Post.date_occurred], old[Post.date_resolved],
+                         -old[Post.amount])
+
+        def after_insert(self):
+            _apply_pending_sums(self)
+
+        def after_update(self):
+            _apply_pending_sums(self)
+
+        def after_delete(self):
+            _apply_pending_sums(self)
+
+    # Amounts of the posts being saved per session cache, by account, month occurred and month resolved
+    pending_sums: MutableMapping[Any, Dict[Tuple[str, Date, Date], Decimal]] = weakref.WeakKeyDictionary()
+
+    def _collect(post: Post, account: str, date_occurred: Date, date_resolved: Date, amount: Decimal):
+        sums = pending_sums.setdefault(post._session_cache_, defaultdict(Decimal))
+        sums[(account, month_start(date_occurred), month_start(date_resolved))] += amount
+
+    def _apply_pending_sums(post: Post):
+        # The first post saved applies the sums of the whole flush; the monthly sums and checkpoints
+        # it modifies are then saved by the next round of the flush
+        sums = pending_sums.pop(post._session_cache_, None)
+        if sums:
+            apply_monthly_sums(db, sums)
+
+    class MonthlySum(db.Entity):
+        """
+        Sums of post amounts per account, month occurred and month resolved (months are represented by
+        their first day), maintained along with the posts. Keeping both months lets period queries on
+        resolved and non-resolved posts alike be answered from these for whole months.
+        """
+        account = orm.Required(str)
+        month_occurred = orm.Required(Date)
+        month_resolved = orm.Required(Date)
+        amount = orm.Required(Decimal, precision=20, scale=2)
+        orm.PrimaryKey(account, month_occurred, month_resolved)
+
+    class BalanceCheckpoint(db.Entity):
+        """
+        Running balance of an account (sum of its posts resolved up to and including a month end date),
+        created by `balance verify` and maintained along with the posts afterwards. Lets balances be
+        checked by summing only the posts after the nearest checkpoint.
+        """
+        account = orm.Required(str)
+        date = orm.Required(Date)
+        amount = orm.Required(Decimal, precision=20, scale=2)
+        orm.PrimaryKey(account, date)
 
     class Transaction(db.Entity, DictConversionMixin):
         uid = orm.PrimaryKey(str, auto=True)
@@ -64,6 +167,8 @@ def init_orm(db: orm.Database):
         description = orm.Optional(str)
         ref = orm.Optional(str)
         posts = orm.Set(Post)
+        # Deleted along with the transaction, so that it can be imported again
+        fingerprints = orm.Set(lambda: ImportFingerprint, cascade_delete=True)
 
         @classmethod
         def from_posts(cls, posts: List[Tuple[Account, float, Date, Date]]):
@@ -76,4 +181,127 @@ def init_orm(db: orm.Database):
                 posts=db_posts
             )
 
-    db.generate_mapping(create_tables=True)
+    class ImportFingerprint(db.Entity):
+        """
+        Fingerprints of imported transactions (see `abcli.utils.bulk.FingerprintCounter`), so that
+        importing overlapping CSVs skips transactions imported before.
+        """
+        fingerprint = orm.PrimaryKey(str)
+        transaction = orm.Required(Transaction)
+
+    class SchemaVersion(db.Entity):
+        version = orm.PrimaryKey(int)
+
+    db.generate_mapping(create_tables=False, check_tables=False)
+    if create_tables:
+        if schema_cache is not None and schema_cache.get() == SCHEMA_VERSION:
+            return True
+        if get_schema_version(db) != SCHEMA_VERSION:
+            migrate(db)
+        if schema_cache is not None:
+            schema_cache.set(SCHEMA_VERSION)
+    return False
+
+
+_MISSING_TABLE_ERROR = re.compile(r"no such table|relation .* does not exist|table .* doesn't exist", re.IGNORECASE)
+
+
+def migrate_missing_tables(db: orm.Database, schema_cache: SchemaVersionCache, error: Exception) -> bool:
+    """
+    Migrates a database whose schema `init_orm` took as current from `schema_cache`, if `error` (raised using it)
+    is of a table missing from it, e.g. as the database was recreated or restored from an older backup since.
+    :return: whether the database was migrated
+    """
+    if not isinstance(error, orm.DatabaseError) or not _MISSING_TABLE_ERROR.search(str(error)):
+        return False
+    schema_cache.clear()
+    migrate(db)
+    schema_cache.set(SCHEMA_VERSION)
+    return True
+
+
+def get_schema_version(db: orm.Database) -> int:
+    try:
+        with orm.db_session:
+            return orm.max(v.version for v in db.SchemaVersion) or 0
+    except orm.DatabaseError:
+        # Created before schema versions were recorded
+        return 0
+
+
+def migrate(db: orm.Database) -> List[str]:
+    """
+    Brings the schema of an existing database up to date in place, by creating missing tables and
+    indexes (e.g. ones added in a newer version) without touching existing data.
+    Derived tables that are newly created are populated from existing data.
+    :return: names of the created database objects
+    """
+    created = []
+    created_table_names = set()
+    with orm.db_session(ddl=True):
+        provider = db.provider
+        connection = db.get_connection()
+        created_tables = set()
+        for table in db.schema.order_tables_to_create():
+            for db_object in table.get_objects_to_create(created_tables):
+                if db_object.exists(provider, connection, case_sensitive=False) is None:
+                    db_object.create(provider, connection)
+                    created.append(f"{db_object.typename} {db_object.name}")
+                    if db_object is table:
+                        created_table_names.add(table.name)
+
+    if db.AccountPath._table_ in created_table_names:
+        _populate_account_paths(db)
+    if db.MonthlySum._table_ in created_table_names:
+        _populate_monthly_sums(db)
+    if db.ImportFingerprint._table_ in created_table_names:
+        _populate_import_fingerprints(db)
+    else:
+        _delete_orphan_import_fingerprints(db)
+
+    with orm.db_session:
+        db.SchemaVersion.select().delete(bulk=True)
+        db.SchemaVersion(version=SCHEMA_VERSION)
+    return created
+
+
+@orm.db_session
+def _populate_account_paths(db: orm.Database):
+    """Back-fills the account closure table for accounts created before it existed."""
+    for account in orm.select(a for a in db.Account
+                              if not orm.exists(ap for ap in db.AccountPath if ap.descendant == a.name)):
+        for depth, ancestor in enumerate(account_ancestors(account.name), start=1):
+            db.AccountPath(ancestor=ancestor, descendant=account.name, depth=depth)
+
+
+@orm.db_session
+def _populate_monthly_sums(db: orm.Database):
+    """Rebuilds the monthly sums from all posts."""
+    db.MonthlySum.select().delete(bulk=True)
+    query = orm.select((p.account.name, p.date_occurred.year, p.date_occurred.month,
+                        p.date_resolved.year, p.date_resolved.month, orm.sum(p.amount)) for p in db.Post)
+    for account, year_o, month_o, year_r, month_r, amount in query:
+        db.MonthlySum(account=account, month_occurred=Date(year_o, month_o, 1),
+                      month_resolved=Date(year_r, month_r, 1), amount=amount)
+
+
+@orm.db_session
+def _populate_import_fingerprints(db: orm.Database):
+    """Fingerprints transactions imported before fingerprints were recorded."""
+    counter = FingerprintCounter(db)
+    txns = iter(orm.select(t for t in db.Transaction).order_by(lambda t: (t.min_date_occurred, t.uid))
+                .prefetch(db.Transaction.posts))
+    for batch in iter(lambda: list(itertools.islice(txns, DEFAULT_BATCH_SIZE)), []):
+        fingerprints = counter.fingerprints([
+            (txn.description, txn.ref,
+             [(post.account.name, post.amount, post.date_occurred, post.date_resolved) for post in txn.posts])
+            for txn in batch])
+        for txn, fingerprint in zip(batch, fingerprints):
+            db.ImportFingerprint(fingerprint=fingerprint, transaction=txn)
+
+
+@orm.db_session
+def _delete_orphan_import_fingerprints(db: orm.Database):
+    """Deletes fingerprints of transactions deleted before fingerprints were deleted along with them."""
+    orm.select(f for f in db.ImportFingerprint
+               if not orm.exists(t for t in db.Transaction if t == f.transaction)).delete(bulk=True)
@@ -0,0 +1,318 @@
+import bisect
+import hashlib
+import itertools
+import json
+import uuid
+from collections import defaultdict
+from datetime import date as Date
+from decimal import Decimal
+from typing import *
+
+from pony import orm
+
+from abcli.utils.model import parse_date, month_start
+from abcli.utils.cents import to_cents
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FETCH_SIZE = 1000
+
+_PLACEHOLDERS = {
+    'qmark': '?',
+    'format': '%s',
+    'pyformat': '%s',
+}
+
+
+def sql_placeholder(db: orm.Database) -> str:
+    """The parameter placeholder of the database's DB-API driver, for raw SQL."""
+    return _PLACEHOLDERS[db.provider.paramstyle]
+
+
+def iter_rows(db: orm.Database, sql: str, args: Tuple, fetch_size: int = DEFAULT_FETCH_SIZE) -> Iterator[Tuple]:
+    """
+    Executes a raw query and yields its rows, fetched in batches rather than all at once.
+    On PostgreSQL a named (server-side) cursor is used, so the result set is not buffered on the client.
+    Must be used inside a ``db_session``.
+    """
+    connection = db.get_connection()
+    if db.provider.dialect == 'PostgreSQL':
+        cursor = connection.cursor(name=f'abcli_{uuid.uuid4().hex}')
+        cursor.itersize = fetch_size
+    else:
+        cursor = connection.cursor()
+    db.provider.execute(cursor, sql, args)
+    try:
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def apply_monthly_sums(db: orm.Database, monthly_sums: Dict[Tuple[str, Date, Date], Decimal]):
+    """
+    Adds the amounts of posts written (or, negated, of posts removed) per account, month occurred and month
+    resolved to the monthly sums, and to the balance checkpoints they affect, with one query for each.
+    Must be used inside a ``db_session``.
+    """
+    if not monthly_sums:
+        return
+    MonthlySum, BalanceCheckpoint = db.MonthlySum, db.BalanceCheckpoint
+    accounts = tuple({account for account, _, _ in monthly_sums})
+    existing = {(m.account, m.month_occurred, m.month_resolved): m
+                for m in orm.select(m for m in MonthlySum if m.account in accounts)}
+    checkpoints = orm.select(c for c in BalanceCheckpoint if c.account in accounts)[:]
+
+    for (account, month_occurred, month_resolved), amount in monthly_sums.items():
+        obj = existing.get((account, month_occurred, month_resolved))
+        if obj is None:
+            MonthlySum(account=account, month_occurred=month_occurred, month_resolved=month_resolved,
+                       amount=amount)
+        else:
+            obj.amount += amount
+
+    # Checkpoints are at month ends, so each one takes the amounts of the months resolved up to it
+    monthly_deltas: Dict[str, Dict[Date, Decimal]] = defaultdict(lambda: defaultdict(Decimal))
+    for (account, _, month_resolved), amount in monthly_sums.items():
+        monthly_deltas[account][month_resolved] += amount
+    cumulative_deltas = {}
+    for account, deltas in monthly_deltas.items():
+        months = sorted(deltas)
+        cumulative_deltas[account] = (months, list(itertools.accumulate(deltas[month] for month in months)))
+    for checkpoint in checkpoints:
+        months, sums = cumulative_deltas[checkpoint.account]
+        idx = bisect.bisect_right(months, checkpoint.date)
+        if idx:
+            checkpoint.amount += sums[idx - 1]
+
+
+class FingerprintCounter:
+    """
+    Fingerprints transactions by their content: description, ref and posts (account, amount and dates).
+    The number of transactions of the same content fingerprinted before is part of the fingerprint, so that
+    identical transactions within an import (e.g. two coffees on a day) are told apart, while importing
+    them again yields the same fingerprints.
+    The counts are kept in a temporary table rather than in memory, so that memory doesn't grow with the size
+    of the import; they are looked up and updated once per batch. Must be used inside a ``db_session``.
+    """
+    _TABLE = 'abcli_fingerprint_counts'
+
+    def __init__(self, db: orm.Database):
+        self._db = db
+        self._started = False
+
+    def fingerprints(self, contents: Sequence[Tuple[str, str, Iterable[Tuple[str, Any, Date, Date]]]]) -> List[str]:
+        """Fingerprints a batch of transactions, given as (description, ref, posts), in order."""
+        digests = [self._digest(*content) for content in contents]
+        if not digests:
+            return []
+        provider = self._db.provider
+        placeholder = sql_placeholder(self._db)
+        table = provider.quote_name(self._TABLE)
+        cursor = self._db.get_connection().cursor()
+        if not self._started:
+            # Left over from an earlier import on the same connection, if any
+            provider.execute(cursor, f"CREATE TEMPORARY TABLE IF NOT EXISTS {table} "
+                                     f"(digest VARCHAR(32) PRIMARY KEY, num INTEGER NOT NULL)")
+            provider.execute(cursor, f"DELETE FROM {table}")
+            self._started = True
+
+        distinct = list(dict.fromkeys(digests))
+        provider.execute(cursor, f"SELECT digest, num FROM {table} WHERE digest IN "
+                                 f"({', '.join([placeholder] * len(distinct))})", tuple(distinct))
+        counts: Dict[str, int] = dict(cursor.fetchall())
+        if counts:
+            provider.execute(cursor, f"DELETE FROM {table} WHERE digest IN "
+                                     f"({', '.join([placeholder] * len(counts))})", tuple(counts))
+
+        fingerprints = []
+        for digest in digests:
+            counts[digest] = counts.get(digest, 0) + 1
+            fingerprints.append(f"{digest}:{counts[digest]}")
+        provider.execute(cursor, f"INSERT INTO {table} (digest, num) VALUES " +
+                         ', '.join([f"({placeholder}, {placeholder})"] * len(counts)),
+                         tuple(value for item in counts.items() for value in item))
+        return fingerprints
+
+    @staticmethod
+    def _digest(description: str, ref: str, posts: Iterable[Tuple[str, Any, Date, Date]]) -> str:
+        content = json.dumps([description or '', ref or '',
+                              sorted((account, to_cents(amount), date_occurred.isoformat(), date_resolved.isoformat())
+                                     for account, amount, date_occurred, date_resolved in posts)])
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class BulkWriter:
+    """
+    Writes transaction dicts (as produced by ``csv2json``) into the database with batched,
+    multi-row INSERT statements, bypassing per-entity ORM bookkeeping.
+
+    Must be used inside a ``db_session``; all rows are written in the session's DB transaction.
+    Account names are resolved (and created if ``create_missing``) once per name.
+    Monthly sums of the written posts are accumulated in memory and applied on `flush`, along with
+    the balance checkpoints they affect.
+    Transactions are fingerprinted as they are written; with ``skip_imported``, transactions with
+    fingerprints already in the database are skipped, looked up once per batch.
+    """
+
+    def __init__(self, db: orm.Database, create_missing: bool = True, batch_size: int = DEFAULT_BATCH_SIZE,
+                 skip_imported: bool = False):
+        self._db = db
+        self._create_missing = create_missing
+        self._batch_size = batch_size
+        self._skip_imported = skip_imported
+        self._resolved_accounts: Set[str] = set()
+        self._pending_accounts: Set[str] = set()
+        self._pending_txns: List[Dict] = []
+        self._txn_rows: List[Tuple] = []
+        self._post_rows: List[Tuple] = []
+        self._fingerprint_rows: List[Tuple] = []
+        self._monthly_sums: Dict[Tuple[str, Date, Date], Decimal] = defaultdict(Decimal)
+        self._fingerprints = FingerprintCounter(db)
+        self._dates: Dict[str, Date] = {}
+        self.num_transactions = 0
+        self.num_posts = 0
+        self.num_skipped = 0
+
+    def resolve_accounts(self, account_names: Iterable[str]):
+        names = set(account_names) - self._resolved_accounts
+        if not names:
+            return
+        db = self._db
+        names_tuple = tuple(names)
+        existing = set(orm.select(a.name for a in db.Account if a.name in names_tuple))
+        for name in sorted(names - existing):
+            if not self._create_missing:
+                raise KeyError(f"Account '{name}' not found, and no --create-missing specified.")
+            db.Account(name=name)
+        self._resolved_accounts |= names
+
+    def add(self, txn: Dict):
+        self._pending_txns.append(txn)
+        if len(self._pending_txns) >= self._batch_size:
+            self._flush_pending_txns()
+
+    def _flush_pending_txns(self):
+        if not self._pending_txns:
+            return
+        fingerprints = self._fingerprints.fingerprints([
+            (txn['description'], txn['ref'],
+             [(post['account'], post['amount'], self._parse_date(post['date_occurred']),
+               self._parse_date(post['date_resolved'])) for post in txn['posts']])
+            for txn in self._pending_txns])
+        imported = set()
+        if self._skip_imported:
+            fingerprints_tuple = tuple(fingerprints)
+            imported = set(orm.select(f.fingerprint for f in self._db.ImportFingerprint
+                                      if f.fingerprint in fingerprints_tuple))
+        for fingerprint, txn in zip(fingerprints, self._pending_txns):
+            if fingerprint in imported:
+                self.num_skipped += 1
+            else:
+                uid = self._add_rows(txn)
+                self._fingerprint_rows.append((fingerprint, uid))
+        self._pending_txns.clear()
+
+        if len(self._post_rows) >= self._batch_size:
+            self._flush_rows()
+
+    def _add_rows(self, txn: Dict) -> str:
+        uid = str(uuid.uuid4())
+        self._txn_rows.append(self._to_db_values(self._db.Transaction, (
+            ('uid', uid),
+            ('min_date_occurred', self._parse_date(txn['min_date_occurred'])),
+            ('max_date_resolved', self._parse_date(txn['max_date_resolved'])),
+            ('description', txn['description']),
+            ('ref', txn['ref']),
+        )))
+        for post in txn['posts']:
+            if post['account'] not in self._resolved_accounts:
+                self._pending_accounts.add(post['account'])
+            date_occurred, date_resolved = self._parse_date(post['date_occurred']), \
+                self._parse_date(post['date_resolved'])
+            row = self._to_db_values(self._db.Post, (
+                ('account', post['account']),
+                ('amount', float(post['amount'])),
+                ('date_occurred', date_occurred),
+                ('date_resolved', date_resolved),
+                ('transaction', uid),
+            ))
+            self._post_rows.append(row)
+            self._monthly_sums[post['account'], month_start(date_occurred), month_start(date_resolved)] += \
+                Decimal(row[1])
+        self.num_transactions += 1
+        self.num_posts += len(txn['posts'])
+        return uid
+
+    def _parse_date(self, date_str: str) -> Date:
+        # Few distinct dates, so parse each once
+        date = self._dates.get(date_str)
+        if date is None:
+            date = self._dates[date_str] = parse_date(date_str)
+        return date
+
+    def start_import(self):
+        """
+        Starts writing transactions of another import (e.g. the next CSV): identical transactions are only told
+        apart within an import, so that ones also in an overlapping import are skipped with ``skip_imported``.
+        """
+        self._flush_pending_txns()
+        self._fingerprints = FingerprintCounter(self._db)
+
+    def extend(self, txns: Iterable[Dict]):
+        for txn in txns:
+            self.add(txn)
+
+    def flush(self):
+        self._flush_pending_txns()
+        self._flush_rows()
+        self._flush_monthly_sums()
+
+    def _flush_rows(self):
+        if self._pending_accounts:
+            self.resolve_accounts(self._pending_accounts)
+            self._pending_accounts.clear()
+        # Flush ORM-created entities (e.g. accounts) first, so the raw rows can reference them
+        orm.flush()
+        self._insert(self._db.Transaction, ('uid', 'min_date_occurred', 'max_date_resolved', 'description', 'ref'),
+                     self._txn_rows)
+        self._insert(self._db.Post, ('account', 'amount', 'date_occurred', 'date_resolved', 'transaction'),
+                     self._post_rows)
+        self._insert(self._db.ImportFingerprint, ('fingerprint', 'transaction'), self._fingerprint_rows)
+        self._txn_rows.clear()
+        self._post_rows.clear()
+        self._fingerprint_rows.clear()
+
+    def _flush_monthly_sums(self):
+        apply_monthly_sums(self._db, self._monthly_sums)
+        self._monthly_sums.clear()
+
+    @staticmethod
+    def _to_db_values(entity, attr_values: Iterable[Tuple[str, Any]]) -> Tuple:
+        values = []
+        for attr_name, value in attr_values:
+            attr = getattr(entity, attr_name)
+            if attr.reverse:
+                # Reference to another entity: store its primary key as is
+                values.append(value)
+            else:
+                converter = attr.converters[0]
+                values.append(converter.py2sql(converter.validate(value)))
+        return tuple(values)
+
+    def _insert(self, entity, attr_names: Sequence[str], rows: List[Tuple]):
+        if not rows:
+            return
+        provider = self._db.provider
+        placeholder = sql_placeholder(self._db)
+        columns = ', '.join(provider.quote_name(getattr(entity, name).columns[0]) for name in attr_names)
+        row_sql = '(' + ', '.join([placeholder] * len(attr_names)) + ')'
+
+        cursor = self._db.get_connection().cursor()
+        for start in range(0, len(rows), self._batch_size):
+            batch = rows[start:start + self._batch_size]
+            sql = f"INSERT INTO {provider.quote_name(entity._table_)} ({columns}) VALUES " + \
+                  ', '.join([row_sql] * len(batch))
+            provider.execute(cursor, sql, tuple(value for row in batch for value in row))
@@ -0,0 +1,47 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import *
+
+
+def user_cache_dir() -> Path:
+    cache_home = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(cache_home) / 'abcli'
+
+
+class SchemaVersionCache:
+    """
+    Local record of the schema version of a database, identified by its connection parameters,
+    saving a round-trip to the database to check it.
+    """
+
+    def __init__(self, db_params: dict, path: Path = None):
+        self._path = path or user_cache_dir() / 'schema-versions.json'
+        # Connection parameters may include a password; only keep a digest of them
+        self._key = hashlib.sha256(json.dumps(db_params, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self) -> Optional[int]:
+        return self._load().get(self._key)
+
+    def set(self, version: int):
+        versions = self._load()
+        versions[self._key] = version
+        self._save(versions)
+
+    def clear(self):
+        versions = self._load()
+        if versions.pop(self._key, None) is not None:
+            self._save(versions)
+
+    def _save(self, versions: Dict[str, int]):
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._path.with_name(f".{self._path.name}.{os.getpid()}")
+        tmp_path.write_text(json.dumps(versions, indent=2), encoding='utf-8')
+        os.replace(tmp_path, self._path)
+
+    def _load(self) -> Dict[str, int]:
+        try:
+            return json.loads(self._path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
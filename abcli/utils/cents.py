@@ -0,0 +1,69 @@
+from array import array
+from decimal import Decimal, ROUND_HALF_UP
+from typing import *
+
+try:
+    import numpy as np
+except ImportError:  # optional; grouped sums fall back to pure Python
+    np = None
+
+_CENT = Decimal('0.01')
+
+
+def to_cents(amount) -> int:
+    """Converts an amount (Decimal, int, float or str) to an exact number of cents, rounding half up."""
+    if isinstance(amount, int):
+        return amount * 100
+    if not isinstance(amount, Decimal):
+        # Through str, so that floats are taken as printed (e.g. 0.1 rather than 0.1000000000000000055...)
+        amount = Decimal(str(amount))
+    return int(amount.quantize(_CENT, rounding=ROUND_HALF_UP).scaleb(2))
+
+
+def from_cents(cents: int) -> Decimal:
+    return Decimal(cents).scaleb(-2)
+
+
+class CentsSums:
+    """
+    Sums amounts per key exactly, as integer cents.
+    Amounts are buffered as int64 cents in compact arrays and summed per key in one pass when the sums
+    are asked for (vectorised with NumPy if it is installed).
+    """
+
+    def __init__(self, items: Iterable[Tuple[Hashable, Any]] = ()):
+        self._codes: Dict[Hashable, int] = {}
+        self._key_codes = array('q')
+        self._cents = array('q')
+        self.extend(items)
+
+    def add(self, key: Hashable, amount):
+        self.add_cents(key, to_cents(amount))
+
+    def add_cents(self, key: Hashable, cents: int):
+        code = self._codes.get(key)
+        if code is None:
+            code = self._codes[key] = len(self._codes)
+        self._key_codes.append(code)
+        self._cents.append(cents)
+
+    def extend(self, items: Iterable[Tuple[Hashable, Any]]):
+        for key, amount in items:
+            self.add(key, amount)
+
+    def cents(self) -> Dict[Hashable, int]:
+        """Sums per key, in cents."""
+        if np is not None and self._cents:
+            sums = np.zeros(len(self._codes), dtype=np.int64)
+            np.add.at(sums, np.frombuffer(self._key_codes, dtype=np.int64),
+                      np.frombuffer(self._cents, dtype=np.int64))
+            sums = sums.tolist()
+        else:
+            sums = [0] * len(self._codes)
+            for code, cents in zip(self._key_codes, self._cents):
+                sums[code] += cents
+        return {key: sums[code] for key, code in self._codes.items()}
+
+    def amounts(self) -> Dict[Hashable, Decimal]:
+        """Sums per key, as exact Decimals."""
+        return {key: from_cents(cents) for key, cents in self.cents().items()}
@@ -1,7 +1,9 @@
 from pathlib import Path
+import importlib
 import logging
 import traceback
 import sys
+from typing import *
 
 import click
 
@@ -10,6 +12,10 @@ from abcli.utils.model import parse_date, JSON_FORMAT_DATE
 logger = logging.getLogger()
 
 
+# Context meta key of a callable given the exceptions logged by `error_exit_on_exception`
+ON_ERROR_META_KEY = 'abcli.on_error'
+
+
 def error_exit_on_exception(fnc):
     def _wrapped(*args, **kwargs):
         try:
@@ -22,7 +28,11 @@ def error_exit_on_exception(fnc):
                 logger.error(f"{exc_v.__class__.__name__}: {exc_v.args[0]}")
             except Exception:
                 logger.error(f"{exc_v.__class__.__name__}")
-            click.get_current_context().exit(1)
+            ctx = click.get_current_context()
+            on_error = ctx.meta.get(ON_ERROR_META_KEY)
+            if on_error is not None:
+                on_error(exc_v)
+            ctx.exit(1)
 
     return _wrapped
 
@@ -45,3 +55,31 @@ class PathType(click.Path):
             return Path(value)
         except ValueError:
             self.fail(f"Failed to construct pathlib.Path object from '{value}.'", param, ctx)
+
+
+class LazyGroup(click.Group):
+    """
+    A click group whose sub-commands are imported only when they are looked up, i.e. when invoked
+    (or listed in help), so that invoking one command doesn't import the dependencies of all others.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands: Dict[str, Tuple[str, str]] = {}
+
+    def add_lazy_command(self, name: str, module_name: str, attr_name: str):
+        self.lazy_commands[name] = (module_name, attr_name)
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_commands and cmd_name not in self.commands:
+            module_name, attr_name = self.lazy_commands.pop(cmd_name)
+            try:
+                mod = importlib.import_module(module_name)
+                self.add_command(getattr(mod, attr_name), cmd_name)
+            except Exception as e:
+                logger.error(f'Caught {e} while importing {module_name}.')
+                logger.warning(f"Skipped {module_name} when searching for sub-command groups")
+        return super().get_command(ctx, cmd_name)
@@ -0,0 +1,162 @@
+from array import array
+from datetime import date as Date
+from decimal import Decimal
+from typing import *
+
+from pony import orm
+
+try:
+    import numpy as np
+except ImportError:  # optional; required by PostStore
+    np = None
+
+from abcli.utils.bulk import iter_rows
+from abcli.utils.cents import to_cents, from_cents
+
+
+class PostStore:
+    """
+    All posts loaded into memory in columnar form, for answering many queries without the database.
+    Dates are day ordinals, accounts and transaction descriptions are ids into name lists, and amounts
+    are cents, each as a NumPy array; filters are vectorised masks over them.
+    Implements the same queries as the database code paths (`get_account_sums`, `account register`),
+    so it can stand in for them.
+    """
+
+    def __init__(self, accounts: List[str], descriptions: List[str], account_ids: 'np.ndarray',
+                 occurred: 'np.ndarray', resolved: 'np.ndarray', cents: 'np.ndarray',
+                 description_ids: 'np.ndarray'):
+        self.accounts = accounts
+        self.descriptions = descriptions
+        self.account_ids = account_ids
+        self.occurred = occurred
+        self.resolved = resolved
+        self.cents = cents
+        self.description_ids = description_ids
+        self._account_index = {name: idx for idx, name in enumerate(accounts)}
+
+    @classmethod
+    def load(cls, db: orm.Database) -> 'PostStore':
+        """Loads all posts (must be used inside a ``db_session``)."""
+        if np is None:
+            raise ImportError("The in-memory post store needs numpy; install abcli with the 'numpy' extra.")
+
+        provider = db.provider
+        Post, Transaction = db.Post, db.Transaction
+
+        def column(attr):
+            return f"p.{provider.quote_name(attr.columns[0])}"
+
+        sql = (f"SELECT {column(Post.account)}, {column(Post.amount)}, {column(Post.date_occurred)}, "
+               f"{column(Post.date_resolved)}, t.{provider.quote_name(Transaction.description.columns[0])} "
+               f"FROM {provider.quote_name(Post._table_)} p "
+               f"LEFT JOIN {provider.quote_name(Transaction._table_)} t "
+               f"ON t.{provider.quote_name(Transaction.uid.columns[0])} = {column(Post.transaction)} "
+               f"ORDER BY {column(Post.id)}")
+
+        # Accounts without posts are known too, for the same account checks as on the database
+        account_index: Dict[str, int] = {name: idx for idx, name in
+                                         enumerate(orm.select(a.name for a in db.Account).order_by(1))}
+        description_index: Dict[str, int] = {}
+        ordinals: Dict[Any, int] = {}
+        date_converter = Post.date_occurred.converters[0]
+        amount_converter = Post.amount.converters[0]
+        account_ids, description_ids = array('q'), array('q')
+        occurred, resolved, cents = array('q'), array('q'), array('q')
+
+        def ordinal(raw_date) -> int:
+            # Few distinct dates, so convert each once
+            result = ordinals.get(raw_date)
+            if result is None:
+                result = ordinals[raw_date] = date_converter.sql2py(raw_date).toordinal()
+            return result
+
+        for account, amount, date_occurred, date_resolved, description in iter_rows(db, sql, ()):
+            account_ids.append(account_index.setdefault(account, len(account_index)))
+            description_ids.append(description_index.setdefault(description or '', len(description_index)))
+            occurred.append(ordinal(date_occurred))
+            resolved.append(ordinal(date_resolved))
+            if isinstance(amount, (int, float)):
+                cents.append(round(amount * 100))
+            else:
+                cents.append(to_cents(amount_converter.sql2py(amount)))
+
+        def to_numpy(values: array) -> 'np.ndarray':
+            return np.frombuffer(values, dtype=np.int64) if values else np.zeros(0, dtype=np.int64)
+
+        return cls(list(account_index), list(description_index), to_numpy(account_ids), to_numpy(occurred),
+                   to_numpy(resolved), to_numpy(cents), to_numpy(description_ids))
+
+    def __len__(self):
+        return len(self.cents)
+
+    def has_account(self, name: str) -> bool:
+        return name in self._account_index
+
+    def mask(self, date_from: Date = None, date_to: Date = None, include_nonresolved=False,
+             account: str = None) -> 'np.ndarray':
+        """
+        Selects posts in the period, like `get_posts_between_period`.
+        :param account: only select posts of this account and its sub-accounts
+        """
+        mask = np.ones(len(self), dtype=bool)
+        first_date, last_date = (self.resolved, self.occurred) if include_nonresolved \
+            else (self.occurred, self.resolved)
+        if date_from is not None:
+            mask &= first_date >= date_from.toordinal()
+        if date_to is not None:
+            mask &= last_date <= date_to.toordinal()
+        if account:
+            in_subtree = np.array([name == account or name.startswith(account + ':') for name in self.accounts],
+                                  dtype=bool)
+            mask &= in_subtree[self.account_ids]
+        return mask
+
+    def account_sums(self, date_from: Date, date_to: Date, include_nonresolved=False,
+                     account: str = None, depth: int = None) -> Dict[str, int]:
+        """Sums amounts of posts in the period per account, in cents, like `get_account_sums`."""
+        mask = self.mask(date_from, date_to, include_nonresolved, account)
+        if depth is None:
+            names = self.accounts
+            group_ids = self.account_ids[mask]
+        else:
+            # Group on the ancestor at `depth`, or the account itself if it is not as deep
+            name_index = {}
+            account_groups = np.array([name_index.setdefault(':'.join(name.split(':')[:depth]), len(name_index))
+                                       for name in self.accounts], dtype=np.int64)
+            names = list(name_index)
+            group_ids = account_groups[self.account_ids[mask]]
+
+        sums = np.zeros(len(names), dtype=np.int64)
+        np.add.at(sums, group_ids, self.cents[mask])
+        present = np.zeros(len(names), dtype=bool)
+        present[group_ids] = True
+        return {names[idx]: int(sums[idx]) for idx in np.flatnonzero(present)}
+
+    def opening_balance(self, account: str, date: Date) -> int:
+        """Sum of the account's posts resolved before the date, in cents."""
+        account_id = self._account_index.get(account)
+        if account_id is None:
+            return 0
+        mask = (self.account_ids == account_id) & (self.resolved < date.toordinal())
+        return int(self.cents[mask].sum())
+
+    def register(self, account: str, date_from: Date = None, date_to: Date = None) \
+            -> Iterator[Tuple[Date, Decimal, str]]:
+        """
+        Yields (date resolved, amount, transaction description) of the account's posts in order of resolved
+        date (and date occurred), like `iter_register`.
+        """
+        account_id = self._account_index.get(account)
+        if account_id is None:
+            return
+        mask = self.account_ids == account_id
+        if date_from is not None:
+            mask &= self.resolved >= date_from.toordinal()
+        if date_to is not None:
+            mask &= self.resolved <= date_to.toordinal()
+        idxs = np.flatnonzero(mask)
+        idxs = idxs[np.lexsort((self.occurred[idxs], self.resolved[idxs]))]
+        for resolved, cents, description_id in zip(self.resolved[idxs].tolist(), self.cents[idxs].tolist(),
+                                                  self.description_ids[idxs].tolist()):
+            yield Date.fromordinal(resolved), from_cents(cents), self.descriptions[description_id]
@@ -1,11 +1,10 @@
 import datetime
+import calendar
 import sys
 from datetime import date as Date
 from typing import *
 from collections import OrderedDict
 
-from tabulate import tabulate
-
 JSON_FORMAT_DATE = '%d/%m/%Y'
 
 
@@ -20,23 +19,49 @@ def parse_date(date_str: str) -> Date:
         raise ValueError(f"Failed to parse date '{date_str}'.")
 
 
+def month_start(date: Date) -> Date:
+    return date.replace(day=1)
+
+
+def month_end(date: Date) -> Date:
+    return date.replace(day=calendar.monthrange(date.year, date.month)[1])
+
+
 def format_monetary(amount: float):
     return f"{'-' if amount < 0 else ''}${abs(amount):.2f}"
 
 
+def account_ancestors(name: str) -> List[str]:
+    """
+    Returns names of the account and all its ancestors, from the top-level one down to the account itself;
+    e.g. 'A:B:C' -> ['A', 'A:B', 'A:B:C'].
+    """
+    segs = name.split(':')
+    return [':'.join(segs[:depth]) for depth in range(1, len(segs) + 1)]
+
+
+def rollup_amounts(amounts: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Rolls amounts of accounts up the account hierarchy, i.e. the amount of an account includes
+    amounts of all its sub-accounts.
+    :param amounts: mapping of full account names to amounts
+    :return: mapping of every account name and its ancestors to the rolled-up amount
+    """
+    result = {}
+    for name, amount in amounts.items():
+        for ancestor in account_ancestors(name):
+            result[ancestor] = result.get(ancestor, 0) + amount
+    return result
+
+
 class AccountTree:
     def __init__(self, segname: str, parent: 'AccountTree' = None):
         self.segname = segname
         self.amount = 0
+        self.fullname = f'{parent.fullname}:{segname}' if parent else segname
         self._parent = parent
         self._children: OrderedDict[str, AccountTree] = OrderedDict()
 
-    @property
-    def fullname(self):
-        if self._parent:
-            return f'{self._parent.fullname}:{self.segname}'
-        return self.segname
-
     def has_children(self):
         return len(self._children) != 0
 
@@ -45,23 +70,26 @@ class AccountTree:
         if segname != self.segname:
             raise KeyError(f"{name} does not start with {self.segname}")
 
-        self.amount += amount
-        if rest:
-            child_seg = rest.partition(':')[0]
-            if child_seg not in self._children:
-                self._children[child_seg] = AccountTree(child_seg, self)
-                self._children.move_to_end(child_seg)
-            self._children[child_seg].add(rest, amount)
+        tree = self
+        tree.amount += amount
+        while rest:
+            child_seg, _, rest = rest.partition(':')
+            child = tree._children.get(child_seg)
+            if child is None:
+                child = tree._children[child_seg] = AccountTree(child_seg, tree)
+            tree = child
+            tree.amount += amount
 
     def get(self, name: str):
         segname, _, rest = name.partition(':')
         if segname != self.segname:
             return None
 
-        if not rest:
-            return self
-        child_seg = rest.partition(':')[0]
-        return self._children[child_seg].get(rest)
+        tree = self
+        while rest:
+            child_seg, _, rest = rest.partition(':')
+            tree = tree._children[child_seg]
+        return tree
 
     def get_format_tuples(self, callback: Callable[['AccountTree'], Tuple], indent="") -> List[Tuple]:
         """
@@ -72,41 +100,33 @@ class AccountTree:
         :param indent: indent prefix string
         :return:
         """
-        result = []
-        tree_str = indent + self._get_prefix() + self.segname
-        result.append((tree_str,) + callback(self))
-        for child_seg in self._children:
-            result += self._children[child_seg].get_format_tuples(callback, indent)
-        return result
-
-    def _get_is_last_childs(self) -> List[bool]:
-        if self._parent is None:
-            return [None]
-        is_last_child = list(self._parent._children.keys())[-1] == self.segname
-        return self._parent._get_is_last_childs() + [is_last_child]
-
-    def _get_prefix(self):
-        is_last_childs = self._get_is_last_childs()
-        prefix = ""
-        for parent_is_last_child in is_last_childs[:-1]:
-            if parent_is_last_child is None:
-                prefix += ""
-            elif parent_is_last_child:
-                prefix += ' ' * 4
-            else:
-                prefix += _SEG_PARENT_CONT + ' ' * 3
-
-        this_is_last_child = is_last_childs[-1]
-        if this_is_last_child is None:
-            prefix += ""
-        elif this_is_last_child:
-            prefix += _SEG_CHILD_LAST + _SEG_DASH * 2 + ' '
-        else:
-            prefix += _SEG_CHILD_CONT + _SEG_DASH * 2 + ' '
-        return prefix
+        return list(self.iter_format_tuples(callback, indent))
+
+    def iter_format_tuples(self, callback: Callable[['AccountTree'], Tuple], indent="") -> Iterator[Tuple]:
+        """
+        Yields the tuples of `get_format_tuples` in one depth-first pass, carrying the prefixes down.
+        """
+        # (tree, prefix of its own line, prefix of its children's lines), in reverse order of output
+        stack = [(self, indent, indent)]
+        while stack:
+            tree, prefix, child_prefix = stack.pop()
+            yield (prefix + tree.segname,) + callback(tree)
+
+            is_last = True
+            for child in reversed(tree._children.values()):
+                if is_last:
+                    stack.append((child, child_prefix + _PREFIX_CHILD_LAST, child_prefix + _PREFIX_PARENT_LAST))
+                    is_last = False
+                else:
+                    stack.append((child, child_prefix + _PREFIX_CHILD_CONT, child_prefix + _PREFIX_PARENT_CONT))
 
 
 _SEG_CHILD_LAST = '└'
 _SEG_CHILD_CONT = '├'
 _SEG_PARENT_CONT = '│'
 _SEG_DASH = '─'
+
+_PREFIX_CHILD_LAST = _SEG_CHILD_LAST + _SEG_DASH * 2 + ' '
+_PREFIX_CHILD_CONT = _SEG_CHILD_CONT + _SEG_DASH * 2 + ' '
+_PREFIX_PARENT_LAST = ' ' * 4
+_PREFIX_PARENT_CONT = _SEG_PARENT_CONT + ' ' * 3
@@ -0,0 +1,56 @@
+import csv
+import json
+import sys
+from datetime import date as Date
+from decimal import Decimal
+from typing import *
+
+import click
+
+OUTPUT_FORMATS = ('table', 'csv', 'jsonl')
+
+_output_format = 'table'
+
+
+def set_output_format(output_format: str):
+    global _output_format
+    _output_format = output_format
+
+
+def get_output_format() -> str:
+    """The format reports are written in: 'table' for people, or one of the machine-readable formats."""
+    return _output_format
+
+
+def write_records(fields: Sequence[str], records: Iterable[Sequence], output_format: str = None):
+    """
+    Writes records to stdout one by one as they are produced, in CSV (with a header) or JSON lines.
+    Amounts (Decimals) are written as numbers and dates in ISO format.
+    """
+    output_format = output_format or _output_format
+    if output_format == 'csv':
+        writer = csv.writer(sys.stdout, lineterminator='\n')
+        writer.writerow(fields)
+        for record in records:
+            writer.writerow([_to_csv_value(value) for value in record])
+    elif output_format == 'jsonl':
+        for record in records:
+            click.echo(json.dumps(dict(zip(fields, record)), default=_to_json_value))
+    else:
+        raise ValueError(f"Unsupported output format '{output_format}'.")
+
+
+def _to_csv_value(value):
+    if isinstance(value, Date):
+        return value.isoformat()
+    if value is None:
+        return ''
+    return value
+
+
+def _to_json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, Date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {value.__class__.__name__} is not JSON serializable")
@@ -0,0 +1,205 @@
+import cProfile
+import time
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
+from typing import *
+
+import click
+
+_profiler: Optional['Profiler'] = None
+_sql_counters: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+_sql_recorders: List[Tuple[Optional['SqlCounter'], List[str]]] = []
+
+
+class SqlCounter:
+    """Counts SQL statements run on a database, and the time spent running them and fetching their rows."""
+
+    def __init__(self):
+        self.num_statements = 0
+        self.seconds = 0.0
+
+
+def track_sql(db) -> SqlCounter:
+    """
+    Starts counting the SQL statements run on the Pony database (if not already), by wrapping its DB-API
+    connection so that its cursors are timed; covers Pony's queries as well as the raw SQL of `abcli.utils.bulk`.
+    :return: the counter of the database
+    """
+    counter = _sql_counters.get(db)
+    if counter is not None:
+        return counter
+    counter = _sql_counters[db] = SqlCounter()
+
+    pool = db.provider.pool
+    connect = pool._connect
+
+    def _connect():
+        connect()
+        pool.con = _TimedConnection(pool.con, counter)
+
+    pool._connect = _connect
+    if pool.con is not None:  # connected (and released) when the database was bound
+        pool.con = _TimedConnection(pool.con, counter)
+    return counter
+
+
+class _TimedConnection:
+    def __init__(self, connection, counter: SqlCounter):
+        object.__setattr__(self, '_connection', connection)
+        object.__setattr__(self, '_counter', counter)
+
+    def cursor(self, *args, **kwargs):
+        return _TimedCursor(self._connection.cursor(*args, **kwargs), self._counter)
+
+    def execute(self, *args):
+        return _timed(self._counter, True, self._connection.execute, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._connection, name, value)
+
+
+class _TimedCursor:
+    def __init__(self, cursor, counter: SqlCounter):
+        object.__setattr__(self, '_cursor', cursor)
+        object.__setattr__(self, '_counter', counter)
+
+    def execute(self, *args):
+        return _timed(self._counter, True, self._cursor.execute, *args)
+
+    def executemany(self, *args):
+        return _timed(self._counter, True, self._cursor.executemany, *args)
+
+    def fetchone(self):
+        return _timed(self._counter, False, self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return _timed(self._counter, False, self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return _timed(self._counter, False, self._cursor.fetchall)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+
+@contextmanager
+def record_sql(db=None) -> Iterator[List[str]]:
+    """
+    Records the SQL of the statements run in the block on the databases tracked by `track_sql`
+    (the CLI tracks the database it opens), or only on `db`.
+    :return: the statements run so far in the block
+    """
+    statements = []
+    recorder = (None if db is None else track_sql(db), statements)
+    _sql_recorders.append(recorder)
+    try:
+        yield statements
+    finally:
+        _sql_recorders.remove(recorder)
+
+
+def _timed(counter: SqlCounter, is_statement: bool, func: Callable, *args):
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        counter.seconds += time.perf_counter() - start
+        if is_statement:
+            counter.num_statements += 1
+            for recorded_counter, statements in _sql_recorders:
+                if recorded_counter is None or recorded_counter is counter:
+                    statements.append(args[0])
+
+
+class Profiler:
+    """
+    Accounts the wall time of a CLI run to phases, the SQL statements run and the time spent in the database,
+    and optionally profiles the sub-command with cProfile.
+    Time spent in a phase nested in another is only accounted to the inner phase.
+    """
+
+    def __init__(self, stats_path: Path = None):
+        self.stats_path = stats_path
+        self.phases: Dict[str, float] = {}
+        self.sql = SqlCounter()
+        self._sql_start = (0, 0.0)  # counts of `sql` before this run, e.g. earlier commands run by `abcli serve`
+        self._start = time.perf_counter()
+        self._stack: List[list] = []  # [name, start, time in nested phases]
+        self._profile: Optional[cProfile.Profile] = None
+
+    def start(self, name: str):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def stop(self):
+        name, start, nested = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        self.phases[name] = self.phases.get(name, 0.0) + elapsed - nested
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    @contextmanager
+    def phase(self, name: str):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def track_sql(self, db):
+        self.sql = track_sql(db)
+        self._sql_start = (self.sql.num_statements, self.sql.seconds)
+
+    def start_command(self):
+        """Starts timing (and profiling) the sub-command; time not in any phase of it is accounted to 'other'."""
+        self.start('other')
+        if self.stats_path:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def report(self):
+        """Stops timing and writes the report to stderr, so it doesn't mix with the command's output."""
+        if self._profile:
+            self._profile.disable()
+        while self._stack:
+            self.stop()
+        total = time.perf_counter() - self._start
+
+        click.echo("Profile:", err=True)
+        width = max(map(len, list(self.phases) + ['total']))
+        for name, seconds in self.phases.items():
+            click.echo(f"  {name:<{width}}  {seconds:.3f}s", err=True)
+        click.echo(f"  {'total':<{width}}  {total:.3f}s", err=True)
+        num_statements, seconds = self.sql.num_statements - self._sql_start[0], self.sql.seconds - self._sql_start[1]
+        click.echo(f"SQL: {num_statements} statements, {seconds:.3f}s in the database", err=True)
+        if self._profile:
+            self._profile.dump_stats(str(self.stats_path))
+            click.echo(f"cProfile stats of the command written to {self.stats_path}", err=True)
+
+
+def set_profiler(profiler: Optional[Profiler]):
+    global _profiler
+    _profiler = profiler
+
+
+def get_profiler() -> Optional[Profiler]:
+    return _profiler
+
+
+@contextmanager
+def phase(name: str):
+    """Accounts the time spent in the block to a phase (e.g. 'query' or 'render') when profiling with --profile."""
+    if _profiler is None:
+        yield
+    else:
+        with _profiler.phase(name):
+            yield
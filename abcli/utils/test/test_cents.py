@@ -0,0 +1,28 @@
+from decimal import Decimal
+
+import pytest
+
+from abcli.utils import cents
+from abcli.utils.cents import CentsSums, to_cents, from_cents
+
+
+def test_to_cents():
+    assert to_cents(Decimal('12.34')) == 1234
+    assert to_cents(-0.1) == -10
+    assert to_cents(3) == 300
+    assert to_cents('0.005') == 1
+    assert from_cents(-1234) == Decimal('-12.34')
+
+
+@pytest.mark.parametrize('with_numpy', [False, True])
+def test_cents_sums(monkeypatch, with_numpy):
+    if with_numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(cents, 'np', None)
+
+    sums = CentsSums([('A', 0.1)] * 1000 + [('B', Decimal('-2.50')), ('A', '0.05')])
+    sums.add_cents('C', 7)
+    assert sums.cents() == {'A': 10005, 'B': -250, 'C': 7}
+    assert sums.amounts() == {'A': Decimal('100.05'), 'B': Decimal('-2.50'), 'C': Decimal('0.07')}
+    assert CentsSums().cents() == {}
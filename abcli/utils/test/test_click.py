@@ -0,0 +1,52 @@
+import subprocess
+import sys
+
+import click
+from click.testing import CliRunner
+
+from abcli.utils.click import LazyGroup, error_exit_on_exception, ON_ERROR_META_KEY
+
+
+def test_lazy_group():
+    @click.group(cls=LazyGroup)
+    def root():
+        pass
+
+    root.add_lazy_command('account', 'abcli.commands.account', 'cli')
+    root.add_lazy_command('broken', 'abcli.no_such_module', 'cli')
+    assert 'account' not in root.commands
+    assert root.list_commands(None) == ['account', 'broken']
+
+    assert root.get_command(None, 'account').name == 'account'
+    assert 'account' in root.commands
+
+    res = CliRunner().invoke(root, ['broken'])
+    assert res.exit_code != 0
+    assert "No such command" in res.output
+
+
+def test_cli_imports_commands_lazily():
+    code = ("import sys\n"
+            "from click.testing import CliRunner\n"
+            "from abcli.main import cli\n"
+            "res = CliRunner().invoke(cli, ['csv', 'prep', '--help'])\n"
+            "assert res.exit_code == 0, res.output\n"
+            "print(sorted(name for name in sys.modules if name.split('.')[0] in ('pony', 'tabulate', 'yaml') "
+            "or name.startswith('abcli.commands.')))\n")
+    res = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, check=True, universal_newlines=True)
+    assert res.stdout.strip() == "['abcli.commands.csv', 'abcli.commands.csv.prep']"
+
+
+def test_error_exit_on_exception_on_error():
+    errors = []
+
+    @click.command()
+    @click.pass_context
+    @error_exit_on_exception
+    def cmd(ctx):
+        ctx.meta[ON_ERROR_META_KEY] = errors.append
+        raise ValueError("Failed")
+
+    res = CliRunner().invoke(cmd)
+    assert res.exit_code == 1
+    assert [str(error) for error in errors] == ["Failed"]
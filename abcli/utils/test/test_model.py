@@ -1,4 +1,4 @@
-from abcli.utils.model import AccountTree, format_monetary
+from abcli.utils.model import AccountTree, format_monetary, rollup_amounts
 
 
 def test_account_tree():
@@ -32,3 +32,26 @@ def test_account_tree_format():
         ("└── D", "($8.00)"),
         ("    └── E", "($5.00)")
     ]
+
+
+def test_rollup_amounts():
+    assert rollup_amounts({'A:B': 1, 'A:B:C': 2, 'A:D': 4, 'E': 8}) == {
+        'A': 7, 'A:B': 3, 'A:B:C': 2, 'A:D': 4, 'E': 8
+    }
+
+
+def test_account_tree_iter_format_tuples():
+    tree = AccountTree('A')
+    for name in ('A:B:C', 'A:B:D:E', 'A:F', 'A:B:D:G'):
+        tree.add(name, 1)
+
+    rows = tree.iter_format_tuples(callback=lambda tree: (tree.fullname, ), indent="> ")
+    assert next(rows) == ("> A", "A")
+    assert list(rows) == [
+        ("> ├── B", "A:B"),
+        ("> │   ├── C", "A:B:C"),
+        ("> │   └── D", "A:B:D"),
+        ("> │       ├── E", "A:B:D:E"),
+        ("> │       └── G", "A:B:D:G"),
+        ("> └── F", "A:F"),
+    ]
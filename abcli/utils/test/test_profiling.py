@@ -0,0 +1,67 @@
+import pstats
+import re
+from datetime import date
+
+from pony import orm
+
+from abcli.commands.test import setup_db, invoke_cmd
+from abcli.utils import profiling
+from abcli.utils.profiling import Profiler, track_sql, record_sql
+
+
+def test_profiler_nested_phases(monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(profiling.time, 'perf_counter', lambda: next(clock))
+
+    profiler = Profiler()                 # 0
+    with profiler.phase('query'):         # 1
+        with profiler.phase('render'):    # 2
+            pass                          # 3
+        with profiler.phase('query'):     # 4
+            pass                          # 5
+    assert profiler.phases == {'render': 1, 'query': 4}   # 6; time in nested phases only counts once
+
+
+def test_track_sql(tmp_path):
+    db, _ = setup_db(tmp_path)
+    counter = track_sql(db)
+    assert track_sql(db) is counter
+
+    with orm.db_session:
+        db.Account(name='Assets:Checking')
+    with orm.db_session:
+        assert orm.select(a.name for a in db.Account)[:] == ['Assets:Checking']
+    assert counter.num_statements >= 2
+    assert counter.seconds > 0
+
+    with record_sql(db) as statements:
+        with orm.db_session:
+            orm.select(a.name for a in db.Account)[:]
+    assert len(statements) == 1 and statements[0].startswith('SELECT')
+
+
+def test_profile_option(tmp_path, monkeypatch):
+    orm.set_sql_debug(False)
+    db, db_file = setup_db(tmp_path)
+    with orm.db_session:
+        checking, food = db.Account(name='Assets:Checking'), db.Account(name='Expenses:Food')
+        db.Transaction.from_posts([(checking, -10, date(2019, 1, 1), date(2019, 1, 2)),
+                                   (food, 10, date(2019, 1, 1), date(2019, 1, 2))])
+
+    stats_path = tmp_path / 'summary.pstats'
+    res = invoke_cmd(db_file, ['--profile-output', str(stats_path), 'transaction', 'summary', '-m', '01/2019'])
+    assert res.exit_code == 0, res.output
+    for name in ('config load', 'ORM mapping', 'query', 'render', 'total'):
+        assert re.search(rf"^  {name} +\d+\.\d{{3}}s$", res.output, re.MULTILINE), name
+    num_statements = int(re.search(r"^SQL: (\d+) statements, \d+\.\d{3}s in the database$", res.output,
+                                   re.MULTILINE).group(1))
+    assert num_statements > 0
+    assert pstats.Stats(str(stats_path)).total_calls > 0
+
+    # The database's connections are only wrapped when profiling
+    tracked = []
+    monkeypatch.setattr(profiling, '_TimedConnection', lambda connection, counter: tracked.append(connection))
+    res = invoke_cmd(db_file, ['transaction', 'summary', '-m', '01/2019'])
+    assert res.exit_code == 0, res.output
+    assert "Profile:" not in res.output
+    assert tracked == []
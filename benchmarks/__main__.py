@@ -0,0 +1,166 @@
+"""
+Benchmarks core commands against SQLite on synthetic ledgers (see `benchmarks.synthetic`), and saves the timings
+as JSON so that they can be compared between releases:
+
+    python -m benchmarks --size 10k --size 100k --output benchmark-0.8.1.json
+    python -m benchmarks --compare benchmark-0.8.0.json
+
+Each command is timed as a whole `python -m abcli` run, as a user would see it, taking the best of `--repeat` runs.
+"""
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime as DateTime
+from pathlib import Path
+from typing import *
+
+import click
+from tabulate import tabulate
+
+from abcli.utils import format_date
+from abcli.utils.click import PathType
+from benchmarks import synthetic
+
+REPO_ROOT = Path(__file__).parent.parent
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+COMMANDS = ['csv classify', 'transaction import', 'transaction summary', 'transaction show', 'budget progress']
+
+# Runs slower than this ratio of the compared run are flagged
+REGRESSION_RATIO = 1.1
+
+
+@click.command()
+@click.option('--size', '-s', 'sizes', type=click.Choice(list(SIZES)), multiple=True,
+              help="Number of posts of the ledger to benchmark on; can be given more than once. Default to 10k and 100k.")
+@click.option('--repeat', '-r', type=click.IntRange(min=1), default=3, help="Number of runs of each command.")
+@click.option('--seed', type=int, default=0, help="Seed of the synthetic ledgers.")
+@click.option('--output', '-o', 'output_path', type=PathType(dir_okay=False), default=None,
+              help="Path to write the results JSON to; default to benchmark-<version>.json.")
+@click.option('--compare', 'compare_path', type=PathType(dir_okay=False, exists=True), default=None,
+              help="Results JSON of an earlier run to compare with.")
+@click.option('--workdir', type=PathType(file_okay=False), default=None,
+              help="Directory to generate ledgers and databases in; default to a temporary directory.")
+def cli(sizes: Tuple[str], repeat: int, seed: int, output_path: Path, compare_path: Path, workdir: Path):
+    sizes = sizes or ('10k', '100k')
+    version = _version()
+    results = {
+        'version': version,
+        'date': DateTime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'repeat': repeat,
+        'sizes': {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix='abcli-benchmark-') as tmp_dir:
+        for size in sizes:
+            directory = (workdir or Path(tmp_dir)) / size
+            click.echo(f"Generating a ledger of {size} posts in {directory}...")
+            ledger = synthetic.write_ledger(directory, SIZES[size], seed)
+            timings = run_benchmarks(directory, ledger, repeat)
+            results['sizes'][size] = {'num_posts': ledger['num_posts'], 'num_rows': ledger['num_rows'],
+                                      'commands': timings}
+
+    output_path = output_path or Path(f"benchmark-{version}.json")
+    output_path.write_text(json.dumps(results, indent=2), encoding='utf-8')
+    click.echo(f"Results written to {output_path}.")
+
+    rows = [[size, command, f"{timing['best']:.3f}"] for size, result in results['sizes'].items()
+            for command, timing in result['commands'].items()]
+    headers = ['size', 'command', 'best (s)']
+    if compare_path:
+        previous = json.loads(compare_path.read_text('utf-8'))
+        headers += [f"{previous['version']} (s)", 'change']
+        for row in rows:
+            row.extend(_compare(previous, row[0], row[1], float(row[2])))
+    click.echo(tabulate(rows, headers=headers))
+
+
+def run_benchmarks(directory: Path, ledger: dict, repeat: int) -> Dict[str, dict]:
+    """
+    Times each of `COMMANDS` on the ledger written by `synthetic.write_ledger`; commands after `csv classify`
+    run on its classified CSVs, and the reports on the database imported by `transaction import`.
+    :return: timings of each command: 'times' of each run and the 'best' of them, in seconds
+    """
+    run_dir = directory / 'run'
+    db_file = run_dir / 'db.sqlite'
+    config_file = run_dir / 'config.json'
+    run_dir.mkdir(exist_ok=True)
+    config_file.write_text(json.dumps({'db': {'provider': 'sqlite', 'filename': str(db_file), 'create_db': True}}),
+                           encoding='utf-8')
+    csv_paths = [run_dir / path.name for path in ledger['csvs']]
+
+    # Benchmark the abcli of this checkout, whether or not it is installed
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get('PYTHONPATH')])))
+
+    def abcli(*args):
+        subprocess.run([sys.executable, '-m', 'abcli', '--config', str(config_file), *map(str, args)],
+                       check=True, stdout=subprocess.DEVNULL, env=env)
+
+    def copy_csvs():
+        for src, dst in zip(ledger['csvs'], csv_paths):
+            shutil.copyfile(src, dst)
+
+    def classify():
+        for path in csv_paths:
+            abcli('csv', 'classify', '--rulebook', ledger['rulebook'], '--no-cache', path)
+
+    def import_csvs():
+        for path in csv_paths:
+            abcli('transaction', 'import', path)
+
+    def remove_db():
+        if db_file.exists():
+            db_file.unlink()
+
+    period = ['--from', format_date(synthetic.DATE_FROM), '--to', format_date(synthetic.DATE_TO)]
+    timings = {
+        'csv classify': _time(classify, repeat, setup=copy_csvs),
+        'transaction import': _time(import_csvs, repeat, setup=remove_db),
+        'transaction summary': _time(lambda: abcli('transaction', 'summary', *period), repeat),
+        'transaction show': _time(lambda: abcli('transaction', 'show', *period), repeat),
+        'budget progress': _time(lambda: abcli('budget', 'progress', ledger['budget']), repeat),
+    }
+    for command, timing in timings.items():
+        click.echo(f"  {command}: {timing['best']:.3f}s")
+    return timings
+
+
+def _time(func: Callable, repeat: int, setup: Callable = None) -> dict:
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'times': times, 'best': min(times)}
+
+
+def _compare(previous: dict, size: str, command: str, best: float) -> List[str]:
+    timing = previous['sizes'].get(size, {}).get('commands', {}).get(command)
+    if not timing:
+        return ['', '']
+    ratio = best / timing['best']
+    change = f"{(ratio - 1) * 100:+.1f}%"
+    if ratio > REGRESSION_RATIO:
+        change += " (regression)"
+    return [f"{timing['best']:.3f}", change]
+
+
+def _version() -> str:
+    pyproject = REPO_ROOT / 'pyproject.toml'
+    for line in pyproject.read_text('utf-8').splitlines():
+        if line.startswith('version'):
+            return line.split('=', 1)[1].strip().strip('"')
+    return 'unknown'
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,242 @@
+"""
+Deterministic synthetic ledgers for benchmarking: bank CSVs in the `csv prep` FIELDS schema, a rulebook that
+classifies all of their rows, and a budget, generated from a seed so that every run benchmarks the same data.
+"""
+import csv
+import random
+from collections import defaultdict
+from datetime import date as Date, timedelta as TimeDelta
+from pathlib import Path
+from typing import *
+
+import yaml
+
+from abcli.commands.csv.prep import FIELDS
+from abcli.utils import format_date
+
+CHECKING = 'Assets:Bank:Northwind:Checking'
+SAVINGS = 'Assets:Bank:Northwind:Savings'
+CREDIT_CARD = 'Liabilities:CreditCard:Contoso'
+SALARY = 'Income:Salary:Initech'
+RENT = 'Expenses:Housing:Rent'
+RESTAURANT = 'Expenses:Food&Drink:Restaurant'
+LENT = 'Expenses:Misc:Lent'
+
+# (keyword, account, min amount, max amount, relative frequency)
+MERCHANTS = [
+    ('WOOLWORTHS', 'Expenses:Food&Drink:Groceries', 15, 220, 12),
+    ('COLES', 'Expenses:Food&Drink:Groceries', 15, 220, 10),
+    ('ALDI', 'Expenses:Food&Drink:Groceries', 10, 150, 6),
+    ('MCDONALDS', 'Expenses:Food&Drink:FastFood', 6, 25, 5),
+    ('UBER EATS', 'Expenses:Food&Drink:Takeaway', 18, 60, 5),
+    ('BEAN THERE CAFE', 'Expenses:Food&Drink:Coffee', 4, 12, 14),
+    ('DINNER AT', RESTAURANT, 30, 150, 3),
+    ('OPAL TRANSPORT', 'Expenses:Transport:PublicTransport', 3, 15, 12),
+    ('SHELL SERVICE STATION', 'Expenses:Transport:Fuel', 40, 110, 4),
+    ('UBER TRIP', 'Expenses:Transport:Rideshare', 9, 45, 4),
+    ('TELSTRA', 'Expenses:Bills&Utilities:Phone', 40, 90, 1),
+    ('AGL ENERGY', 'Expenses:Bills&Utilities:Electricity', 90, 320, 1),
+    ('SYDNEY WATER', 'Expenses:Bills&Utilities:Water', 60, 180, 1),
+    ('NETFLIX', 'Expenses:Entertainment:Streaming', 10, 20, 1),
+    ('SPOTIFY', 'Expenses:Entertainment:Streaming', 12, 12, 1),
+    ('HOYTS CINEMA', 'Expenses:Entertainment:Movies', 15, 45, 2),
+    ('CHEMIST WAREHOUSE', 'Expenses:Healthcare:Pharmacy', 8, 80, 3),
+    ('FITNESS FIRST', 'Expenses:Healthcare:Fitness', 20, 20, 2),
+    ('JB HI-FI', 'Expenses:Shopping:Electronics', 25, 900, 1),
+    ('KMART', 'Expenses:Shopping:Household', 5, 120, 4),
+    ('BUNNINGS WAREHOUSE', 'Expenses:Shopping:Hardware', 10, 250, 2),
+]
+SUBURBS = ['PARRAMATTA', 'CHATSWOOD', 'BONDI JUNCTION', 'NEWTOWN', 'HORNSBY', 'MANLY', 'PENRITH', 'RANDWICK']
+FRIENDS = ['ALEX NGUYEN', 'SAM TAYLOR', 'JORDAN LEE', 'CHRIS PATEL']
+
+# Recurring transactions of the checking account, matched by regexes: (regex, account)
+REGEX_RULES = [
+    (r'SALARY INITECH PTY LTD \d+', SALARY),
+    (r'RENT PAYMENT REF \d+', RENT),
+    (r'TRANSFER TO SAVINGS \d+', SAVINGS),
+    (r'PAYMENT TO CARD \d+', CREDIT_CARD),
+    (r'TRANSFER FROM .*', LENT),
+]
+
+DATE_FROM = Date(2015, 1, 1)
+DATE_TO = Date(2019, 12, 31)
+# Share of restaurant bills split with (and later paid back by) a friend
+SPLIT_RATE = 0.2
+
+
+def rulebook() -> dict:
+    """The rulebook classifying every generated row."""
+    keywords = {}
+    for keyword, account, *_ in MERCHANTS:
+        keywords.setdefault(keyword, account)
+    return {'keyword': keywords, 'regex': dict(REGEX_RULES)}
+
+
+def generate_rows(num_posts: int, seed: int = 0) -> Dict[str, List[dict]]:
+    """
+    Generates rows of the checking and credit card accounts (newest first, like bank exports), with `that_auto`
+    set to the account the rulebook should classify each into; the rows add up to about `num_posts` posts.
+    Salary, rent, savings and card payments recur every fortnight or month; purchases at merchants fill up the
+    rest, on the card or the checking account. Some restaurant bills are split with a friend who pays back
+    their share, joined by a ref.
+    :return: rows per operating account
+    """
+    rand = random.Random(seed)
+    num_days = (DATE_TO - DATE_FROM).days + 1
+    rows = {CHECKING: [], CREDIT_CARD: []}
+
+    def add(this: str, day: int, cents: int, description: str, that: str, resolve_days=0, **fields):
+        date_occurred = DATE_FROM + TimeDelta(days=day)
+        rows[this].append({
+            'date_occurred': date_occurred, 'date_resolved': min(date_occurred + TimeDelta(days=resolve_days), DATE_TO),
+            'amount': cents, 'description': description, 'this': this, 'that_auto': that,
+            'that_overwrite': fields.get('that_overwrite', ''), 'ref': fields.get('ref', ''),
+        })
+
+    # Recurring transactions take at most a quarter of the posts, so that small ledgers are mostly purchases
+    recurring = []
+    for day in range(0, num_days, 14):
+        recurring.append((day, 'salary'))
+    for month_start in _month_starts():
+        day = (month_start - DATE_FROM).days
+        recurring.extend([(day, 'rent'), (day + 1, 'savings'), (day + 20, 'card')])
+    recurring = [item for item in sorted(recurring) if item[0] < num_days][:num_posts // 8]
+
+    num_purchases = max(num_posts // 2 - len(recurring), 0)
+    weights = [merchant[4] for merchant in MERCHANTS]
+    num_split_posts = 0
+    card_spend = defaultdict(int)  # per month, paid off from the checking account the month after
+    total_spend = 0
+    idx = 0
+    while 2 * (len(recurring) + idx) + num_split_posts < num_posts and idx < num_purchases:
+        keyword, account, min_amount, max_amount, _ = rand.choices(MERCHANTS, weights)[0]
+        day = rand.randrange(num_days)
+        cents = -rand.randint(min_amount * 100, max_amount * 100)
+        description = f"{keyword} {rand.choice(SUBURBS)} {rand.randint(1000, 9999)}"
+        total_spend -= cents
+        idx += 1
+
+        if account == RESTAURANT and rand.random() < SPLIT_RATE:
+            # Two posts of the bill and a payback row merged with it on import
+            ref = f"@split{len(rows[CHECKING])}"
+            share = -cents // 2
+            split = {RESTAURANT: share / 100, LENT: (-cents - share) / 100}
+            add(CHECKING, day, cents, description, account, that_overwrite=repr(split), ref=ref)
+            payback_day = min(day + rand.randint(1, 10), num_days - 1)
+            add(CHECKING, payback_day, -cents - share, f"TRANSFER FROM {rand.choice(FRIENDS)}", LENT, ref=ref)
+            num_split_posts += 3
+        elif rand.random() < 0.7:
+            add(CREDIT_CARD, day, cents, description, account, resolve_days=rand.randint(0, 3))
+            card_spend[_month(DATE_FROM + TimeDelta(days=day))] -= cents
+        else:
+            add(CHECKING, day, cents, description, account, resolve_days=rand.randint(0, 2))
+
+    # Salary covers spending and savings, so balances stay plausible
+    num_salaries = sum(kind == 'salary' for _, kind in recurring) or 1
+    num_months = sum(kind == 'rent' for _, kind in recurring) or 1
+    rent = 2000_00
+    salary = (total_spend + num_months * (rent + 500_00)) // num_salaries
+    for day, kind in recurring:
+        number = rand.randint(100000, 999999)
+        if kind == 'salary':
+            add(CHECKING, day, salary, f"SALARY INITECH PTY LTD {number}", SALARY)
+        elif kind == 'rent':
+            add(CHECKING, day, -rent, f"RENT PAYMENT REF {number}", RENT)
+        elif kind == 'savings':
+            add(CHECKING, day, -500_00, f"TRANSFER TO SAVINGS {number}", SAVINGS)
+        elif kind == 'card':
+            previous_month = _month((DATE_FROM + TimeDelta(days=day)).replace(day=1) - TimeDelta(days=1))
+            if card_spend.get(previous_month):
+                add(CHECKING, day, -card_spend[previous_month], f"PAYMENT TO CARD {number}", CREDIT_CARD)
+
+    for account_rows in rows.values():
+        account_rows.sort(key=lambda row: (row['date_resolved'], row['date_occurred']), reverse=True)
+    return rows
+
+
+def budget(rows: Dict[str, List[dict]], year: int = DATE_TO.year) -> dict:
+    """
+    A budget for the year, of 5% more than was spent per expense category the year before
+    (parents are summed up from the categories by `budget progress`).
+    """
+    spent = defaultdict(int)
+    for account_rows in rows.values():
+        for row in account_rows:
+            if row['date_resolved'].year == year - 1 and row['that_auto'].startswith('Expenses:'):
+                spent[row['that_auto']] -= row['amount']
+
+    return {
+        'date_from': format_date(Date(year, 1, 1)),
+        'date_to': format_date(Date(year, 12, 31)),
+        'items': {account: round(cents * 1.05 / 100, -1) for account, cents in sorted(spent.items()) if cents > 0},
+    }
+
+
+def write_ledger(directory: Path, num_posts: int, seed: int = 0) -> Dict[str, Any]:
+    """
+    Writes a synthetic ledger of about `num_posts` posts into the directory: unclassified CSVs of the
+    operating accounts (for `csv classify`, then `transaction import`), `rulebook.yaml` and `budget.yaml`.
+    :return: paths of the files written ('csvs', 'rulebook', 'budget'), and the number of rows and posts
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    rows = generate_rows(num_posts, seed)
+
+    csv_paths = []
+    num_rows = num_generated_posts = 0
+    for account, account_rows in rows.items():
+        opening_balance = 5000_00 if account == CHECKING else 0
+        path = directory / f"{account.replace(':', '-').lower()}.csv"
+        with path.open('w', encoding='utf-8', newline='') as fp:
+            writer = csv.DictWriter(fp, FIELDS)
+            writer.writeheader()
+            writer.writerows(_iter_csv_rows(account_rows, opening_balance))
+        csv_paths.append(path)
+        num_rows += len(account_rows)
+        num_generated_posts += sum(3 if row['that_overwrite'] else 2 for row in account_rows)
+
+    rulebook_path = directory / 'rulebook.yaml'
+    rulebook_path.write_text(yaml.safe_dump(rulebook(), sort_keys=False), encoding='utf-8')
+    budget_path = directory / 'budget.yaml'
+    budget_path.write_text(yaml.safe_dump(budget(rows), sort_keys=False), encoding='utf-8')
+
+    return {'csvs': csv_paths, 'rulebook': rulebook_path, 'budget': budget_path,
+            'num_rows': num_rows, 'num_posts': num_generated_posts}
+
+
+def _iter_csv_rows(rows: List[dict], opening_balance: int) -> Iterator[dict]:
+    # Rows are newest first, so the running balance starts from the closing balance
+    balance = opening_balance + sum(row['amount'] for row in rows)
+    dates = {}
+    for row in rows:
+        date_occurred, date_resolved = row['date_occurred'], row['date_resolved']
+        if date_occurred not in dates:
+            dates[date_occurred] = format_date(date_occurred)
+        if date_resolved not in dates:
+            dates[date_resolved] = format_date(date_resolved)
+        yield {
+            'date_occurred': dates[date_occurred],
+            'date_resolved': dates[date_resolved],
+            'amount': _format_cents(row['amount']),
+            'description': row['description'],
+            'balance': _format_cents(balance),
+            'this': row['this'],
+            'that_auto': '',
+            'that_overwrite': row['that_overwrite'],
+            'ref': row['ref'],
+        }
+        balance -= row['amount']
+
+
+def _format_cents(cents: int) -> str:
+    return f"{'-' if cents < 0 else ''}{abs(cents) // 100}.{abs(cents) % 100:02d}"
+
+
+def _month_starts() -> Iterator[Date]:
+    month = DATE_FROM.replace(day=1)
+    while month <= DATE_TO:
+        yield month
+        month = (month + TimeDelta(days=32)).replace(day=1)
+
+
+def _month(date: Date) -> Tuple[int, int]:
+    return date.year, date.month
@@ -0,0 +1,44 @@
+import copy
+
+from pony import orm
+
+from abcli.commands.csv.classify import classify
+from abcli.commands.test import setup_db, invoke_cmd
+from benchmarks import synthetic
+
+
+def test_generate_rows_deterministic():
+    rows = synthetic.generate_rows(2000, seed=7)
+    assert rows == synthetic.generate_rows(2000, seed=7)
+    assert rows != synthetic.generate_rows(2000, seed=8)
+
+    num_posts = sum(3 if row['that_overwrite'] else 2 for account_rows in rows.values() for row in account_rows)
+    assert 1900 <= num_posts <= 2100
+
+
+def test_rulebook_classifies_all_rows():
+    rows = synthetic.generate_rows(5000)
+    for account_rows in rows.values():
+        expected = [row['that_auto'] for row in account_rows]
+        unclassified = [dict(copy.copy(row), that_auto='') for row in account_rows]
+        assert [row['that_auto'] for row in classify(unclassified, synthetic.rulebook())] == expected
+
+
+def test_write_ledger_imports(tmp_path):
+    orm.set_sql_debug(False)
+    ledger = synthetic.write_ledger(tmp_path / 'ledger', 1000)
+    db, db_file = setup_db(tmp_path)
+
+    for path in ledger['csvs']:
+        res = invoke_cmd(db_file, ['csv', 'classify', '--rulebook', str(ledger['rulebook']), '--no-cache', str(path)])
+        assert res.exit_code == 0, res.output
+        assert "(100%)" in res.output
+        res = invoke_cmd(db_file, ['transaction', 'import', str(path)])
+        assert res.exit_code == 0, res.output
+
+    with orm.db_session:
+        assert orm.count(p for p in db.Post) == ledger['num_posts']
+        assert orm.sum(p.amount for p in db.Post) == 0
+
+    res = invoke_cmd(db_file, ['budget', 'progress', str(ledger['budget'])])
+    assert res.exit_code == 0, res.output